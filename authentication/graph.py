@@ -0,0 +1,251 @@
+"""
+In-process cache of the follow graph.
+
+Each process keeps, for the users it has served recently, the ids of the
+users they follow and of their followers in sorted ``array('q')``: eight
+bytes per subscription, and a membership check is a binary search. The
+flux, the search, the event streams and the subscription form read these
+ids instead of querying ``UserFollows`` on every request.
+
+The entries are versioned like the post snippets (see
+``reviews.fragments``): each user has a random version token in the
+``settings.VERSION_CACHE`` cache, and all the users share a generation
+token. Creating or deleting a subscription replaces the tokens of its two
+users, and a bulk import, which bypasses the signals, replaces the
+generation. An entry loaded under other tokens is reloaded, in one query,
+so the processes see each other's changes as long as they share the
+cache backend.
+
+At most ``settings.FOLLOW_GRAPH_CACHE_SIZE`` users are kept per process,
+the least recently used being dropped first.
+"""
+
+import threading
+import uuid
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Q
+
+from .models import UserFollows
+
+KEY_PREFIX = 'authentication:graph'
+GENERATION_KEY = f'{KEY_PREFIX}:generation'
+
+
+class Entry:
+    """
+    Follow graph of one user.
+
+    Attributes:
+        version (tuple): The generation and user tokens it was loaded under.
+        followees (array): The sorted ids of the users they follow.
+        followers (array): The sorted ids of the users following them.
+    """
+
+    __slots__ = ('version', 'followees', 'followers')
+
+    def __init__(self, version, followees, followers):
+        self.version = version
+        self.followees = followees
+        self.followers = followers
+
+
+class FollowGraph:
+    """
+    Least recently used entries of the follow graph of a process.
+
+    Attributes:
+        size (int): The maximum number of users kept.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """
+        Returns the up-to-date follow graph of a user, loading it if needed.
+
+        Args:
+            user_id (int): The id of the user.
+
+        Returns:
+            Entry: The follow graph of the user.
+        """
+        version = current_version(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(user_id)
+                return entry
+        entry = load(user_id, version)
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        """Drops all the entries of the process."""
+        with self._lock:
+            self._entries.clear()
+
+
+graph = FollowGraph(settings.FOLLOW_GRAPH_CACHE_SIZE)
+
+
+def version_key(user_id):
+    """
+    Returns the cache key holding the version token of a user's graph.
+
+    Args:
+        user_id (int): The id of the user.
+
+    Returns:
+        str: The cache key.
+    """
+    return f'{KEY_PREFIX}:{user_id}'
+
+
+def version_cache():
+    """
+    Returns the cache holding the version tokens.
+    """
+    return caches[settings.VERSION_CACHE]
+
+
+def new_version():
+    """
+    Returns a new, unique version token.
+    """
+    return uuid.uuid4().hex
+
+
+def current_version(user_id):
+    """
+    Returns the tokens under which the graph of a user is currently valid.
+
+    Both tokens are read in one round trip to the cache; the missing ones
+    are created.
+
+    Args:
+        user_id (int): The id of the user.
+
+    Returns:
+        tuple: The generation token and the token of the user.
+    """
+    keys = [GENERATION_KEY, version_key(user_id)]
+    cache = version_cache()
+    versions = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return tuple(versions[key] for key in keys)
+
+
+def load(user_id, version):
+    """
+    Reads the follow graph of a user from the database.
+
+    The rows are read from the primary: an entry loaded from a lagging
+    replica would be kept under the new version.
+
+    Args:
+        user_id (int): The id of the user.
+        version (tuple): The tokens read before the rows.
+
+    Returns:
+        Entry: The follow graph of the user.
+    """
+    rows = (
+        UserFollows.objects.using(DEFAULT_DB_ALIAS)
+        .filter(Q(user_id=user_id) | Q(followed_user_id=user_id))
+        .values_list('user_id', 'followed_user_id')
+    )
+    followees, followers = [], []
+    for follower_id, followee_id in rows:
+        if follower_id == user_id:
+            followees.append(followee_id)
+        if followee_id == user_id:
+            followers.append(follower_id)
+    return Entry(
+        version, array('q', sorted(followees)), array('q', sorted(followers))
+    )
+
+
+def followees(user_id):
+    """
+    Returns the users followed by a user.
+
+    Args:
+        user_id (int): The id of the user.
+
+    Returns:
+        array: Their sorted ids.
+    """
+    return graph.get(user_id).followees
+
+
+def followers(user_id):
+    """
+    Returns the followers of a user.
+
+    Args:
+        user_id (int): The id of the user.
+
+    Returns:
+        array: Their sorted ids.
+    """
+    return graph.get(user_id).followers
+
+
+def is_following(user_id, followed_user_id):
+    """
+    Tells whether a user follows another one.
+
+    Args:
+        user_id (int): The id of the follower.
+        followed_user_id (int): The id of the followed user.
+
+    Returns:
+        bool: True if the subscription exists.
+    """
+    ids = followees(user_id)
+    index = bisect_left(ids, followed_user_id)
+    return index < len(ids) and ids[index] == followed_user_id
+
+
+def invalidate(user_id, followed_user_id):
+    """
+    Replaces the version tokens of the two users of a subscription.
+
+    The tokens are replaced at once, for the reads of the current
+    transaction, and again once it is committed, so that an entry loaded
+    by another process before the commit is not kept.
+
+    Args:
+        user_id (int): The id of the follower.
+        followed_user_id (int): The id of the followed user.
+    """
+    keys = [version_key(user_id), version_key(followed_user_id)]
+
+    def replace():
+        version_cache().set_many({key: new_version() for key in keys}, None)
+
+    replace()
+    transaction.on_commit(replace)
+
+
+def invalidate_all():
+    """
+    Replaces the generation token, invalidating the graph of every user.
+    """
+    version_cache().set(GENERATION_KEY, new_version(), None)
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:24
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def count_followers(apps, schema_editor):
+    User = apps.get_model("authentication", "User")
+    UserFollows = apps.get_model("authentication", "UserFollows")
+    follower_count = (
+        UserFollows.objects.filter(followed_user=OuterRef("pk"))
+        .values("followed_user")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    User.objects.filter(
+        pk__in=UserFollows.objects.values("followed_user")
+    ).update(follower_count=Subquery(follower_count))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="follower_count",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Number of users following this user."
+            ),
+        ),
+        migrations.RunPython(count_followers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0002_user_follower_count"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="userfollows",
+            index=models.Index(
+                fields=["followed_user", "user"], name="follows_followed_user_idx"
+            ),
+        ),
+    ]
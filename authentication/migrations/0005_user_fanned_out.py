@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def pull_popular_users(apps, schema_editor):
+    User = apps.get_model("authentication", "User")
+    User.objects.filter(
+        follower_count__gt=settings.FLUX_FANOUT_MAX_FOLLOWERS
+    ).update(fanned_out=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0004_follow_suggestions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="fanned_out",
+            field=models.BooleanField(
+                default=True,
+                help_text="False while the posts of this user are read on request.",
+            ),
+        ),
+        migrations.RunPython(pull_popular_users, migrations.RunPython.noop),
+    ]
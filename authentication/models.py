@@ -1,6 +1,14 @@
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
-from django.db.models import Model, ForeignKey, CASCADE
+from django.db.models import (
+    Model,
+    BooleanField,
+    FloatField,
+    ForeignKey,
+    Index,
+    PositiveIntegerField,
+    CASCADE,
+)
 
 
 class User(AbstractUser):
@@ -14,8 +22,19 @@ class User(AbstractUser):
 
     Attributes:
         username (str): The username of the user, stored in lowercase.
+        follower_count (int): The number of users following this user, kept up to date on follow and unfollow.
+        fanned_out (bool): Whether the posts of this user are copied into the timelines of their followers.
     """
 
+    follower_count = PositiveIntegerField(
+        default=0,
+        help_text="Number of users following this user.",
+    )
+    fanned_out = BooleanField(
+        default=True,
+        help_text="False while the posts of this user are read on request.",
+    )
+
     def save(self, *args, **kwargs):
         """
         Overrides the save method to ensure that the username is always stored in lowercase.
@@ -65,3 +84,51 @@ class UserFollows(Model):
             'user',
             'followed_user',
         )
+        indexes = [
+            Index(
+                fields=['followed_user', 'user'],
+                name='follows_followed_user_idx',
+            ),
+        ]
+
+
+class FollowSuggestion(Model):
+    """
+    Model class representing a user suggested to another one on the subscription page.
+
+    The suggestions are precomputed offline by the ``compute_follow_suggestions`` command, which replaces
+    all the suggestions of a user at once.
+
+    Attributes:
+        user (ForeignKey): The user the suggestion is made to.
+        suggested_user (ForeignKey): The suggested user.
+        score (float): The relevance of the suggestion, the highest first.
+        mutual_count (int): The number of users followed by the user who follow the suggested user.
+        shared_review_count (int): The number of tickets reviewed by both users.
+    """
+
+    user = ForeignKey(
+        to=settings.AUTH_USER_MODEL,
+        on_delete=CASCADE,
+        related_name='follow_suggestions',
+    )
+    suggested_user = ForeignKey(
+        to=settings.AUTH_USER_MODEL,
+        on_delete=CASCADE,
+        related_name='+',
+    )
+    score = FloatField()
+    mutual_count = PositiveIntegerField(default=0)
+    shared_review_count = PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (
+            'user',
+            'suggested_user',
+        )
+        indexes = [
+            Index(
+                fields=['user', '-score'],
+                name='suggestion_user_score_idx',
+            ),
+        ]
@@ -0,0 +1,66 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import graph
+from .models import User, UserFollows
+
+
+@receiver(post_save, sender=UserFollows)
+def count_new_follower(sender, instance, created, **kwargs):
+    """
+    Increments the follower count of the followed user when a subscription is created.
+
+    Args:
+        sender (class): The UserFollows model class.
+        instance (UserFollows): The saved subscription.
+        created (bool): True if the subscription has just been created.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    if created:
+        User.objects.filter(pk=instance.followed_user_id).update(
+            follower_count=F('follower_count') + 1
+        )
+
+
+@receiver(post_delete, sender=UserFollows)
+def count_lost_follower(sender, instance, **kwargs):
+    """
+    Decrements the follower count of the followed user when a subscription is deleted.
+
+    Args:
+        sender (class): The UserFollows model class.
+        instance (UserFollows): The deleted subscription.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    User.objects.filter(
+        pk=instance.followed_user_id, follower_count__gt=0
+    ).update(follower_count=F('follower_count') - 1)
+
+
+@receiver(post_save, sender=UserFollows)
+def invalidate_new_follow(sender, instance, created, **kwargs):
+    """
+    Invalidates the cached follow graph of the users of a new subscription.
+
+    Args:
+        sender (class): The UserFollows model class.
+        instance (UserFollows): The saved subscription.
+        created (bool): True if the subscription has just been created.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    if created:
+        graph.invalidate(instance.user_id, instance.followed_user_id)
+
+
+@receiver(post_delete, sender=UserFollows)
+def invalidate_lost_follow(sender, instance, **kwargs):
+    """
+    Invalidates the cached follow graph of the users of a deleted subscription.
+
+    Args:
+        sender (class): The UserFollows model class.
+        instance (UserFollows): The deleted subscription.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    graph.invalidate(instance.user_id, instance.followed_user_id)
@@ -0,0 +1,71 @@
+from unittest import skipUnless
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import FollowSuggestion, User, UserFollows
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite query plans')
+class SubscriptionQueryPlanTests(TestCase):
+    """
+    The subscriptions, subscribers and suggestions of the subscription page,
+    and the follow graph it loads, are read from indexes, without scanning a
+    table or sorting the rows.
+    """
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.reader = User.objects.create(username='reader')
+        for index in range(3):
+            user = User.objects.create(username=f'user{index}')
+            UserFollows.objects.create(user=self.reader, followed_user=user)
+            UserFollows.objects.create(user=user, followed_user=self.reader)
+            FollowSuggestion.objects.create(
+                user=self.reader, suggested_user=user, score=index
+            )
+        self.client.force_login(self.reader)
+
+    def query_plans(self):
+        """
+        Returns the SQLite query plans of the page reading the follow tables.
+
+        Returns:
+            dict: The details of the steps of each plan, by SQL query.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('subscriptions'))
+        self.assertEqual(response.status_code, 200)
+        plans = {}
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT') or not any(
+                    f'FROM "{table}"' in sql
+                    for table in (
+                        UserFollows._meta.db_table,
+                        FollowSuggestion._meta.db_table,
+                    )
+                ):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plans[sql] = [row[-1] for row in cursor.fetchall()]
+        return plans
+
+    def test_subscription_page(self):
+        plans = self.query_plans()
+        for sql, plan in plans.items():
+            with self.subTest(sql=sql, plan=plan):
+                self.assertFalse(any(step.startswith('SCAN') for step in plan))
+                self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+        steps = [step for plan in plans.values() for step in plan]
+        for index in (
+            'follows_followed_user_idx',
+            'suggestion_user_score_idx',
+        ):
+            with self.subTest(index=index):
+                self.assertTrue(any(index in step for step in steps))
@@ -3,8 +3,9 @@ from django.contrib.auth import authenticate, login, logout
 from django.shortcuts import render, redirect
 from django.views.generic import View
 
+from . import graph
 from .forms import SignupForm, LoginForm, SubscriptionForm
-from .models import User, UserFollows
+from .models import FollowSuggestion, User, UserFollows
 
 
 class SignupView(View):
@@ -134,10 +135,12 @@ class SubscriptionView(View):
     Attributes:
         template_name (str): The path to the template used for rendering the subscription page.
         form_class (class): The form class used for subscription input.
+        suggestions_displayed (int): The maximum number of follow suggestions displayed.
     """
 
     template_name = 'authentication/subscription.html'
     form_class = SubscriptionForm
+    suggestions_displayed = 5
 
     def get(self, request):
         """
@@ -148,20 +151,34 @@ class SubscriptionView(View):
 
         Returns:
         HttpResponse: The response containing the rendered subscription template with the subscription form,
-                      the current user, the subscriptions, and the list of subscribers.
+                      the current user, the subscriptions, the list of subscribers and the precomputed
+                      follow suggestions, minus the users already followed.
         """
         form = self.form_class()
         current_user = request.user
-        subscriptions = UserFollows.objects.filter(user=current_user)
+        subscriptions = UserFollows.objects.filter(
+            user=current_user
+        ).select_related('followed_user')
         subscribers = UserFollows.objects.filter(
             followed_user=current_user
         ).values_list('user__username', flat=True)
         subscribers = [subscriber.capitalize() for subscriber in subscribers]
+        suggestions = FollowSuggestion.objects.filter(
+            user=current_user, suggested_user__is_active=True
+        ).select_related('suggested_user')
+        suggestions = [
+            suggestion
+            for suggestion in suggestions.order_by('-score')
+            if not graph.is_following(
+                current_user.pk, suggestion.suggested_user_id
+            )
+        ][: self.suggestions_displayed]
         context = {
             'form': form,
             'current_user': current_user,
             'subscriptions': subscriptions,
             'subscribers': subscribers,
+            'suggestions': suggestions,
         }
         return render(
             request,
@@ -202,7 +219,12 @@ class SubscriptionView(View):
                 )
             for user in users:
                 if user.username == entry:
-                    if followed_user != request.user:
+                    if (
+                        followed_user != request.user
+                        and not graph.is_following(
+                            request.user.pk, followed_user.pk
+                        )
+                    ):
                         UserFollows.objects.create(
                             user=request.user, followed_user=followed_user
                         )
@@ -3,6 +3,11 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The real-time flux events (``reviews.events``) hold one connection per open
+flux page: serve the project with an ASGI server such as uvicorn or daphne
+(``uvicorn config.asgi:application``) so they are held by an event loop
+rather than by WSGI worker threads.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 """
@@ -0,0 +1,28 @@
+"""
+Tuning of the database connections.
+
+``set_sqlite_pragmas`` runs the ``settings.SQLITE_PRAGMAS`` on each new
+SQLite connection, to the primary as well as to the replicas. It is
+connected by ``config.apps.ProjectConfig``, so it applies to every app.
+"""
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def set_sqlite_pragmas(sender, connection, **kwargs):
+    """
+    Runs the ``settings.SQLITE_PRAGMAS`` on each new SQLite connection.
+
+    Args:
+        sender (class): The database wrapper class.
+        connection (BaseDatabaseWrapper): The new connection.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma}={value}')
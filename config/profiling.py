@@ -0,0 +1,392 @@
+"""
+Sampled profiling of the requests.
+
+``ProfilingMiddleware`` profiles a random share of the requests,
+``PROFILING_SAMPLE_RATE``, so that it can stay enabled in production. For
+each profiled request it measures the wall time, the number and duration
+of the SQL queries (through an execute wrapper installed on each database
+connection), the template rendering time (through the
+``ProfiledDjangoTemplates`` backend) and, for a smaller share of the
+requests, ``PROFILING_MEMORY_SAMPLE_RATE``, the peak of the memory
+allocated by Python while the request is handled. The profile of a
+request is held by a context variable, so the measures are attributed to
+the right request by threaded and asynchronous servers alike. Allocation
+tracing is process wide, though: the peak also counts the allocations of
+the requests handled concurrently, and only one request is traced at a
+time.
+
+The measures are sent back in a ``Server-Timing`` header, displayed by the
+network panel of the browsers, and kept in a rolling window of the last
+``PROFILING_WINDOW`` samples of each view, whose percentiles are served as
+JSON to the staff by ``ProfilingSummaryView``. Each process keeps its own
+window.
+
+The responses streamed to the client, such as the flux API and events,
+are only measured until the streaming starts.
+"""
+
+import os
+import random
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import JsonResponse
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import (
+    DjangoTemplates,
+    Template,
+    reraise,
+)
+from django.views.generic import View
+
+METRICS = ('wall_ms', 'sql_count', 'sql_ms', 'template_ms', 'peak_kib')
+PERCENTILES = (50, 90, 99)
+
+_current_profile = ContextVar('profile', default=None)
+_tracing_lock = threading.Lock()
+
+
+class Profile:
+    """
+    Measures of one request, collected while it is handled.
+
+    Attributes:
+        wall_time (float): The time spent handling the request, in seconds.
+        sql_count (int): The number of SQL queries.
+        sql_time (float): The time spent in the SQL queries, in seconds.
+        template_time (float): The time spent rendering templates, in seconds.
+        peak_memory (int | None): The peak of the memory allocated, in
+            bytes, if it has been traced.
+        rendering (bool): True while a template is rendered, so that the
+            templates rendered by another one are not counted twice.
+    """
+
+    def __init__(self):
+        self.wall_time = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.peak_memory = None
+        self.rendering = False
+
+    def sample(self):
+        """
+        Returns the measures in the units of the summary.
+
+        Returns:
+            dict: The measures, by name of ``METRICS``.
+        """
+        return {
+            'wall_ms': self.wall_time * 1000,
+            'sql_count': self.sql_count,
+            'sql_ms': self.sql_time * 1000,
+            'template_ms': self.template_time * 1000,
+            'peak_kib': (
+                self.peak_memory / 1024
+                if self.peak_memory is not None
+                else None
+            ),
+        }
+
+
+class ProfiledTemplate(Template):
+    """
+    Django template adding its rendering time to the current profile.
+    """
+
+    def render(self, context=None, request=None):
+        profile = _current_profile.get()
+        if profile is None or profile.rendering:
+            return super().render(context, request)
+        profile.rendering = True
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.template_time += time.perf_counter() - start
+            profile.rendering = False
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """
+    Django template backend whose templates are timed by the profiling.
+
+    Set as the ``BACKEND`` of the ``TEMPLATES`` setting in place of
+    ``django.template.backends.django.DjangoTemplates``.
+    """
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return ProfiledTemplate(
+                self.engine.get_template(template_name), self
+            )
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class ProfileStore:
+    """
+    Rolling windows of the measures of the profiled requests, by view.
+
+    Attributes:
+        window (int): The number of samples kept per view.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, view, sample):
+        """
+        Adds the measures of a request to the window of its view.
+
+        Args:
+            view (str): The HTTP method and the name of the view.
+            sample (dict): The measures, by name of ``METRICS``.
+        """
+        with self._lock:
+            samples = self._samples.get(view)
+            if samples is None:
+                samples = self._samples[view] = deque(maxlen=self.window)
+            samples.append(sample)
+
+    def summary(self):
+        """
+        Returns the percentiles of the measures of each view.
+
+        Returns:
+            dict: For each view, the number of samples and the percentiles
+            of each metric measured at least once.
+        """
+        with self._lock:
+            windows = {view: list(s) for view, s in self._samples.items()}
+        summary = {}
+        for view, samples in sorted(windows.items()):
+            summary[view] = {'samples': len(samples)}
+            for metric in METRICS:
+                values = sorted(
+                    sample[metric]
+                    for sample in samples
+                    if sample.get(metric) is not None
+                )
+                if values:
+                    summary[view][metric] = {
+                        **{
+                            f'p{rank}': round(percentile(values, rank), 3)
+                            for rank in PERCENTILES
+                        },
+                        'max': round(values[-1], 3),
+                    }
+        return summary
+
+    def clear(self):
+        """Drops all the samples."""
+        with self._lock:
+            self._samples.clear()
+
+
+store = ProfileStore(settings.PROFILING_WINDOW)
+
+
+def percentile(values, rank):
+    """
+    Returns a percentile of a list of values, by nearest rank.
+
+    Args:
+        values (list): The sorted values.
+        rank (int): The percentile, between 0 and 100.
+
+    Returns:
+        float: The value below which ``rank`` percent of the values fall.
+    """
+    index = max(0, -(-rank * len(values) // 100) - 1)
+    return values[index]
+
+
+def server_timing(sample):
+    """
+    Formats the measures of a request as a ``Server-Timing`` header.
+
+    Args:
+        sample (dict): The measures, by name of ``METRICS``.
+
+    Returns:
+        str: The value of the header.
+    """
+    metrics = [
+        f"total;dur={sample['wall_ms']:.1f}",
+        f"db;dur={sample['sql_ms']:.1f};desc=\"{sample['sql_count']} SQL\"",
+        f"tpl;dur={sample['template_ms']:.1f}",
+    ]
+    if sample['peak_kib'] is not None:
+        metrics.append(f"mem;desc=\"{sample['peak_kib']:.0f} KiB peak\"")
+    return ', '.join(metrics)
+
+
+@contextmanager
+def profiling():
+    """
+    Profiles the code run in the block, in this thread or task.
+
+    Yields:
+        Profile: The profile, complete once the block is exited.
+    """
+    profile = Profile()
+    trace_memory = (
+        random.random() < settings.PROFILING_MEMORY_SAMPLE_RATE
+        and not tracemalloc.is_tracing()
+        and _tracing_lock.acquire(blocking=False)
+    )
+    token = _current_profile.set(profile)
+    try:
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield profile
+        finally:
+            profile.wall_time = time.perf_counter() - start
+            if trace_memory:
+                profile.peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+    finally:
+        _current_profile.reset(token)
+        if trace_memory:
+            _tracing_lock.release()
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper adding each query to the current profile.
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.sql_time += time.perf_counter() - start
+        profile.sql_count += 1
+
+
+def install_query_timer(connection):
+    """
+    Installs the query timer on a database connection, once.
+
+    Args:
+        connection (BaseDatabaseWrapper): The connection.
+    """
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    """
+    Times the queries of each new database connection.
+
+    Args:
+        sender (class): The database wrapper class.
+        connection (BaseDatabaseWrapper): The new connection.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    install_query_timer(connection)
+
+
+class ProfilingMiddleware:
+    """
+    Middleware profiling a sample of the requests.
+
+    Place it first in ``MIDDLEWARE``, so that the time spent in the other
+    middleware is measured too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+        with profiling() as profile:
+            response = self.get_response(request)
+        return self.report(request, response, profile)
+
+    async def __acall__(self, request):
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return await self.get_response(request)
+        with profiling() as profile:
+            response = await self.get_response(request)
+        return self.report(request, response, profile)
+
+    def report(self, request, response, profile):
+        """
+        Records the measures of a request and adds them to its response.
+
+        Args:
+            request (HttpRequest): The profiled request.
+            response (HttpResponse): Its response.
+            profile (Profile): The measures of the request.
+
+        Returns:
+            HttpResponse: The response, with its ``Server-Timing`` header.
+        """
+        sample = profile.sample()
+        match = request.resolver_match
+        if match is not None and match.view_name != 'profiling':
+            store.record(f'{request.method} {match.view_name}', sample)
+        if settings.PROFILING_SERVER_TIMING:
+            response['Server-Timing'] = server_timing(sample)
+        return response
+
+
+class ProfilingSummaryView(View):
+    """
+    View class serving the percentiles of the profiled requests as JSON.
+
+    Only reachable by the staff (see ``config/urls.py``). The summary only
+    covers the requests handled by the process serving it.
+    """
+
+    def get(self, request):
+        """
+        Handles GET requests to the profiling summary.
+
+        Args:
+            request (HttpRequest): The HTTP request object.
+
+        Returns:
+            JsonResponse: The sampling settings and the percentiles of the
+                measures of each view.
+        """
+        return JsonResponse(
+            {
+                'pid': os.getpid(),
+                'sample_rate': settings.PROFILING_SAMPLE_RATE,
+                'memory_sample_rate': settings.PROFILING_MEMORY_SAMPLE_RATE,
+                'window': store.window,
+                'views': store.summary(),
+            }
+        )
@@ -0,0 +1,163 @@
+"""
+Routing of the read-only requests to the read replicas of the database.
+
+``settings.DATABASE_REPLICAS`` lists the aliases of the databases which
+replicate ``default``. Without replica, every query goes to ``default``.
+Otherwise ``ReplicaMiddleware`` picks one replica for each GET or HEAD
+request served by one of the ``settings.DATABASE_REPLICA_VIEWS``, and
+``ReplicaRouter`` sends the reads of this request to it. Everything else
+reads from the primary: the other views, the management commands, the
+background workers and the sessions.
+
+Writes always go to the primary. A request which writes is switched back
+to the primary for the rest of its reads, and so is its session during
+``settings.DATABASE_REPLICA_STICKINESS`` seconds, longer than the lag of
+the replicas: a user always reads their own writes, such as the ticket
+they have just created, while the others may see it a little later.
+
+The settings define a ``replica`` alias, a test mirror of ``default``
+which is only used once listed. For instance, with two local SQLite files,
+the replica being refreshed by
+``sqlite3 db.sqlite3 ".backup db_replica.sqlite3"``::
+
+    DATABASES['replica']['NAME'] = BASE_DIR / 'db_replica.sqlite3'
+    DATABASE_REPLICAS = ['replica']
+"""
+
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PINNED_UNTIL = '_replica_pinned_until'
+PRIMARY_APPS = {'sessions'}
+
+_routing = ContextVar('routing', default=None)
+
+
+class Routing:
+    """
+    Database routing state of a request.
+
+    Attributes:
+        replica (str | None): The alias of the replica serving the reads,
+            None to read from the primary.
+        wrote (bool): True once the request has written to the primary.
+    """
+
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+class ReplicaRouter:
+    """
+    Database router sending the reads of the read-only views to a replica.
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if (
+            routing is None
+            or routing.replica is None
+            or routing.wrote
+            or model._meta.app_label in PRIMARY_APPS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None and model._meta.app_label not in PRIMARY_APPS:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replicas receive their schema from the primary.
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaMiddleware:
+    """
+    Middleware choosing the database read by each request.
+
+    Place it after ``AuthenticationMiddleware``, which it relies on for the
+    session. The routing state is left in place once the response is
+    returned, so that the streamed responses read their rows from the same
+    database; the next request replaces it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        routing = Routing()
+        _routing.set(routing)
+        response = self.get_response(request)
+        self.pin(request, routing)
+        return response
+
+    async def __acall__(self, request):
+        routing = Routing()
+        _routing.set(routing)
+        response = await self.get_response(request)
+        self.pin(request, routing)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        routing = _routing.get()
+        if (
+            routing is not None
+            and settings.DATABASE_REPLICAS
+            and request.method in ('GET', 'HEAD')
+            and request.resolver_match.view_name
+            in settings.DATABASE_REPLICA_VIEWS
+            and not self.is_pinned(request)
+        ):
+            routing.replica = random.choice(settings.DATABASE_REPLICAS)
+
+    def is_pinned(self, request):
+        """
+        Tells whether the session has written recently.
+
+        Args:
+            request (HttpRequest): The HTTP request object.
+
+        Returns:
+            bool: True if the reads of the session must use the primary.
+        """
+        session = getattr(request, 'session', None)
+        return (
+            session is not None and session.get(PINNED_UNTIL, 0) > time.time()
+        )
+
+    def pin(self, request, routing):
+        """
+        Keeps the session on the primary for a while after a write.
+
+        Args:
+            request (HttpRequest): The HTTP request object.
+            routing (Routing): The routing state of the request.
+        """
+        session = getattr(request, 'session', None)
+        if routing.wrote and session is not None:
+            session[PINNED_UNTIL] = (
+                time.time() + settings.DATABASE_REPLICA_STICKINESS
+            )
@@ -27,17 +27,20 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "config.apps.ProjectConfig",
     "authentication.apps.AuthenticationConfig",
     "reviews.apps.ReviewsConfig",
     "reviews.templatetags.reviews_extras",
 ]
 
 MIDDLEWARE = [
+    "config.profiling.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "config.routers.ReplicaMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -46,7 +49,7 @@ ROOT_URLCONF = "config.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "config.profiling.ProfiledDjangoTemplates",
         "DIRS": [BASE_DIR / 'templates'],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -70,9 +73,55 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+    },
+    "replica": {  # Read replica, only used once listed in DATABASE_REPLICAS
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db.sqlite3",
+        "TEST": {"MIRROR": "default"},  # The tests read the test database
+    },
+}
+
+SQLITE_PRAGMAS = {}  # PRAGMA statements run on each new SQLite connection
+DATABASE_ROUTERS = ["config.routers.ReplicaRouter"]
+DATABASE_REPLICAS = []  # Aliases of the read replicas of the default database
+DATABASE_REPLICA_VIEWS = [  # Views whose GET requests read from a replica
+    'home',
+    'posts',
+    'search',
+    'subscriptions',
+    'api_flux',
+]
+DATABASE_REPLICA_STICKINESS = 10  # Seconds of primary reads after a write
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# Replace with a shared backend (Memcached, Redis) when running several
+# processes, so that they share the cached fragments and their versions.
+# The version tokens of the posts and of the follow graphs have their own
+# cache, so that the rendered snippets never evict them.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "litreview",
+        "OPTIONS": {
+            "MAX_ENTRIES": 10000,  # Rendered snippets, about 2 KB each
+        },
+    },
+    "versions": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "litreview-versions",
+        "OPTIONS": {
+            "MAX_ENTRIES": 200000,  # Version tokens, one per post and user
+        },
+    },
 }
 
+VERSION_CACHE = "versions"  # Cache alias holding the version tokens
+FRAGMENT_CACHE_TIMEOUT = 60 * 60  # Lifetime of the cached post snippets
+FOLLOW_GRAPH_CACHE_SIZE = 10000  # Users whose follow graph a process keeps
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -120,3 +169,24 @@ LOGOUT_REDIRECT_URL = LOGIN_URL  # Redirect URL after successful logout
 
 MEDIA_URL = '/media/'  # Basic URL for media files
 MEDIA_ROOT = BASE_DIR / 'media/'  # Répertoire des fichiers média
+
+FLUX_TIMELINE = False  # Read the flux from per-user timelines filled on write
+FLUX_FANOUT_MAX_FOLLOWERS = 1000  # Above, posts are read on request instead
+
+TICKET_IMAGE_WORKERS = 2  # Threads resizing images, 0 to use process_images
+TICKET_IMAGE_GC_GRACE = 60 * 60  # Seconds a reused image is kept unreferenced
+
+FEED_API_DEFAULT_LIMIT = 100  # Posts streamed by the flux API by default
+FEED_API_MAX_LIMIT = 100000  # Posts streamed by the flux API at most
+
+FLUX_BROKER = 'reviews.broker.InProcessBroker'  # Pub/sub of the flux events
+FLUX_EVENTS_KEEPALIVE = 15  # Seconds between two keepalive comments
+FLUX_POLL_INTERVAL = 60  # Seconds between two checks for new posts (WSGI)
+
+PROFILING_SAMPLE_RATE = 0.05  # Share of the requests profiled
+PROFILING_MEMORY_SAMPLE_RATE = 0.01  # Share with traced memory allocations
+PROFILING_WINDOW = 1000  # Profiled requests kept per view for percentiles
+PROFILING_SERVER_TIMING = True  # Send the measures in Server-Timing headers
+
+FOLLOW_SUGGESTIONS_COUNT = 20  # Follow suggestions precomputed per user
+FOLLOW_SUGGESTIONS_MAX_REVIEWERS = 100  # Above, a ticket is no taste signal
@@ -0,0 +1,71 @@
+"""
+Production settings of the project, for the SQLite database.
+
+Extends ``config.settings``: select it with
+``DJANGO_SETTINGS_MODULE=config.settings_production``.
+
+The database is tuned for concurrent requests:
+
+- The write-ahead log (WAL) lets the flux be read while tickets and
+  reviews are written, instead of blocking the readers during each write.
+  With WAL, ``synchronous=NORMAL`` is still safe against corruption and
+  only syncs the log at checkpoints.
+- Each connection caches 64 MiB of pages and maps the first 256 MiB of
+  the database in memory, so hot pages are read without system calls.
+- The pragmas are run by a ``connection_created`` handler (see
+  ``config.db``), on the connections to the replicas too.
+- Writing transactions start with ``BEGIN IMMEDIATE``: they take the write
+  lock up front and wait for it up to the busy timeout, rather than
+  failing with "database is locked" when a read transaction has to be
+  upgraded to a write one. The ``transaction_mode`` option needs Django
+  5.1, as required by the Pipfile.
+- Connections are kept open between the requests of a thread, which saves
+  opening the file and running the pragmas on each request.
+
+The secret key is read from the ``DJANGO_SECRET_KEY`` environment variable,
+without which the settings cannot be loaded.
+
+``python manage.py benchmark --concurrency`` measures the reads of the flux
+during concurrent writes; run it with each settings module to compare.
+"""
+
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from config.settings import *  # noqa: F401,F403
+from config.settings import DATABASES
+
+DEBUG = False
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured(
+        "Set the DJANGO_SECRET_KEY environment variable."
+    )
+
+ALLOWED_HOSTS = [
+    host
+    for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',')
+    if host
+]
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',  # Readers do not block writers, nor the reverse
+    'synchronous': 'NORMAL',  # Sync the WAL at checkpoints only
+    'cache_size': -64000,  # Page cache per connection, in KiB when negative
+    'mmap_size': 256 * 1024 * 1024,  # Bytes of the database mapped in memory
+    'temp_store': 'MEMORY',  # Temporary tables and indexes in memory
+}
+
+DATABASES['default'] = {
+    **DATABASES['default'],
+    'OPTIONS': {
+        'transaction_mode': 'IMMEDIATE',  # Take the write lock on BEGIN
+        'timeout': 20,  # Seconds to wait for a lock before failing
+    },
+    # Seconds a connection is reused, 0 when served by an ASGI server,
+    # whose requests do not reuse their threads.
+    'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 600)),
+    'CONN_HEALTH_CHECKS': True,  # Reconnect if a reused connection is broken
+}
@@ -1,9 +1,18 @@
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
 from django.urls import path, include
 
+from config.profiling import ProfilingSummaryView
+
 urlpatterns = [
+    # Percentiles of the profiled requests, for the staff
+    path(
+        "admin/profiling/",
+        staff_member_required(ProfilingSummaryView.as_view()),
+        name='profiling',
+    ),
     # URL to access the administration interface
     path("admin/", admin.site.urls),
     # Inclusion of "reviews" application URLs
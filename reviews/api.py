@@ -0,0 +1,186 @@
+"""
+Read-only JSON API of the flux.
+
+The flux is streamed as NDJSON (one JSON object per line) so programmatic
+clients can read it without rendering any template. The posts are read
+through database cursors and written as they come, so a large history is
+served with a constant memory footprint. Under an ASGI server, the stream
+is turned into an asynchronous iterator reading ``CHUNK_SIZE`` posts at a
+time in the thread of the request, as Django would otherwise read a
+synchronous stream whole before sending it.
+
+Query parameters:
+    after: The cursor of the last post already read (see ``flux``).
+    limit: The maximum number of posts, ``FEED_API_DEFAULT_LIMIT`` by
+        default, at most ``FEED_API_MAX_LIMIT``.
+    fields: A comma separated list of the fields to return (sparse
+        fieldset). ``type``, ``id`` and ``cursor`` are always returned.
+
+A malformed cursor or limit is answered with a 400 Bad Request.
+"""
+
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.http import StreamingHttpResponse
+from django.views.generic import View
+
+from . import events, flux
+
+ALWAYS_INCLUDED = ('type', 'id', 'cursor')
+CHUNK_SIZE = 100
+
+
+def serialize(post):
+    """
+    Returns the JSON compatible representation of a post.
+
+    Args:
+        post (Ticket | Review): A post annotated with its content type.
+
+    Returns:
+        dict: The fields of the post.
+    """
+    data = {
+        'type': post.content_type,
+        'id': post.id,
+        'cursor': flux.encode_cursor(post),
+        'time_created': post.time_created.isoformat(),
+        'user': post.user.username,
+    }
+    if post.content_type == flux.TICKET:
+        data['title'] = post.title
+        data['description'] = post.description
+        image = post.image and not post.image_failed
+        data['image'] = post.image.url if image else None
+        data['review_count'] = post.review_count
+        data['average_rating'] = post.average_rating
+        data['ratings'] = {
+            str(rating): getattr(post, f'rating_{rating}')
+            for rating in post.RATINGS
+        }
+    else:
+        data['ticket'] = post.ticket_id
+        data['headline'] = post.headline
+        data['rating'] = post.rating
+        data['body'] = post.body
+        data['word_count'] = post.word_count
+        data['reading_time'] = post.reading_time
+    return data
+
+
+def parse_fields(value):
+    """
+    Parses the sparse fieldset requested by a client.
+
+    Args:
+        value (str | None): The ``fields`` query parameter.
+
+    Returns:
+        set | None: The requested field names, or None for all the fields.
+    """
+    if not value:
+        return None
+    return {field.strip() for field in value.split(',')}.union(ALWAYS_INCLUDED)
+
+
+def parse_limit(value):
+    """
+    Parses the number of posts requested by a client.
+
+    Args:
+        value (str | None): The ``limit`` query parameter.
+
+    Returns:
+        int: The limit, bounded by ``settings.FEED_API_MAX_LIMIT``.
+
+    Raises:
+        BadRequest: If the limit is not a positive integer.
+    """
+    if not value:
+        return settings.FEED_API_DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise BadRequest(f'Invalid limit: {value!r}')
+    return min(limit, settings.FEED_API_MAX_LIMIT)
+
+
+def to_ndjson(posts, fields=None):
+    """
+    Encodes posts as NDJSON lines.
+
+    Args:
+        posts (iterable): The posts annotated with their content type.
+        fields (set | None): The fields to keep, or None for all.
+
+    Yields:
+        str: One JSON document per post, terminated by a newline.
+    """
+    for post in posts:
+        data = serialize(post)
+        if fields is not None:
+            data = {key: data[key] for key in data if key in fields}
+        yield json.dumps(data, ensure_ascii=False) + '\n'
+
+
+async def iter_async(lines, chunk_size=CHUNK_SIZE):
+    """
+    Iterates asynchronously over a synchronous stream of lines.
+
+    The lines are read ``chunk_size`` at a time in the thread which runs
+    the synchronous code of the request, and so owns its database
+    connection, without blocking the event loop.
+
+    Args:
+        lines (iterator): The synchronous stream, such as ``to_ndjson``.
+        chunk_size (int): The number of lines read per thread switch.
+
+    Yields:
+        str: The lines of each chunk, concatenated.
+    """
+    read = sync_to_async(lambda: list(islice(lines, chunk_size)))
+    try:
+        while chunk := await read():
+            yield ''.join(chunk)
+    finally:
+        await sync_to_async(lines.close)()
+
+
+class FluxFeedView(View):
+    """
+    View class streaming the user's flux as NDJSON.
+
+    This class returns the same merged stream of tickets and reviews as the flux page,
+    one JSON document per line, starting after the optional cursor.
+    """
+
+    def get(self, request):
+        """
+        Handles GET requests to the flux feed.
+
+        Args:
+            request (HttpRequest): The HTTP request object.
+
+        Returns:
+            StreamingHttpResponse: The NDJSON stream of the posts.
+
+        Raises:
+            BadRequest: If the cursor or the limit is malformed.
+        """
+        posts = flux.iter_flux(
+            request.user,
+            cursor=request.GET.get('after'),
+            limit=parse_limit(request.GET.get('limit')),
+        )
+        lines = to_ndjson(posts, parse_fields(request.GET.get('fields')))
+        if events.is_asgi(request):
+            lines = iter_async(lines, CHUNK_SIZE)
+        return StreamingHttpResponse(
+            lines, content_type='application/x-ndjson'
+        )
@@ -0,0 +1,685 @@
+"""
+Reproducible benchmark of the hot views on synthetic data.
+
+``generate`` fills the database with a deterministic data set for a given
+scale and seed: users whose follow graph has a power-law degree
+distribution (a few authors are followed by many users, most by a few),
+tickets written mostly by the prolific authors, a share of them with a
+cover image, and reviews concentrated on the popular tickets. The rows go
+through ``transfer.import_chunks``, the bulk import path, and the derived
+data is rebuilt afterwards, as after a real import.
+
+``run`` then requests each scenario of ``SCENARIOS`` with the Django test
+client, as users taken at several quantiles of the number of followed
+users, and reports for each scenario the latency percentiles, the number
+of queries per request and the peak memory allocated by a request. The
+latencies are timed without any instrumentation; the queries and memory
+are measured by a separate, instrumented pass. ``run_concurrent`` measures
+the flux reads while other threads keep writing, which compares the
+database settings (see ``config/settings_production.py``) under lock
+contention.
+
+The results are plain dicts, written as JSON by the ``benchmark``
+management command, so that runs made on different commits are compared
+with ``compare``.
+"""
+
+import datetime
+import hashlib
+import io
+import random
+import statistics
+import time
+import tracemalloc
+import threading
+from itertools import count, cycle
+
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from authentication.models import User, UserFollows
+
+from . import images, transfer
+from .models import Review, Ticket
+from .storage import ticket_image_storage
+
+SCALES = {
+    'small': {'users': 200, 'follows': 10, 'tickets': 2000, 'reviews': 4000},
+    'medium': {
+        'users': 2000,
+        'follows': 20,
+        'tickets': 20000,
+        'reviews': 50000,
+    },
+    'large': {
+        'users': 10000,
+        'follows': 30,
+        'tickets': 200000,
+        'reviews': 500000,
+    },
+}
+
+POWER_LAW_EXPONENT = 1.1
+IMAGE_SHARE = 0.3
+IMAGE_POOL_SIZE = 12
+USER_QUANTILES = (0.5, 0.9, 0.99)
+PERCENTILES = (50, 90, 99)
+# Compared metrics: name, keys leading to the value, True if higher is better.
+COMPARED_METRICS = (
+    ('p50_ms', ('latency_ms', 'p50'), False),
+    ('p90_ms', ('latency_ms', 'p90'), False),
+    ('queries', ('queries', 'mean'), False),
+    ('memory_kib', ('peak_memory_kib',), False),
+)
+COMPARED_CONCURRENCY_METRICS = (
+    ('read_rps', ('reads', 'throughput_rps'), True),
+    ('read_p99_ms', ('reads', 'latency_ms', 'p99'), False),
+    ('read_errors', ('reads', 'errors'), False),
+    ('write_rps', ('writes', 'throughput_rps'), True),
+    ('write_errors', ('writes', 'errors'), False),
+)
+START_DATE = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+WORDS = (
+    'livre roman histoire guerre paix amour nuit jour mer terre ciel '
+    'voyage secret maison jardin ville enfant reine roi chemin ombre '
+    'lumière temps mémoire silence feu eau vent montagne forêt étoile '
+    'python django code données réseau algorithme projet équipe'
+).split()
+
+
+def zipf_weights(count, exponent=POWER_LAW_EXPONENT):
+    """
+    Returns the cumulative weights of a Zipf distribution over ranks.
+
+    Args:
+        count (int): The number of ranks.
+        exponent (float): The exponent of the power law.
+
+    Returns:
+        list: The cumulative weights, for ``random.choices``.
+    """
+    weights, total = [], 0.0
+    for rank in range(1, count + 1):
+        total += rank**-exponent
+        weights.append(total)
+    return weights
+
+
+def sentence(rng, min_words, max_words):
+    """
+    Returns a random sentence made of the benchmark vocabulary.
+
+    Args:
+        rng (Random): The random generator.
+        min_words (int): The minimum number of words.
+        max_words (int): The maximum number of words.
+
+    Returns:
+        str: The sentence.
+    """
+    count = rng.randint(min_words, max_words)
+    return ' '.join(rng.choices(WORDS, k=count))
+
+
+def cover(index):
+    """
+    Renders the synthetic cover image of the image pool.
+
+    Args:
+        index (int): The position of the image in the pool.
+
+    Returns:
+        bytes: A JPEG image, larger than ``Ticket.IMAGE_MAX_SIZE``.
+    """
+    color = ((index * 67) % 256, (index * 131) % 256, (index * 29) % 256)
+    image = Image.new('RGB', (600, 900), color)
+    image.paste((255 - color[0], 128, color[2]), (100, 150, 500, 750))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def unique_title(key):
+    """
+    Returns a title sharing no book with the data set nor the other titles.
+
+    Args:
+        key (str): The key identifying the request.
+
+    Returns:
+        str: Three words of random looking letters and digits.
+    """
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    return ' '.join(digest[start : start + 8] for start in (0, 8, 16))
+
+
+def store_covers():
+    """
+    Stores the images of the pool in the ticket image storage.
+
+    Returns:
+        list: The names of the stored images.
+    """
+    return [
+        ticket_image_storage.save(
+            f'cover{index}.jpg', ContentFile(cover(index))
+        )
+        for index in range(IMAGE_POOL_SIZE)
+    ]
+
+
+def synthetic_rows(scale, seed=0):
+    """
+    Yields the rows of the synthetic data set, in dependency order.
+
+    Args:
+        scale (dict): The sizes of the data set, as in ``SCALES``.
+        seed (int): The seed of the random generator.
+
+    Yields:
+        tuple: The name of the dataset of each row and its columns, as
+        expected by ``transfer.import_chunks``.
+    """
+    rng = random.Random(seed)
+    user_ids = range(1, scale['users'] + 1)
+    for user_id in user_ids:
+        yield 'user', {
+            'id': user_id,
+            'username': f'user{user_id}',
+            'password': '!',
+            'date_joined': START_DATE.isoformat(),
+        }
+    # Popularity and activity follow power laws over shuffled ranks.
+    popular = rng.sample(user_ids, len(user_ids))
+    prolific = rng.sample(user_ids, len(user_ids))
+    user_weights = zipf_weights(len(user_ids))
+    image_names = store_covers()
+    for ticket_id in range(1, scale['tickets'] + 1):
+        has_image = rng.random() < IMAGE_SHARE
+        yield 'ticket', {
+            'id': ticket_id,
+            'user': rng.choices(prolific, cum_weights=user_weights)[0],
+            'title': f"{sentence(rng, 2, 6)} {ticket_id}",
+            'description': sentence(rng, 0, 60),
+            'image': rng.choice(image_names) if has_image else '',
+            'time_created': (
+                START_DATE + datetime.timedelta(minutes=ticket_id)
+            ).isoformat(),
+        }
+    ticket_rate = scale['tickets'] / max(1, scale['reviews'])
+    ticket_weights = zipf_weights(scale['tickets'])
+    tickets = rng.sample(range(1, scale['tickets'] + 1), scale['tickets'])
+    for review_id in range(1, scale['reviews'] + 1):
+        yield 'review', {
+            'id': review_id,
+            'ticket': rng.choices(tickets, cum_weights=ticket_weights)[0],
+            'user': rng.choices(prolific, cum_weights=user_weights)[0],
+            'rating': rng.randint(0, 5),
+            'headline': sentence(rng, 2, 8),
+            'body': sentence(rng, 0, 400),
+            'time_created': (
+                START_DATE
+                + datetime.timedelta(minutes=review_id * ticket_rate)
+            ).isoformat(),
+        }
+    for user_id in user_ids:
+        # The mean of a Pareto distribution of shape 2 is 2.
+        degree = int(scale['follows'] / 2 * rng.paretovariate(2))
+        degree = min(degree, len(user_ids) - 1)
+        followed = set(
+            rng.choices(popular, cum_weights=user_weights, k=degree)
+        )
+        followed.discard(user_id)
+        for followed_user_id in sorted(followed):
+            yield 'follow', {
+                'user': user_id,
+                'followed_user': followed_user_id,
+            }
+
+
+def process_images():
+    """
+    Processes the pending ticket images, once per distinct image.
+
+    The resized image and the variants computed for the first ticket of
+    each image are copied to the other tickets sharing the file.
+    """
+    names = (
+        images.pending().order_by().values_list('image', flat=True).distinct()
+    )
+    for name in list(names):
+        ticket = images.pending().filter(image=name).first()
+        images.process(ticket.pk)
+        ticket.refresh_from_db()
+        images.pending().filter(image=name).update(
+            image=ticket.image.name,
+            image_ready=ticket.image_ready,
+            image_failed=ticket.image_failed,
+            image_variants=ticket.image_variants,
+        )
+
+
+def generate(scale, seed=0):
+    """
+    Fills the database with the synthetic data set of a scale.
+
+    Args:
+        scale (dict): The sizes of the data set, as in ``SCALES``.
+        seed (int): The seed of the random generator.
+
+    Returns:
+        dict: The number of rows of each table.
+    """
+    for _ in transfer.import_chunks(synthetic_rows(scale, seed)):
+        pass
+    for _ in transfer.rebuild_derived():
+        pass
+    process_images()
+    return {
+        'users': User.objects.count(),
+        'follows': UserFollows.objects.count(),
+        'tickets': Ticket.objects.count(),
+        'reviews': Review.objects.count(),
+    }
+
+
+def benchmark_users():
+    """
+    Returns the users requesting the pages, by number of followed users.
+
+    Returns:
+        list: The users at each quantile of ``USER_QUANTILES``.
+    """
+    users = list(User.objects.order_by('id'))
+    follows = dict.fromkeys((user.pk for user in users), 0)
+    for user_id in UserFollows.objects.values_list('user', flat=True):
+        follows[user_id] += 1
+    users.sort(key=lambda user: (follows[user.pk], user.pk))
+    return [
+        users[int(quantile * (len(users) - 1))] for quantile in USER_QUANTILES
+    ]
+
+
+class Scenario:
+    """
+    A request to benchmark.
+
+    Attributes:
+        name (str): The name of the scenario in the results.
+        method (str): 'get' or 'post'.
+        url_name (str): The name of the URL pattern of the view.
+    """
+
+    def __init__(self, name, method, url_name):
+        self.name = name
+        self.method = method
+        self.url_name = url_name
+
+    def data(self, iteration):
+        """
+        Returns the data posted by one request.
+
+        Args:
+            iteration (int): The number of the request, making the posted
+                titles unique.
+
+        Returns:
+            dict | None: The form data, None for GET requests.
+        """
+        return None
+
+    def request(self, client, iteration):
+        """
+        Sends one request of the scenario.
+
+        Args:
+            client (Client): The client, logged in as the requesting user.
+            iteration (int): The number of the request.
+
+        Returns:
+            HttpResponse: The response.
+        """
+        send = getattr(client, self.method)
+        data = self.data(iteration)
+        if data is None:
+            return send(reverse(self.url_name))
+        return send(reverse(self.url_name), data)
+
+
+class CreateTicketScenario(Scenario):
+    """
+    Posts a new ticket, with a cover from the image pool every other time.
+    """
+
+    def data(self, iteration):
+        data = {
+            'title': unique_title(f'{self.name} {iteration}'),
+            'description': ' '.join(WORDS[:20]),
+        }
+        if iteration % 2:
+            data['image'] = SimpleUploadedFile(
+                'cover.jpg',
+                cover(iteration % IMAGE_POOL_SIZE),
+                content_type='image/jpeg',
+            )
+        return data
+
+
+class CreateReviewScenario(Scenario):
+    """
+    Posts a new review along with its new ticket.
+    """
+
+    def data(self, iteration):
+        return {
+            'title': unique_title(f'{self.name} {iteration}'),
+            'description': '',
+            'headline': 'benchmark review',
+            'rating': iteration % 6,
+            'body': ' '.join(WORDS),
+        }
+
+
+SCENARIOS = (
+    Scenario('flux', 'get', 'home'),
+    Scenario('posts', 'get', 'posts'),
+    Scenario('subscriptions', 'get', 'subscriptions'),
+    Scenario('create_ticket_form', 'get', 'create_ticket'),
+    CreateTicketScenario('create_ticket', 'post', 'create_ticket'),
+    Scenario('create_review_form', 'get', 'create_review'),
+    CreateReviewScenario('create_review', 'post', 'create_review'),
+)
+
+
+def percentile(values, rank):
+    """
+    Returns a percentile of a list of values, by nearest rank.
+
+    Args:
+        values (list): The sorted values.
+        rank (int): The percentile, between 0 and 100.
+
+    Returns:
+        float: The value below which ``rank`` percent of the values fall.
+    """
+    index = max(0, -(-rank * len(values) // 100) - 1)
+    return values[index]
+
+
+def summarize(latencies):
+    """
+    Returns the mean, percentiles and maximum of request latencies.
+
+    Args:
+        latencies (list): The latencies, in milliseconds.
+
+    Returns:
+        dict: The statistics, None for an empty list.
+    """
+    if not latencies:
+        return None
+    latencies = sorted(latencies)
+    return {
+        'mean': round(statistics.fmean(latencies), 3),
+        **{
+            f'p{rank}': round(percentile(latencies, rank), 3)
+            for rank in PERCENTILES
+        },
+        'max': round(latencies[-1], 3),
+    }
+
+
+def measure(scenario, clients, requests, warmup, profiled):
+    """
+    Benchmarks one scenario.
+
+    Args:
+        scenario (Scenario): The scenario to run.
+        clients (list): The logged in clients, used in turn.
+        requests (int): The number of timed requests.
+        warmup (int): The number of untimed requests sent first.
+        profiled (int): The number of requests of the instrumented pass.
+
+    Returns:
+        dict: The latency percentiles in milliseconds, the queries per
+        request, the peak memory in KiB and the response status codes.
+    """
+    iterations = iter(range(10**9))
+    clients = cycle(clients)
+    for _ in range(warmup):
+        scenario.request(next(clients), next(iterations))
+    latencies, status_codes = [], {}
+    for _ in range(requests):
+        client, iteration = next(clients), next(iterations)
+        start = time.perf_counter()
+        response = scenario.request(client, iteration)
+        latencies.append((time.perf_counter() - start) * 1000)
+        status_codes[response.status_code] = (
+            status_codes.get(response.status_code, 0) + 1
+        )
+    queries, peaks = [], []
+    for _ in range(profiled):
+        client, iteration = next(clients), next(iterations)
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as context:
+            scenario.request(client, iteration)
+        peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+        tracemalloc.stop()
+        queries.append(len(context.captured_queries))
+    return {
+        'requests': requests,
+        'status_codes': {str(code): n for code, n in status_codes.items()},
+        'latency_ms': summarize(latencies),
+        'queries': {
+            'mean': round(statistics.fmean(queries), 2),
+            'max': max(queries),
+        },
+        'peak_memory_kib': round(max(peaks), 1),
+    }
+
+
+def run(requests=50, warmup=5, profiled=10, scenarios=SCENARIOS):
+    """
+    Benchmarks the scenarios on the data currently in the database.
+
+    Args:
+        requests (int): The number of timed requests per scenario.
+        warmup (int): The number of untimed requests sent first.
+        profiled (int): The number of requests of the instrumented pass.
+        scenarios (iterable): The scenarios to run.
+
+    Returns:
+        dict: The measures of each scenario, by name.
+    """
+    clients = []
+    for user in benchmark_users():
+        client = Client()
+        client.force_login(user)
+        clients.append(client)
+    return {
+        scenario.name: measure(
+            scenario, clients, requests, warmup, max(1, profiled)
+        )
+        for scenario in scenarios
+    }
+
+
+def load(client, scenario, stop, latencies, errors):
+    """
+    Sends the requests of a scenario in a loop, until stopped.
+
+    Run by the threads of ``run_concurrent``, whose database connections
+    are closed once stopped.
+
+    Args:
+        client (Client): The logged in client.
+        scenario (Scenario): The scenario to run.
+        stop (Event): Set to stop the loop.
+        latencies (list): Receives the latency of each successful request,
+            in milliseconds.
+        errors (list): Receives the error of each failed request.
+    """
+    try:
+        for iteration in count():
+            if stop.is_set():
+                break
+            start = time.perf_counter()
+            try:
+                response = scenario.request(client, iteration)
+            except DatabaseError as exc:
+                errors.append(str(exc))
+                continue
+            if response.status_code >= 400:
+                errors.append(f'HTTP {response.status_code}')
+            else:
+                latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        connections.close_all()
+
+
+def run_concurrent(readers=4, writers=1, duration=5.0):
+    """
+    Measures the flux reads while reviews are written concurrently.
+
+    ``readers`` threads request the flux and ``writers`` threads post new
+    reviews with their tickets, all without pause during ``duration``
+    seconds. Locking shows as a lower read throughput, longer tail
+    latencies or failed requests ("database is locked").
+
+    Args:
+        readers (int): The number of threads reading the flux.
+        writers (int): The number of threads writing reviews.
+        duration (float): The duration of the measure, in seconds.
+
+    Returns:
+        dict: The throughput, latency percentiles and errors of the reads
+        and of the writes.
+    """
+    users = cycle(benchmark_users())
+    stop = threading.Event()
+    roles = {'reads': ([], []), 'writes': ([], [])}
+    threads = []
+    for role, scenarios in (
+        ('reads', [SCENARIOS[0]] * readers),
+        (
+            'writes',
+            [
+                CreateReviewScenario(f'writer{index}', 'post', 'create_review')
+                for index in range(writers)
+            ],
+        ),
+    ):
+        for scenario in scenarios:
+            client = Client()
+            client.force_login(next(users))
+            threads.append(
+                threading.Thread(
+                    target=load,
+                    args=(client, scenario, stop, *roles[role]),
+                )
+            )
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    results = {
+        'readers': readers,
+        'writers': writers,
+        'duration_s': duration,
+    }
+    for role, (latencies, errors) in roles.items():
+        results[role] = {
+            'requests': len(latencies),
+            'throughput_rps': round(len(latencies) / duration, 2),
+            'latency_ms': summarize(latencies),
+            'errors': len(errors),
+            'error_samples': sorted(set(errors))[:5],
+        }
+    return results
+
+
+def lookup(measure, path):
+    """
+    Returns a value of the measures of a scenario.
+
+    Args:
+        measure (dict): The measures of a scenario.
+        path (tuple): The successive keys leading to the value.
+
+    Returns:
+        float | None: The value, None if it was not measured.
+    """
+    for key in path:
+        if measure is None:
+            return None
+        measure = measure.get(key)
+    return measure
+
+
+def compare_metrics(scale, name, before, after, metrics):
+    """
+    Compares the measures of a scenario in two runs.
+
+    Args:
+        scale (str): The name of the data scale.
+        name (str): The name of the scenario.
+        before (dict): The measures of the former run.
+        after (dict): The measures of the current run.
+        metrics (tuple): The compared metrics, as in ``COMPARED_METRICS``.
+
+    Returns:
+        list: The change tuples, as described by ``compare``.
+    """
+    changes = []
+    for metric, path, higher_is_better in metrics:
+        before_value, after_value = lookup(before, path), lookup(after, path)
+        if before_value is None or after_value is None:
+            continue
+        change = after_value / before_value - 1 if before_value else 0.0
+        worse = change < 0 if higher_is_better else change > 0
+        changes.append(
+            (scale, name, metric, before_value, after_value, change, worse)
+        )
+    return changes
+
+
+def compare(baseline, results):
+    """
+    Compares the results of a run with those of a former run.
+
+    Args:
+        baseline (dict): The results of the former run.
+        results (dict): The results of the current run.
+
+    Returns:
+        list: The ``(scale, scenario, metric, before, after, change,
+        worse)`` tuples of the measures present in both runs, the change
+        being a ratio, such as 0.1 for a 10% higher value, and ``worse``
+        telling whether the change is a regression.
+    """
+    changes = []
+    for scale, measures in results['scales'].items():
+        former = baseline.get('scales', {}).get(scale, {})
+        for name, measure in measures['scenarios'].items():
+            before = former.get('scenarios', {}).get(name)
+            if before is not None:
+                changes += compare_metrics(
+                    scale, name, before, measure, COMPARED_METRICS
+                )
+        if measures.get('concurrency') and former.get('concurrency'):
+            changes += compare_metrics(
+                scale,
+                'concurrency',
+                former['concurrency'],
+                measures['concurrency'],
+                COMPARED_CONCURRENCY_METRICS,
+            )
+    return changes
@@ -0,0 +1,159 @@
+"""
+Detection of the tickets opened for the same book.
+
+Each ticket stores the normalized key of its title (see ``text.book_key``)
+and the trigrams of this key in ``BookTrigram``, an inverted index kept up
+to date on save. Looking for the tickets similar to a title never scans
+the tickets nor the postings of the frequent trigrams, such as those of
+the articles: a ticket whose similarity reaches ``SIMILARITY_THRESHOLD``
+shares at least one of the rarest trigrams of the title (prefix
+filtering), so only the postings of these rare trigrams are read to
+collect the candidates, whose exact similarity is then computed. At most
+``MAX_CANDIDATES`` candidates are compared, those sharing the most rare
+trigrams with the title: past this number of tickets with a common
+title, a close match sharing few rare trigrams can be missed.
+
+The ticket and review creation views use ``find_similar`` to suggest the
+existing tickets before a duplicate is created.
+"""
+
+import math
+
+from django.db import connection, transaction
+from django.db.models import Count, Max
+
+from . import text
+from .models import BookTrigram, Ticket
+
+SIMILARITY_THRESHOLD = 0.6
+FREQUENCY_CAP = 1000
+MAX_CANDIDATES = 2000
+BATCH_SIZE = 1000
+
+
+def index_ticket(ticket):
+    """
+    Replaces the indexed trigrams of a ticket by those of its book key.
+
+    Args:
+        ticket (Ticket): The saved ticket.
+    """
+    with transaction.atomic():
+        BookTrigram.objects.filter(ticket=ticket).delete()
+        BookTrigram.objects.bulk_create(
+            BookTrigram(trigram=trigram, ticket=ticket)
+            for trigram in text.trigrams(ticket.book_key)
+        )
+
+
+def rebuild(batch_size=BATCH_SIZE):
+    """
+    Recomputes the book keys and trigrams of all the tickets.
+
+    The tickets are processed by ranges of ids, one transaction per range.
+
+    Args:
+        batch_size (int): The number of ticket ids covered by each range.
+
+    Returns:
+        int: The number of indexed tickets.
+    """
+    last_id = Ticket.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    indexed = 0
+    for start in range(0, last_id + 1, batch_size):
+        tickets = list(
+            Ticket.objects.filter(
+                pk__gte=start, pk__lt=start + batch_size
+            ).only('id', 'title', 'book_key')
+        )
+        for ticket in tickets:
+            ticket.book_key = text.book_key(ticket.title)[:255]
+        with transaction.atomic():
+            Ticket.objects.bulk_update(tickets, ['book_key'])
+            BookTrigram.objects.filter(ticket__in=tickets).delete()
+            BookTrigram.objects.bulk_create(
+                (
+                    BookTrigram(trigram=trigram, ticket=ticket)
+                    for ticket in tickets
+                    for trigram in text.trigrams(ticket.book_key)
+                ),
+                batch_size=batch_size,
+            )
+        indexed += len(tickets)
+    return indexed
+
+
+def rarest_trigrams(grams, count):
+    """
+    Returns the trigrams of a title which index the fewest tickets.
+
+    The postings of all the trigrams are counted by a single query, each
+    up to ``FREQUENCY_CAP`` entries, so the frequent trigrams cost no more
+    than the rare ones.
+
+    Args:
+        grams (set): The trigrams of the title.
+        count (int): The number of trigrams to return.
+
+    Returns:
+        list: The rarest trigrams.
+    """
+    grams = list(grams)
+    table = BookTrigram._meta.db_table
+    counter = (
+        f"SELECT %s, (SELECT COUNT(*) FROM (SELECT 1 FROM {table} "
+        f"WHERE trigram = %s LIMIT {FREQUENCY_CAP}))"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            ' UNION ALL '.join([counter] * len(grams)),
+            [param for gram in grams for param in (gram, gram)],
+        )
+        frequencies = dict(cursor.fetchall())
+    return sorted(grams, key=frequencies.__getitem__)[:count]
+
+
+def find_similar(title, exclude=None, limit=5):
+    """
+    Returns the existing tickets whose book is probably the same as a title.
+
+    Args:
+        title (str): The title of the ticket about to be created.
+        exclude (int | None): The id of a ticket to leave out.
+        limit (int): The maximum number of tickets to return.
+
+    Returns:
+        list: The similar tickets, annotated with their ``similarity``,
+        most similar first.
+    """
+    grams = text.trigrams(text.book_key(title))
+    if not grams:
+        return []
+    # A Jaccard index of at least t requires sharing t * |grams| trigrams,
+    # hence at least one of the |grams| - t * |grams| + 1 rarest ones.
+    min_shared = math.ceil(SIMILARITY_THRESHOLD * len(grams))
+    rare = rarest_trigrams(grams, len(grams) - min_shared + 1)
+    # The candidates sharing the most rare trigrams are kept first, so a
+    # close match is not cut off by the tickets sharing a single one.
+    candidates = (
+        BookTrigram.objects.filter(trigram__in=rare)
+        .values('ticket')
+        .annotate(shared=Count('id'))
+        .order_by('-shared', 'ticket')
+        .values_list('ticket', flat=True)[:MAX_CANDIDATES]
+    )
+    keys = Ticket.objects.filter(pk__in=list(candidates))
+    if exclude is not None:
+        keys = keys.exclude(pk=exclude)
+    similarities = {}
+    for pk, book_key in keys.values_list('pk', 'book_key'):
+        similarity = text.similarity(grams, text.trigrams(book_key))
+        if similarity >= SIMILARITY_THRESHOLD:
+            similarities[pk] = similarity
+    similar = list(
+        Ticket.objects.filter(pk__in=similarities).select_related('user')
+    )
+    for ticket in similar:
+        ticket.similarity = similarities[ticket.pk]
+    similar.sort(key=lambda ticket: (-ticket.similarity, -ticket.review_count))
+    return similar[:limit]
@@ -0,0 +1,116 @@
+"""
+Publish/subscribe brokers pushing the flux events to the connected clients.
+
+The broker used is the class named by ``settings.FLUX_BROKER``. The default
+``InProcessBroker`` only reaches the clients connected to the same process;
+deployments running several processes plug a shared backend (Redis pub/sub,
+PostgreSQL LISTEN/NOTIFY...) by subclassing ``Broker``.
+"""
+
+import abc
+import asyncio
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+class Broker(abc.ABC):
+    """
+    Interface of the publish/subscribe backends.
+
+    Messages are JSON compatible dicts. ``publish`` is called from
+    synchronous code (signal handlers, possibly in worker threads) while
+    the subscriptions are consumed by the asynchronous event stream views.
+    """
+
+    @abc.abstractmethod
+    def publish(self, message):
+        """
+        Sends a message to all the current subscriptions.
+
+        Args:
+            message (dict): The message to send.
+        """
+
+    @abc.abstractmethod
+    def subscribe(self):
+        """
+        Opens a subscription, from the event loop which will consume it.
+
+        Returns:
+            object: The subscription, whose ``get`` coroutine returns the
+            next published message.
+        """
+
+    @abc.abstractmethod
+    def unsubscribe(self, subscription):
+        """
+        Closes a subscription opened by ``subscribe``.
+
+        Args:
+            subscription (object): The subscription to close.
+        """
+
+
+class InProcessBroker(Broker):
+    """
+    Broker delivering the messages to the subscriptions of the current process.
+
+    Each subscription is a bounded asyncio queue fed from any thread through
+    the event loop which owns it. A client too slow to keep up loses the
+    messages which overflow its queue instead of slowing down the publishers.
+
+    Attributes:
+        queue_size (int): The number of messages buffered per subscription.
+    """
+
+    queue_size = 100
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def publish(self, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.items())
+        for queue, loop in subscriptions:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, message)
+            except RuntimeError:
+                # The event loop of this subscription has been closed.
+                self.unsubscribe(queue)
+
+    @staticmethod
+    def _offer(queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscriptions[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.pop(subscription, None)
+
+
+def get_broker():
+    """
+    Returns the broker configured by ``settings.FLUX_BROKER``.
+
+    Returns:
+        Broker: The process wide broker instance.
+    """
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.FLUX_BROKER)()
+    return _broker
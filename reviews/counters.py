@@ -0,0 +1,187 @@
+"""
+Denormalized review counters and rating statistics of the tickets.
+
+``Ticket.review_count``, ``Ticket.rating_total`` and the rating histogram
+``Ticket.rating_0`` ... ``Ticket.rating_5`` are maintained incrementally
+with atomic ``F()`` updates when a review is created, re-rated or deleted,
+so no view has to save the whole ticket again and the average rating and
+the distribution are displayed without any aggregate query. ``reconcile``
+recomputes them from the reviews, one range of ticket ids at a time, to
+repair any drift (bulk loads, manual edits) while the site keeps running.
+"""
+
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Review, Ticket
+
+BATCH_SIZE = 10000
+
+
+def rating_field(rating):
+    """
+    Returns the name of the histogram field counting a rating.
+
+    Args:
+        rating (int): A rating, between 0 and 5.
+
+    Returns:
+        str: The field name.
+    """
+    return f'rating_{rating}'
+
+
+def adjust(ticket_id, rating, delta):
+    """
+    Adds or removes one review of a rating in the statistics of a ticket.
+
+    Args:
+        ticket_id (int): The id of the ticket.
+        rating (int): The rating of the review.
+        delta (int): 1 to count the review, -1 to uncount it.
+    """
+    tickets = Ticket.objects.filter(pk=ticket_id)
+    if delta < 0:
+        tickets = tickets.filter(
+            review_count__gt=0,
+            rating_total__gte=rating,
+            **{f'{rating_field(rating)}__gt': 0},
+        )
+    tickets.update(
+        review_count=F('review_count') + delta,
+        rating_total=F('rating_total') + delta * rating,
+        **{rating_field(rating): F(rating_field(rating)) + delta},
+    )
+
+
+def add_review(review):
+    """
+    Counts a new review in its ticket.
+
+    Args:
+        review (Review): The created review.
+    """
+    adjust(review.ticket_id, review.rating, 1)
+
+
+def change_review(review):
+    """
+    Moves an edited review from its former rating to the new one.
+
+    Args:
+        review (Review): The saved review, whose loaded rating differs.
+    """
+    ticket_id, rating = review._loaded_rating
+    adjust(ticket_id, rating, -1)
+    adjust(review.ticket_id, review.rating, 1)
+
+
+def remove_review(review):
+    """
+    Uncounts a deleted review from its ticket.
+
+    Args:
+        review (Review): The deleted review.
+    """
+    ticket_id, rating = getattr(
+        review, '_loaded_rating', (review.ticket_id, review.rating)
+    )
+    adjust(ticket_id, rating, -1)
+
+
+def review_count():
+    """
+    Returns the expression counting the reviews of the outer ticket.
+
+    Returns:
+        Coalesce: The correlated subquery, 0 for a ticket without review.
+    """
+    reviews = (
+        Review.objects.filter(ticket=OuterRef('pk'))
+        .order_by()
+        .values('ticket')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    return Coalesce(Subquery(reviews), Value(0))
+
+
+def rating_total():
+    """
+    Returns the expression summing the ratings of the outer ticket.
+
+    Returns:
+        Coalesce: The correlated subquery, 0 for a ticket without review.
+    """
+    reviews = (
+        Review.objects.filter(ticket=OuterRef('pk'))
+        .order_by()
+        .values('ticket')
+        .annotate(total=Sum('rating'))
+        .values('total')
+    )
+    return Coalesce(Subquery(reviews), Value(0))
+
+
+def rating_count(rating):
+    """
+    Returns the expression counting the reviews of the outer ticket with a rating.
+
+    Args:
+        rating (int): A rating, between 0 and 5.
+
+    Returns:
+        Coalesce: The correlated subquery, 0 if no review has this rating.
+    """
+    reviews = (
+        Review.objects.filter(ticket=OuterRef('pk'), rating=rating)
+        .order_by()
+        .values('ticket')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    return Coalesce(Subquery(reviews), Value(0))
+
+
+def statistics():
+    """
+    Returns the expressions computing all the counters of the outer ticket.
+
+    Returns:
+        dict: The expressions, by field name.
+    """
+    expressions = {
+        'review_count': review_count(),
+        'rating_total': rating_total(),
+    }
+    for rating in Ticket.RATINGS:
+        expressions[rating_field(rating)] = rating_count(rating)
+    return expressions
+
+
+def reconcile(batch_size=BATCH_SIZE):
+    """
+    Recomputes the review counters and rating statistics of all the tickets.
+
+    Each range of ``batch_size`` ticket ids is fixed by a single UPDATE
+    statement which only rewrites the tickets with a wrong counter, so
+    concurrent increments are never lost and the write locks stay short.
+
+    Args:
+        batch_size (int): The number of ticket ids covered by each query.
+
+    Returns:
+        int: The number of tickets whose counters have been fixed.
+    """
+    last_id = Ticket.objects.order_by('-id').values_list('id', flat=True)
+    last_id = last_id.first() or 0
+    fixed = 0
+    for start in range(0, last_id + 1, batch_size):
+        stale = Q()
+        for field, expression in statistics().items():
+            stale |= ~Q(**{field: expression})
+        tickets = Ticket.objects.filter(
+            pk__gte=start, pk__lt=start + batch_size
+        )
+        fixed += tickets.filter(stale).update(**statistics())
+    return fixed
@@ -0,0 +1,172 @@
+"""
+Real-time flux updates sent as server-sent events (SSE).
+
+Each created ticket or review is published to the broker once its
+transaction is committed; subscriptions and unsubscriptions are published
+too, so that the open streams keep their set of followed users up to date
+without querying the database.
+
+The stream view is asynchronous: served by an ASGI server (see
+``config/asgi.py``), thousands of idle connections are held by a single
+event loop instead of one worker each. A WSGI server would buffer the
+never ending response and hold a worker per connection, so under WSGI the
+view answers 204 No Content, which stops the EventSource from reconnecting,
+and the flux page polls the flux API instead.
+"""
+
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.generic import View
+
+from authentication import graph
+
+from . import api
+from .broker import get_broker
+
+POST = 'post'
+FOLLOW = 'follow'
+UNFOLLOW = 'unfollow'
+
+
+def publish_post(post, content_type):
+    """
+    Publishes a new post once the current transaction is committed.
+
+    Args:
+        post (Ticket | Review): The created post.
+        content_type (str): 'TICKET' or 'REVIEW'.
+    """
+
+    def publish():
+        post.content_type = content_type
+        get_broker().publish(
+            {
+                'kind': POST,
+                'author': post.user_id,
+                'post': api.serialize(post),
+            }
+        )
+
+    transaction.on_commit(publish)
+
+
+def publish_subscription(subscription, kind):
+    """
+    Publishes a subscription change once the current transaction is committed.
+
+    Args:
+        subscription (UserFollows): The created or deleted subscription.
+        kind (str): FOLLOW or UNFOLLOW.
+    """
+    message = {
+        'kind': kind,
+        'user': subscription.user_id,
+        'followed_user': subscription.followed_user_id,
+    }
+    transaction.on_commit(lambda: get_broker().publish(message))
+
+
+def is_asgi(request):
+    """
+    Tells whether a request is served by an ASGI server.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        bool: True if the server can hold event streams.
+    """
+    return isinstance(request, ASGIRequest)
+
+
+def format_event(event, data):
+    """
+    Formats a server-sent event.
+
+    Args:
+        event (str): The name of the event.
+        data (dict): The payload, encoded as JSON.
+
+    Returns:
+        str: The event, terminated by a blank line.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_events(user_id, authors):
+    """
+    Yields the events of the flux of a user.
+
+    A comment is sent every ``settings.FLUX_EVENTS_KEEPALIVE`` seconds
+    without event, so that idle connections are not closed by proxies.
+
+    Args:
+        user_id (int): The id of the connected user.
+        authors (set): The ids of the users whose posts appear in the flux.
+
+    Yields:
+        str: The formatted events.
+    """
+    broker = get_broker()
+    subscription = broker.subscribe()
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(
+                    subscription.get(), settings.FLUX_EVENTS_KEEPALIVE
+                )
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if message['kind'] == POST and message['author'] in authors:
+                yield format_event(POST, message['post'])
+            elif message['kind'] in (FOLLOW, UNFOLLOW):
+                if message['user'] == user_id:
+                    if message['kind'] == FOLLOW:
+                        authors.add(message['followed_user'])
+                    else:
+                        authors.discard(message['followed_user'])
+    finally:
+        broker.unsubscribe(subscription)
+
+
+class FluxEventsView(View):
+    """
+    View class streaming the new posts of the user's flux as server-sent events.
+
+    Each new ticket or review written by the user or by a followed user is sent as a 'post'
+    event whose data is the JSON representation of the post, as returned by the flux API.
+    """
+
+    async def get(self, request):
+        """
+        Handles GET requests to the flux event stream.
+
+        Args:
+            request (HttpRequest): The HTTP request object.
+
+        Returns:
+            StreamingHttpResponse: The never ending event stream,
+                                   a 204 response if the server is not an ASGI server,
+                                   or a 401 response if the user is not logged in.
+        """
+        if not is_asgi(request):
+            return HttpResponse(status=204)
+        user = await request.auser()
+        if not user.is_authenticated:
+            return HttpResponse(status=401)
+        authors = {user.id}
+        authors.update(await sync_to_async(graph.followees)(user.id))
+        response = StreamingHttpResponse(
+            stream_events(user.id, authors), content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
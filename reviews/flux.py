@@ -0,0 +1,550 @@
+"""
+Merged, keyset-paginated stream of tickets and reviews.
+
+The flux is the union of two independently ordered streams (tickets and
+reviews). Each stream is ordered by ``(time_created, content_type, id)``
+in descending order and only the rows located after the cursor are
+fetched from the database, so the cost of a page does not depend on the
+size of the history. The streams are then merged with a k-way merge.
+
+Up to ``MAX_MERGED_AUTHORS`` authors, the ids of each stream of the flux
+are read by a ``UNION ALL`` of one range of the ``(user, -time_created,
+-id)`` index per author (see ``AuthorRanges``): the database merges the
+ranges, which are already ordered, and stops once the page is full,
+instead of sorting all the posts of the followed users.
+
+A cursor is the position of the last post of a page,
+``"<timestamp>~<content_type>~<id>"``, encoded in unpadded URL-safe
+base64 so that it is passed in a query string as is. A malformed cursor
+raises ``InvalidCursor``, which Django answers with a 400 Bad Request.
+"""
+
+import base64
+import heapq
+from datetime import datetime
+from itertools import islice
+
+from django.core.exceptions import BadRequest
+from django.db import connections
+from django.db.models import CharField, Count, Max, Q, Value
+
+from authentication import graph
+from authentication.models import UserFollows
+
+from . import timeline
+from .models import Review, Ticket, TimelineEntry
+
+TICKET = 'TICKET'
+REVIEW = 'REVIEW'
+
+CURSOR_SEPARATOR = '~'
+
+MAX_MERGED_AUTHORS = 100
+MAX_INLINED_AUTHORS = 500
+
+
+class InvalidCursor(BadRequest):
+    """
+    Raised when a cursor read from a request cannot be decoded.
+    """
+
+
+def sort_key(post):
+    """
+    Returns the ordering key of a post in the flux.
+
+    Args:
+        post (Ticket | Review): A post annotated with its content type.
+
+    Returns:
+        tuple: The ``(time_created, content_type, id)`` key of the post.
+    """
+    return (post.time_created, post.content_type, post.id)
+
+
+def encode_cursor(post):
+    """
+    Encodes the position of a post as an opaque cursor string.
+
+    Args:
+        post (Ticket | Review): A post annotated with its content type.
+
+    Returns:
+        str: The cursor pointing just after this post.
+    """
+    position = CURSOR_SEPARATOR.join(
+        (post.time_created.isoformat(), post.content_type, str(post.id))
+    )
+    cursor = base64.urlsafe_b64encode(position.encode())
+    return cursor.rstrip(b'=').decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor produced by ``encode_cursor``.
+
+    Args:
+        cursor (str): The cursor string, usually read from the query string.
+
+    Returns:
+        tuple | None: The ``(time_created, content_type, id)`` position,
+        or None if the cursor is empty.
+
+    Raises:
+        InvalidCursor: If the cursor is malformed.
+    """
+    if not cursor:
+        return None
+    try:
+        position = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        time_created, content_type, post_id = position.decode().split(
+            CURSOR_SEPARATOR
+        )
+        time_created = datetime.fromisoformat(time_created)
+        post_id = int(post_id)
+    except ValueError:
+        raise InvalidCursor(f'Invalid cursor: {cursor!r}') from None
+    if content_type not in (TICKET, REVIEW) or time_created.tzinfo is None:
+        raise InvalidCursor(f'Invalid cursor: {cursor!r}')
+    return time_created, content_type, post_id
+
+
+def visible_to(user):
+    """
+    Builds the filter selecting the authors whose posts appear in a user's flux.
+
+    The followed users are read from the cached follow graph and inlined in
+    the query, up to ``MAX_INLINED_AUTHORS``. Beyond, they are resolved as a
+    subquery, so the whole flux is still read in one round trip per content
+    type whatever the number of subscriptions.
+
+    Args:
+        user (User): The user reading the flux.
+
+    Returns:
+        Q: The filter matching the user and the users they follow.
+    """
+    followed_users = graph.followees(user.pk)
+    if len(followed_users) >= MAX_INLINED_AUTHORS:
+        followed_users = UserFollows.objects.filter(user=user).values(
+            'followed_user'
+        )
+        return Q(user=user) | Q(user__in=followed_users)
+    return Q(user__in=[user.pk, *followed_users])
+
+
+def after(position, content_type):
+    """
+    Builds the filter selecting the rows of one stream located after a cursor.
+
+    Args:
+        position (tuple | None): The decoded cursor.
+        content_type (str): The content type of the filtered stream.
+
+    Returns:
+        Q: The filter to apply on the stream queryset.
+    """
+    if position is None:
+        return Q()
+    time_created, cursor_type, post_id = position
+    older = Q(time_created__lt=time_created)
+    if content_type == cursor_type:
+        return older | Q(time_created=time_created, id__lt=post_id)
+    if content_type < cursor_type:
+        return older | Q(time_created=time_created)
+    return older
+
+
+def after_entry(position):
+    """
+    Builds the filter selecting the timeline entries located after a cursor.
+
+    Args:
+        position (tuple | None): The decoded cursor.
+
+    Returns:
+        Q: The filter to apply on the timeline queryset.
+    """
+    if position is None:
+        return Q()
+    time_created, content_type, post_id = position
+    return (
+        Q(time_created__lt=time_created)
+        | Q(time_created=time_created, content_type__lt=content_type)
+        | Q(
+            time_created=time_created,
+            content_type=content_type,
+            post_id__lt=post_id,
+        )
+    )
+
+
+def annotated(queryset, content_type):
+    """
+    Annotates the posts of a queryset with their content type.
+
+    Args:
+        queryset (QuerySet): The Ticket or Review queryset.
+        content_type (str): The content type of the posts.
+
+    Returns:
+        QuerySet: The annotated queryset.
+    """
+    return queryset.annotate(content_type=Value(content_type, CharField()))
+
+
+def ordered(queryset, content_type):
+    """
+    Annotates a stream with its content type and applies the flux ordering.
+
+    Args:
+        queryset (QuerySet): The Ticket or Review queryset.
+        content_type (str): The content type of the stream.
+
+    Returns:
+        QuerySet: The annotated queryset, most recent posts first.
+    """
+    queryset = annotated(queryset, content_type)
+    return queryset.order_by('-time_created', '-id')
+
+
+def get_querysets():
+    """
+    Returns the tickets and reviews with their joins.
+
+    The authors and the reviewed tickets are joined in the same query, so
+    rendering the snippets of a page does not issue any further query.
+
+    Returns:
+        list: The unordered Ticket and Review querysets and their content
+        types.
+    """
+    tickets = Ticket.objects.select_related('user')
+    reviews = Review.objects.select_related('user', 'ticket__user')
+    return [(tickets, TICKET), (reviews, REVIEW)]
+
+
+def get_streams(users, position=None):
+    """
+    Returns the ordered ticket and review streams written by some users.
+
+    Args:
+        users (Q): The filter selecting the authors of the posts.
+        position (tuple | None): The decoded cursor of the previous page.
+
+    Returns:
+        list: The ordered Ticket and Review querysets.
+    """
+    return [
+        ordered(
+            queryset.filter(users, after(position, content_type)),
+            content_type,
+        )
+        for queryset, content_type in get_querysets()
+    ]
+
+
+def get_statistics(users):
+    """
+    Returns the cheap aggregates validating the posts written by some users.
+
+    Each stream is aggregated by one query reading the ``(user,
+    -time_created, -id)`` index, without fetching any post.
+
+    Args:
+        users (Q): The filter selecting the authors of the posts.
+
+    Returns:
+        list: The number of tickets and the creation date of the latest
+        one, then the same for the reviews.
+    """
+    statistics = []
+    for model in (Ticket, Review):
+        aggregates = model.objects.filter(users).aggregate(
+            count=Count('id'), latest=Max('time_created')
+        )
+        statistics += [aggregates['count'], aggregates['latest']]
+    return statistics
+
+
+class AuthorRanges:
+    """
+    Ordered stream of the posts of a few authors, read from their index
+    ranges.
+
+    The ids of the posts are read by a ``UNION ALL`` of one range of the
+    ``(user, -time_created, -id)`` index per author, which the database
+    merges without a sort step, then the posts are fetched by id with
+    their joins. The range of each author is compiled by the ORM from its
+    own queryset.
+
+    Like an ordered queryset, the stream can be sliced to its first posts
+    and iterated over.
+
+    Attributes:
+        queryset (QuerySet): The posts, with their joins and content type.
+        content_type (str): The content type of the stream.
+        user_ids (list): The ids of the authors, at least one.
+        position (tuple | None): The decoded cursor of the previous page.
+        limit (int | None): The maximum number of posts, or None for all.
+    """
+
+    def __init__(self, queryset, content_type, user_ids, position, limit=None):
+        self.queryset = queryset
+        self.content_type = content_type
+        self.user_ids = user_ids
+        self.position = position
+        self.limit = limit
+
+    @property
+    def model(self):
+        return self.queryset.model
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.start or index.step:
+            raise TypeError('Only the first posts of a stream can be read.')
+        return AuthorRanges(
+            self.queryset,
+            self.content_type,
+            self.user_ids,
+            self.position,
+            index.stop,
+        )
+
+    def __iter__(self):
+        return self.iterator()
+
+    def sql_with_params(self):
+        """
+        Builds the query reading the ids of the posts, most recent first.
+
+        Returns:
+            tuple: The SQL and its parameters.
+        """
+        queries, union_params = [], []
+        for user_id in self.user_ids:
+            ranges = self.model.objects.filter(
+                after(self.position, self.content_type), user_id=user_id
+            )
+            ranges = ranges.order_by().values_list('time_created', 'id')
+            sql, params = ranges.query.sql_with_params()
+            queries.append(sql)
+            union_params += params
+        sql = ' UNION ALL '.join(queries)
+        sql += ' ORDER BY 1 DESC, 2 DESC'
+        if self.limit is not None:
+            sql += ' LIMIT %s'
+            union_params.append(self.limit)
+        return sql, tuple(union_params)
+
+    def iterator(self, chunk_size=None):
+        """
+        Reads the posts of the stream.
+
+        Args:
+            chunk_size (int | None): If set, the ids are read through a
+                database cursor and the posts fetched this number at a
+                time. All at once otherwise.
+
+        Yields:
+            Ticket | Review: The posts annotated with their content type,
+            most recent first.
+        """
+        sql, params = self.sql_with_params()
+        with connections[self.queryset.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            if chunk_size:
+                chunks = iter(lambda: cursor.fetchmany(chunk_size), [])
+            else:
+                chunks = [cursor.fetchall()]
+            for keys in chunks:
+                ids = [post_id for _, post_id in keys]
+                posts = self.queryset.in_bulk(ids)
+                # A post deleted since its id was read is skipped.
+                yield from (posts[i] for i in ids if i in posts)
+
+
+def get_author_streams(user_ids, position=None):
+    """
+    Returns the ordered ticket and review streams written by a few users.
+
+    Args:
+        user_ids (list): The ids of the authors, at least one.
+        position (tuple | None): The decoded cursor of the previous page.
+
+    Returns:
+        list: The ordered AuthorRanges of the tickets and reviews.
+    """
+    return [
+        AuthorRanges(
+            annotated(queryset, content_type),
+            content_type,
+            user_ids,
+            position,
+        )
+        for queryset, content_type in get_querysets()
+    ]
+
+
+def get_timeline_streams(user, position=None):
+    """
+    Returns the ordered streams of a user's flux in timeline mode.
+
+    The materialized timeline holds the posts of the user and of the
+    followed users who are fanned out on write. The posts of the followed
+    users who have too many followers are read on request and merged.
+
+    Args:
+        user (User): The user reading the flux.
+        position (tuple | None): The decoded cursor of the previous page.
+
+    Returns:
+        list: The ordered TimelineEntry, Ticket and Review querysets.
+    """
+    pulled_users = UserFollows.objects.filter(
+        user=user, followed_user__fanned_out=False
+    ).values('followed_user')
+    entries = TimelineEntry.objects.filter(after_entry(position), owner=user)
+    entries = entries.exclude(author__in=pulled_users).select_related(
+        'ticket__user', 'review__user', 'review__ticket__user'
+    )
+    entries = entries.order_by('-time_created', '-content_type', '-post_id')
+    return [entries] + get_streams(Q(user__in=pulled_users), position)
+
+
+def get_flux_streams(user, position=None):
+    """
+    Returns the ordered streams of a user's flux.
+
+    The flux is read from the materialized timeline when
+    ``settings.FLUX_TIMELINE`` is enabled, from the posts otherwise.
+
+    Args:
+        user (User): The user reading the flux.
+        position (tuple | None): The decoded cursor of the previous page.
+
+    Returns:
+        list: The ordered querysets or AuthorRanges to merge.
+    """
+    if timeline.is_enabled():
+        return get_timeline_streams(user, position)
+    followed_users = graph.followees(user.pk)
+    if len(followed_users) < MAX_MERGED_AUTHORS:
+        return get_author_streams([user.pk, *followed_users], position)
+    return get_streams(visible_to(user), position)
+
+
+def as_posts(rows, chunk_size=None):
+    """
+    Converts the rows of a stream into posts.
+
+    Args:
+        rows (QuerySet | AuthorRanges): A sliced stream of posts or
+            timeline entries.
+        chunk_size (int | None): If set, the rows are read lazily through a
+            database cursor, this number of rows at a time.
+
+    Returns:
+        iterable: The posts annotated with their content type.
+    """
+    model = rows.model
+    if chunk_size:
+        rows = rows.iterator(chunk_size=chunk_size)
+    if model is TimelineEntry:
+        return (entry.post for entry in rows)
+    return rows
+
+
+def merge(streams, limit):
+    """
+    Merges ordered streams of posts and keeps the most recent ones.
+
+    Args:
+        streams (list): Iterables of posts, each sorted most recent first.
+        limit (int): The maximum number of posts to return.
+
+    Returns:
+        iterator: At most ``limit`` posts, most recent first.
+    """
+    merged = heapq.merge(*streams, key=sort_key, reverse=True)
+    return islice(merged, limit)
+
+
+def get_page(users, cursor=None, limit=20):
+    """
+    Returns one page of the flux written by some users.
+
+    Only ``limit`` rows per stream are fetched, whatever the size of the
+    history located before the cursor.
+
+    Args:
+        users (Q): The filter selecting the authors of the posts.
+        cursor (str | None): The cursor of the previous page.
+        limit (int): The number of posts per page.
+
+    Returns:
+        tuple: The list of posts and the cursor of the next page, or None
+        if this page is the last one.
+    """
+    return paginate(get_streams(users, decode_cursor(cursor)), limit)
+
+
+def get_flux_page(user, cursor=None, limit=20):
+    """
+    Returns one page of a user's flux.
+
+    Args:
+        user (User): The user reading the flux.
+        cursor (str | None): The cursor of the previous page.
+        limit (int): The number of posts per page.
+
+    Returns:
+        tuple: The list of posts and the cursor of the next page, or None
+        if this page is the last one.
+    """
+    return paginate(get_flux_streams(user, decode_cursor(cursor)), limit)
+
+
+def iter_flux(user, cursor=None, limit=None, chunk_size=100):
+    """
+    Iterates lazily over a user's flux.
+
+    The streams are read through database cursors, ``chunk_size`` rows at
+    a time, and merged on the fly, so the memory used does not depend on
+    the number of posts read.
+
+    Args:
+        user (User): The user reading the flux.
+        cursor (str | None): The cursor after which the iteration starts.
+        limit (int | None): The maximum number of posts, or None for all.
+        chunk_size (int): The number of rows fetched per database round trip.
+
+    Returns:
+        iterator: The posts annotated with their content type, most recent
+        first.
+    """
+    streams = get_flux_streams(user, decode_cursor(cursor))
+    if limit is not None:
+        streams = [stream[:limit] for stream in streams]
+    streams = [as_posts(stream, chunk_size) for stream in streams]
+    return merge(streams, limit)
+
+
+def paginate(streams, limit):
+    """
+    Merges the first rows of ordered streams into a page.
+
+    Args:
+        streams (list): The ordered querysets or AuthorRanges to merge.
+        limit (int): The number of posts per page.
+
+    Returns:
+        tuple: The list of posts and the cursor of the next page, or None
+        if this page is the last one.
+    """
+    streams = [as_posts(stream[: limit + 1]) for stream in streams]
+    posts = list(merge(streams, limit + 1))
+    if len(posts) <= limit:
+        return posts, None
+    posts = posts[:limit]
+    return posts, encode_cursor(posts[-1])
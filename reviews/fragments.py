@@ -0,0 +1,202 @@
+"""
+Versioned caching of the rendered post snippets.
+
+The flux and posts templates cache the HTML of each ticket and review
+snippet with Django's ``{% cache %}`` tag, keyed by the post id and by a
+version token stored in the cache. Editing or deleting a post replaces
+its token, so the fragments rendered for the old version are never read
+again and simply expire. Tokens are random rather than incremented: a
+token evicted from the cache can never come back with an old value.
+
+The pages of posts are validated the same way, without being read: each
+author has a page token, replaced whenever a snippet displayed for one
+of their posts changes, and a generation token covers the bulk imports.
+The entity tag of a page combines the tokens of its authors, the number
+of their tickets and reviews with the creation date of the latest ones,
+and every other input of the template.
+
+The fragments are stored in the ``default`` alias of ``settings.CACHES``
+and the tokens in the ``settings.VERSION_CACHE`` alias, so that the many
+fragments never evict the tokens of the posts still displayed. Both are
+local-memory caches unless shared backends are configured.
+"""
+
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Review, Ticket
+
+KEY_PREFIX = 'reviews:version'
+PAGE_PREFIX = 'reviews:page'
+GENERATION_KEY = f'{PAGE_PREFIX}:generation'
+
+
+def version_key(content_type, pk):
+    """
+    Returns the cache key holding the version token of a post.
+
+    Args:
+        content_type (str): 'TICKET' or 'REVIEW'.
+        pk (int): The id of the post.
+
+    Returns:
+        str: The cache key.
+    """
+    return f"{KEY_PREFIX}:{content_type}:{pk}"
+
+
+def page_key(user_id):
+    """
+    Returns the cache key holding the page token of an author.
+
+    Args:
+        user_id (int): The id of the author.
+
+    Returns:
+        str: The cache key.
+    """
+    return f"{PAGE_PREFIX}:{user_id}"
+
+
+def version_cache():
+    """
+    Returns the cache holding the version tokens.
+    """
+    return caches[settings.VERSION_CACHE]
+
+
+def new_version():
+    """
+    Returns a new, unique version token.
+    """
+    return uuid.uuid4().hex
+
+
+def invalidate(content_type, pk):
+    """
+    Replaces the version token of a post, invalidating its cached fragments.
+
+    Args:
+        content_type (str): 'TICKET' or 'REVIEW'.
+        pk (int): The id of the post.
+    """
+    version_cache().set(version_key(content_type, pk), new_version(), None)
+
+
+def annotate_versions(posts):
+    """
+    Sets the ``cache_version`` of a page of posts and of the reviewed tickets.
+
+    All the tokens are read in one round trip to the cache; the missing
+    ones are created.
+
+    Args:
+        posts (list): The tickets and reviews annotated with their content
+            type.
+    """
+    objects = {}
+    for post in posts:
+        key = version_key(post.content_type, post.pk)
+        objects.setdefault(key, []).append(post)
+        if post.content_type == 'REVIEW':
+            key = version_key('TICKET', post.ticket_id)
+            objects.setdefault(key, []).append(post.ticket)
+    cache = version_cache()
+    versions = cache.get_many(objects)
+    missing = {key: new_version() for key in objects if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    for key, instances in objects.items():
+        for instance in instances:
+            instance.cache_version = versions[key]
+
+
+def invalidate_pages(ticket_id, user_ids=()):
+    """
+    Replaces the page tokens of the authors of the posts displaying a ticket.
+
+    A ticket is displayed by its own snippet and by the snippets of its
+    reviews, so the pages of its author and of its reviewers change with it.
+
+    Args:
+        ticket_id (int): The id of the changed ticket.
+        user_ids (iterable): The ids of other authors whose pages changed,
+            such as the author of a deleted post.
+    """
+    authors = set(user_ids)
+    authors.update(
+        Ticket.objects.filter(pk=ticket_id).values_list('user_id', flat=True)
+    )
+    authors.update(
+        Review.objects.filter(ticket_id=ticket_id).values_list(
+            'user_id', flat=True
+        )
+    )
+    version_cache().set_many(
+        {page_key(author): new_version() for author in authors}, None
+    )
+
+
+def invalidate_all():
+    """
+    Replaces the generation token, changing the entity tag of every page.
+    """
+    version_cache().set(GENERATION_KEY, new_version(), None)
+
+
+def page_versions(user_ids):
+    """
+    Returns the generation token and the page tokens of some authors.
+
+    All the tokens are read in one round trip to the cache; the missing
+    ones are created.
+
+    Args:
+        user_ids (list): The ids of the authors.
+
+    Returns:
+        list: The generation token, then the token of each author.
+    """
+    keys = [GENERATION_KEY, *map(page_key, user_ids)]
+    cache = version_cache()
+    versions = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def page_etag(user, user_ids, statistics, cursor, context):
+    """
+    Computes the entity tag of a page of posts before reading it.
+
+    The tag changes whenever a post of the authors is written, edited or
+    deleted, a ticket they reviewed is edited or reviewed, the authors
+    change, or the template receives other variables.
+
+    Args:
+        user (User): The user viewing the page.
+        user_ids (list): The ids of the authors of the posts.
+        statistics (list): The number of posts and the latest creation
+            date of each stream, from ``flux.get_statistics``.
+        cursor (str | None): The cursor of the previous page.
+        context (dict): The other variables of the template.
+
+    Returns:
+        str: The quoted entity tag.
+    """
+    state = [
+        user.pk,
+        cursor,
+        sorted(context.items()),
+        statistics,
+        sorted(user_ids),
+        page_versions(user_ids),
+    ]
+    digest = hashlib.sha1(repr(state).encode()).hexdigest()
+    return f'"{digest}"'
@@ -0,0 +1,228 @@
+"""
+Background processing of the ticket images.
+
+Saving a ticket with an image only stores the upload and flags the ticket
+with ``image_ready = False``: the pending tickets form a durable queue in
+the database. Once the transaction is committed the ticket is handed to a
+pool of ``settings.TICKET_IMAGE_WORKERS`` threads which resize the image
+and flag it as ready. Meanwhile the templates display a placeholder. An
+image which cannot be processed flags the ticket as failed instead, which
+takes it out of the queue until a new image is uploaded.
+
+The resized image is stored as a new content-addressed file which
+replaces the upload in the ticket; the upload, which other tickets may
+share, is never rewritten and is deleted once the ticket is updated,
+unless another ticket references it or has uploaded it again meanwhile.
+
+From a single decode of the upload, the workers also render one variant
+per width of ``Ticket.IMAGE_VARIANT_WIDTHS`` and per format supported by
+Pillow (AVIF, WebP and JPEG). The variants are stored under content
+addressed names, ``variants/<hash[:2]>/<hash>-<width>.<ext>``, where the
+hash is the one naming the upload in ``storage``, so identical uploads
+share the same files. They are listed in ``Ticket.image_variants`` to
+build the ``srcset`` of the snippets.
+
+The ``process_images`` management command drains the same queue, to
+recover the jobs lost by a restart or to process the images in a separate
+worker process when the thread pool is disabled.
+"""
+
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image
+
+from . import fragments, storage
+from .models import Ticket
+
+logger = logging.getLogger(__name__)
+
+VARIANT_FORMATS = (
+    ('AVIF', 'image/avif', 'avif'),
+    ('WEBP', 'image/webp', 'webp'),
+    ('JPEG', 'image/jpeg', 'jpg'),
+)
+VARIANT_QUALITY = 80
+
+_executor = None
+
+
+def get_executor():
+    """
+    Returns the thread pool processing the images, created on first use.
+
+    Returns:
+        ThreadPoolExecutor | None: The pool, or None if the images are only
+        processed by the ``process_images`` command.
+    """
+    global _executor
+    if _executor is None and settings.TICKET_IMAGE_WORKERS > 0:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.TICKET_IMAGE_WORKERS,
+            thread_name_prefix='ticket-images',
+        )
+    return _executor
+
+
+def pending():
+    """
+    Returns the tickets whose image is waiting to be processed.
+
+    Returns:
+        QuerySet: The pending tickets, oldest first.
+    """
+    tickets = Ticket.objects.filter(image_ready=False, image_failed=False)
+    return tickets.order_by('id')
+
+
+def schedule(ticket_id):
+    """
+    Queues the processing of a ticket image once the transaction is committed.
+
+    Args:
+        ticket_id (int): The id of the ticket to process.
+    """
+    executor = get_executor()
+    if executor is not None:
+        transaction.on_commit(lambda: executor.submit(run, ticket_id))
+
+
+def run(ticket_id):
+    """
+    Processes a ticket image in a worker thread.
+
+    The database connection opened by the thread is released afterwards.
+
+    Args:
+        ticket_id (int): The id of the ticket to process.
+    """
+    try:
+        process(ticket_id)
+    except Exception:
+        logger.exception("Processing the image of ticket %s failed", ticket_id)
+    finally:
+        connections.close_all()
+
+
+def process(ticket_id):
+    """
+    Resizes the image of a ticket and flags it as ready.
+
+    The ticket is only updated if its image has not been replaced in the
+    meantime, in which case the new image has its own job. The resized
+    copy then replaces the upload in the ticket. Any error
+    raised while processing the image, such as an undecodable or
+    oversized upload, is logged and flags the ticket as failed rather than
+    leaving it pending forever.
+
+    Args:
+        ticket_id (int): The id of the ticket to process.
+
+    Returns:
+        bool: True if the ticket image has been processed.
+    """
+    ticket = Ticket.objects.filter(pk=ticket_id).first()
+    if ticket is None or ticket.image_ready or ticket.image_failed:
+        return False
+    upload = ticket.image.name
+    upload_modified = storage.modified_time(upload) if upload else None
+    name, variants, failed = upload, {}, False
+    if ticket.image:
+        try:
+            with ticket.image.open('rb') as file:
+                data = file.read()
+            image = Image.open(io.BytesIO(data))
+            image.load()
+            digest = storage.content_hash(upload)
+            variants = render_variants(
+                image, digest or hashlib.sha256(data).hexdigest()
+            )
+            name = ticket.resize_image(image)
+            name_modified = storage.modified_time(name)
+        except Exception:
+            logger.exception("The image of ticket %s is invalid", ticket_id)
+            name, variants, failed = upload, {}, True
+    updated = Ticket.objects.filter(pk=ticket_id, image=upload).update(
+        image=name,
+        image_ready=not failed,
+        image_failed=failed,
+        image_variants=variants,
+    )
+    if name != upload:
+        # The upload, or the unused copy if the image has been replaced,
+        # unless another ticket has stored the same content since.
+        if updated:
+            storage.schedule_collection(upload, upload_modified)
+        else:
+            storage.schedule_collection(name, name_modified)
+    if updated:
+        fragments.invalidate('TICKET', ticket_id)
+        fragments.invalidate_pages(ticket_id)
+    return bool(updated)
+
+
+def supported_formats():
+    """
+    Returns the variant formats which the installed Pillow can encode.
+
+    Returns:
+        list: The ``(format, mime_type, extension)`` tuples, best first.
+    """
+    Image.init()
+    return [fmt for fmt in VARIANT_FORMATS if fmt[0] in Image.SAVE]
+
+
+def variant_widths(width):
+    """
+    Returns the widths of the variants rendered for an image.
+
+    Variants are never wider than the original image.
+
+    Args:
+        width (int): The width of the original image.
+
+    Returns:
+        list: The variant widths, largest first.
+    """
+    widths = [w for w in Ticket.IMAGE_VARIANT_WIDTHS if w < width]
+    if len(widths) < len(Ticket.IMAGE_VARIANT_WIDTHS):
+        widths.append(width)
+    return sorted(widths, reverse=True)
+
+
+def render_variants(image, digest):
+    """
+    Renders and stores the variants of a decoded image.
+
+    Each width is downscaled from the previous, larger one, and the files
+    already stored for the same content are not written again.
+
+    Args:
+        image (Image): The decoded original image.
+        digest (str): The SHA-256 hex digest of the original upload.
+
+    Returns:
+        dict: The ``[name, width]`` pairs of the variants, by MIME type.
+    """
+    mode = 'RGBA' if 'A' in image.getbands() else 'RGB'
+    resized = image.convert(mode)
+    variants = {}
+    for width in variant_widths(image.width):
+        resized = resized.copy()
+        resized.thumbnail((width, resized.height))
+        for fmt, mime_type, extension in supported_formats():
+            name = f"variants/{digest[:2]}/{digest}-{width}.{extension}"
+            if not storage.ticket_image_storage.exists(name):
+                frame = resized if fmt != 'JPEG' else resized.convert('RGB')
+                buffer = io.BytesIO()
+                frame.save(buffer, fmt, quality=VARIANT_QUALITY)
+                storage.ticket_image_storage.store(
+                    name, ContentFile(buffer.getvalue())
+                )
+            variants.setdefault(mime_type, []).append([name, resized.width])
+    return variants
@@ -0,0 +1,225 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from reviews import benchmark
+
+
+class Command(BaseCommand):
+    """
+    Management command benchmarking the hot views on synthetic data sets.
+
+    For each scale, a test database is created, filled with the synthetic
+    data set of ``reviews.benchmark`` and destroyed afterwards: the
+    configured database and media files are never touched. The same seed
+    always generates the same data, so the results of two commits are
+    comparable; they are written as JSON and compared with the results of
+    a former run given with ``--baseline``.
+
+    With ``--concurrency``, the flux is also read by several threads while
+    others write reviews, on a database file. Run it once per settings
+    module to compare the database profiles, for instance with
+    ``DJANGO_SETTINGS_MODULE=config.settings_production``, which also needs
+    ``DJANGO_SECRET_KEY``.
+
+    Usage:
+        python manage.py benchmark [--scale {small,medium,large} ...]
+            [--requests N] [--warmup N] [--profiled N] [--seed N]
+            [--concurrency] [--readers N] [--writers N] [--duration SECONDS]
+            [--output FILE] [--baseline FILE]
+    """
+
+    help = "Benchmarks the flux, posts, subscription and creation views."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            action='append',
+            dest='scales',
+            choices=list(benchmark.SCALES),
+            help="Data scale to benchmark (repeatable, default: small).",
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=50,
+            help="Number of timed requests per view.",
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=5,
+            help="Number of untimed requests sent to each view first.",
+        )
+        parser.add_argument(
+            '--profiled',
+            type=int,
+            default=10,
+            help="Number of requests measuring the queries and memory.",
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help="Seed of the synthetic data generator.",
+        )
+        parser.add_argument(
+            '--concurrency',
+            action='store_true',
+            help="Also measure the flux reads during concurrent writes.",
+        )
+        parser.add_argument(
+            '--readers',
+            type=int,
+            default=4,
+            help="Number of threads reading the flux in the concurrency run.",
+        )
+        parser.add_argument(
+            '--writers',
+            type=int,
+            default=1,
+            help="Number of threads writing in the concurrency run.",
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=5.0,
+            help="Seconds of the concurrency run.",
+        )
+        parser.add_argument(
+            '--output',
+            help="JSON file to write the results to, instead of stdout.",
+        )
+        parser.add_argument(
+            '--baseline',
+            help="JSON results of a former run to compare with.",
+        )
+
+    def handle(self, *args, **options):
+        results = {
+            'created': datetime.datetime.now(
+                datetime.timezone.utc
+            ).isoformat(),
+            'commit': self.commit(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'database_options': connection.settings_dict['OPTIONS'],
+                'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+                'debug': settings.DEBUG,
+            },
+            'options': {
+                key: options[key]
+                for key in (
+                    'requests',
+                    'warmup',
+                    'profiled',
+                    'seed',
+                    'concurrency',
+                    'readers',
+                    'writers',
+                    'duration',
+                )
+            },
+            'scales': {},
+        }
+        setup_test_environment()
+        try:
+            with tempfile.TemporaryDirectory() as media_root:
+                with override_settings(
+                    MEDIA_ROOT=media_root, TICKET_IMAGE_WORKERS=0
+                ):
+                    for scale in options['scales'] or ['small']:
+                        results['scales'][scale] = self.benchmark(
+                            scale, options, media_root
+                        )
+        finally:
+            teardown_test_environment()
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                self.report(benchmark.compare(json.load(file), results))
+
+    def benchmark(self, scale, options, directory):
+        self.stderr.write(f"Generating the {scale} data set...")
+        if options['concurrency'] and connection.vendor == 'sqlite':
+            # Concurrent connections need a database file, not the default
+            # in-memory test database.
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                directory, 'benchmark.sqlite3'
+            )
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            start = time.perf_counter()
+            data = benchmark.generate(
+                benchmark.SCALES[scale], seed=options['seed']
+            )
+            generation = time.perf_counter() - start
+            self.stderr.write(f"Benchmarking the {scale} data set...")
+            scenarios = benchmark.run(
+                requests=options['requests'],
+                warmup=options['warmup'],
+                profiled=options['profiled'],
+            )
+            concurrency = None
+            if options['concurrency']:
+                self.stderr.write(
+                    f"Writing concurrently to the {scale} data set..."
+                )
+                concurrency = benchmark.run_concurrent(
+                    readers=options['readers'],
+                    writers=options['writers'],
+                    duration=options['duration'],
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        return {
+            'data': data,
+            'generation_seconds': round(generation, 2),
+            'scenarios': scenarios,
+            'concurrency': concurrency,
+        }
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'],
+                cwd=settings.BASE_DIR,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def report(self, changes):
+        for scale, name, metric, before, after, change, worse in changes:
+            line = (
+                f"{scale:8} {name:20} {metric:12} "
+                f"{before:>10} -> {after:>10} ({change:+.1%})"
+            )
+            if worse and abs(change) > 0.1:
+                line = self.style.WARNING(line)
+            self.stderr.write(line)
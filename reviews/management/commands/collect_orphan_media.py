@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from reviews import storage
+
+
+class Command(BaseCommand):
+    """
+    Management command deleting the media files which no ticket references.
+
+    The images and variants of deleted tickets, the former images of edited
+    tickets and the temporary files of interrupted uploads are all removed,
+    as long as they are older than the minimum age.
+
+    Usage:
+        python manage.py collect_orphan_media [--min-age SECONDS] [--dry-run]
+    """
+
+    help = "Deletes the ticket images and variants no ticket references."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=settings.TICKET_IMAGE_GC_GRACE,
+            help="Age in seconds below which a file is always kept.",
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="List the orphaned files without deleting them.",
+        )
+
+    def handle(self, *args, **options):
+        orphans = storage.collect_orphans(
+            options['min_age'], dry_run=options['dry_run']
+        )
+        for name in orphans:
+            self.stdout.write(name)
+        verb = "found" if options['dry_run'] else "deleted"
+        self.stdout.write(
+            self.style.SUCCESS(f"{len(orphans)} orphaned file(s) {verb}.")
+        )
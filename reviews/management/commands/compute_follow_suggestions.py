@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+
+from authentication.models import User
+from reviews import suggestions
+
+
+class Command(BaseCommand):
+    """
+    Management command precomputing the follow suggestions of the users.
+
+    The whole follow and review graph is read once, then the suggestions
+    are replaced batch by batch, so the command can run while the site is
+    in use. Run it periodically, for instance every night.
+
+    Usage:
+        python manage.py compute_follow_suggestions [--user USERNAME ...] [--batch-size N]
+    """
+
+    help = "Precomputes the follow suggestions shown on the subscription page."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            action='append',
+            dest='usernames',
+            help="Only compute the suggestions of this user (repeatable).",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=suggestions.BATCH_SIZE,
+            help="Number of users whose suggestions are replaced at once.",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['usernames']:
+            usernames = [name.lower() for name in options['usernames']]
+            user_ids = User.objects.filter(
+                username__in=usernames, is_active=True
+            ).values_list('id', flat=True)
+        users = count = 0
+        for batch_users, batch_count in suggestions.rebuild(
+            user_ids, batch_size=options['batch_size']
+        ):
+            users += batch_users
+            count += batch_count
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{users} user(s) done.")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{count} suggestion(s) computed for {users} user(s)."
+            )
+        )
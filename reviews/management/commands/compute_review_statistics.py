@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from reviews import text
+from reviews.models import Review
+
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    """
+    Management command computing the text statistics of the reviews.
+
+    The reviews are read by ranges of ids, with only their id, body and
+    current statistics, and the changed rows of each range are written back
+    in one short transaction, so the command can backfill a large database
+    while the site keeps running.
+
+    Usage:
+        python manage.py compute_review_statistics [--batch-size N]
+    """
+
+    help = "Computes the word count and reading time of the reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help="Number of review ids covered by each transaction.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = Review.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        updated = 0
+        for start in range(0, last_id + 1, batch_size):
+            reviews = Review.objects.filter(
+                pk__gte=start, pk__lt=start + batch_size
+            ).only('id', 'body', 'word_count', 'reading_time')
+            changed = []
+            for review in reviews:
+                word_count = text.word_count(review.body)
+                reading_time = text.reading_time(word_count)
+                if (review.word_count, review.reading_time) != (
+                    word_count,
+                    reading_time,
+                ):
+                    review.word_count = word_count
+                    review.reading_time = reading_time
+                    changed.append(review)
+            with transaction.atomic():
+                Review.objects.bulk_update(
+                    changed, ['word_count', 'reading_time']
+                )
+            updated += len(changed)
+        self.stdout.write(self.style.SUCCESS(f"{updated} review(s) updated."))
@@ -0,0 +1,66 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from reviews import transfer
+
+
+class Command(BaseCommand):
+    """
+    Management command exporting the users, tickets, reviews and follows.
+
+    The rows are written as JSON Lines to a file, or to the standard output
+    with '-', or as one CSV file per dataset in a directory. They are read
+    by pages of ids, so the export runs in constant memory on any database
+    size. The media files are not exported: copy the media directory along.
+
+    Usage:
+        python manage.py export_data PATH [--format {jsonl,csv}]
+            [--dataset {user,ticket,review,follow} ...] [--batch-size N]
+    """
+
+    help = "Exports the users, tickets, reviews and follows as JSONL or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help="JSON Lines file ('-' for stdout) or directory of CSV files.",
+        )
+        parser.add_argument(
+            '--format',
+            choices=('jsonl', 'csv'),
+            default='jsonl',
+            help="Format of the export.",
+        )
+        parser.add_argument(
+            '--dataset',
+            action='append',
+            dest='datasets',
+            choices=list(transfer.DATASETS),
+            help="Only export this dataset (repeatable).",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=transfer.BATCH_SIZE,
+            help="Number of rows read per query.",
+        )
+
+    def handle(self, *args, **options):
+        names = [
+            name
+            for name in transfer.DATASETS
+            if not options['datasets'] or name in options['datasets']
+        ]
+        path, batch_size = options['path'], options['batch_size']
+        if options['format'] == 'csv':
+            counts = transfer.write_csv(path, names, batch_size)
+        elif path == '-':
+            counts = transfer.write_jsonl(sys.stdout, names, batch_size)
+        else:
+            with open(path, 'w', encoding='utf-8') as file:
+                counts = transfer.write_jsonl(file, names, batch_size)
+        summary = ', '.join(
+            f"{count} {name}(s)" for name, count in counts.items()
+        )
+        self.stderr.write(self.style.SUCCESS(f"Exported {summary}."))
@@ -0,0 +1,99 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from reviews import images, transfer
+
+
+class Command(BaseCommand):
+    """
+    Management command importing users, tickets, reviews and follows in bulk.
+
+    The input is read in chunks of rows, each inserted by one bulk query in
+    its own transaction, so millions of rows are loaded in minutes and in
+    constant memory. The ids of the rows are kept. An interrupted import is
+    resumed by running it again with ``--ignore-conflicts``.
+
+    The imported images must already be in the media directory. They are
+    processed as their tickets are imported, or left in the queue of the
+    ``process_images`` command with ``--defer-images``. Once all the rows
+    are inserted, the follower and review counters, the book and search
+    indexes and the timelines are rebuilt, unless ``--no-rebuild`` is given
+    (when several files are imported in a row, for instance).
+
+    Usage:
+        python manage.py import_data PATH [--format {jsonl,csv}]
+            [--batch-size N] [--ignore-conflicts] [--defer-images]
+            [--no-rebuild]
+    """
+
+    help = "Imports users, tickets, reviews and follows from JSONL or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help="JSON Lines file ('-' for stdin) or directory of CSV files.",
+        )
+        parser.add_argument(
+            '--format',
+            choices=('jsonl', 'csv'),
+            default='jsonl',
+            help="Format of the input.",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=transfer.BATCH_SIZE,
+            help="Number of rows inserted per transaction.",
+        )
+        parser.add_argument(
+            '--ignore-conflicts',
+            action='store_true',
+            help="Skip the rows whose id or unique fields are already taken.",
+        )
+        parser.add_argument(
+            '--defer-images',
+            action='store_true',
+            help="Leave the images to the process_images command.",
+        )
+        parser.add_argument(
+            '--no-rebuild',
+            action='store_true',
+            help="Do not rebuild the counters, indexes and timelines.",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if options['format'] == 'csv':
+            self.load(transfer.read_csv(path), options)
+        elif path == '-':
+            self.load(transfer.read_jsonl(sys.stdin), options)
+        else:
+            with open(path, encoding='utf-8') as file:
+                self.load(transfer.read_jsonl(file), options)
+        if not options['no_rebuild']:
+            self.rebuild(options['batch_size'])
+
+    def load(self, rows, options):
+        counts = dict.fromkeys(transfer.DATASETS, 0)
+        chunks = transfer.import_chunks(
+            rows,
+            batch_size=options['batch_size'],
+            ignore_conflicts=options['ignore_conflicts'],
+        )
+        for name, chunk, inserted in chunks:
+            counts[name] += inserted
+            if name == 'ticket' and not options['defer_images']:
+                for ticket in chunk:
+                    if ticket.image and ticket.pk is not None:
+                        images.process(ticket.pk)
+            self.stdout.write(f"{counts[name]} {name}(s) imported.")
+        summary = ', '.join(
+            f"{count} {name}(s)" for name, count in counts.items()
+        )
+        self.stdout.write(self.style.SUCCESS(f"Imported {summary}."))
+
+    def rebuild(self, batch_size):
+        for report in transfer.rebuild_derived(batch_size):
+            self.stdout.write(report)
+        self.stdout.write(self.style.SUCCESS("Derived data rebuilt."))
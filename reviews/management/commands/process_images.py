@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from reviews import images
+
+
+class Command(BaseCommand):
+    """
+    Management command processing the ticket images waiting in the queue.
+
+    It recovers the jobs lost when the server stopped before its worker
+    threads finished, and runs as a standalone worker process with
+    ``--loop`` when ``TICKET_IMAGE_WORKERS`` is set to 0.
+
+    Usage:
+        python manage.py process_images [--loop] [--interval SECONDS]
+    """
+
+    help = "Processes the ticket images waiting to be resized."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help="Keep polling the queue instead of exiting once it is empty.",
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help="Seconds to wait between two polls in loop mode.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            count = 0
+            for ticket_id in images.pending().values_list('id', flat=True):
+                try:
+                    count += images.process(ticket_id)
+                except Exception as exc:
+                    self.stderr.write(f"Ticket {ticket_id}: {exc}")
+            if count:
+                self.stdout.write(f"{count} image(s) processed.")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
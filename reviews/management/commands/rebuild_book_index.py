@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from reviews import books
+
+
+class Command(BaseCommand):
+    """
+    Management command rebuilding the book keys and trigrams of the tickets.
+
+    Run it once after the migration which adds the book index, and whenever
+    the normalization of the titles changes. The tickets are processed by
+    ranges of ids, one transaction per range.
+
+    Usage:
+        python manage.py rebuild_book_index [--batch-size N]
+    """
+
+    help = "Rebuilds the book keys and trigram index of the tickets."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=books.BATCH_SIZE,
+            help="Number of ticket ids covered by each transaction.",
+        )
+
+    def handle(self, *args, **options):
+        indexed = books.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{indexed} ticket(s) indexed."))
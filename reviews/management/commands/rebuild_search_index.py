@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from reviews import search
+
+
+class Command(BaseCommand):
+    """
+    Management command rebuilding the full-text search index of the posts.
+
+    The index is maintained on each save and delete; this command recovers
+    from writes made without the signals, such as raw SQL or bulk imports.
+
+    Usage:
+        python manage.py rebuild_search_index
+    """
+
+    help = "Rebuilds the full-text search index of the tickets and reviews."
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            self.stdout.write("No search index on this database backend.")
+            return
+        with transaction.atomic():
+            search.rebuild()
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
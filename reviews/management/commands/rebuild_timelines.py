@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from authentication.models import User
+from reviews import timeline
+
+
+class Command(BaseCommand):
+    """
+    Management command rebuilding the materialized flux timelines.
+
+    Each timeline is rebuilt in its own transaction from the posts and the
+    subscriptions, so the command can run while the site is in use. It must
+    be run after enabling ``FLUX_TIMELINE`` or after changing
+    ``FLUX_FANOUT_MAX_FOLLOWERS``: when all the timelines are rebuilt, the
+    fan-out mode of every author is first set from their follower count.
+
+    Usage:
+        python manage.py rebuild_timelines [--user USERNAME ...] [--batch-size N]
+    """
+
+    help = "Rebuilds the materialized flux timelines of the users."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            action='append',
+            dest='usernames',
+            help="Only rebuild the timeline of this user (repeatable).",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=timeline.BATCH_SIZE,
+            help="Number of timeline entries inserted per query.",
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['usernames']:
+            usernames = [name.lower() for name in options['usernames']]
+            users = users.filter(username__in=usernames)
+        else:
+            switched = timeline.update_modes()
+            self.stdout.write(f"{switched} author mode(s) switched.")
+        count = 0
+        for user_id in users.values_list('id', flat=True).iterator():
+            timeline.rebuild(user_id, batch_size=options['batch_size'])
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"{count} timeline(s) rebuilt."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from reviews import counters
+
+
+class Command(BaseCommand):
+    """
+    Management command recomputing the denormalized counters of the tickets.
+
+    The review counters, rating totals and rating histograms are all
+    recomputed from the reviews. The tickets are processed by ranges of ids, one short UPDATE per range,
+    so the command can run on a large database without downtime.
+
+    Usage:
+        python manage.py reconcile_ticket_counters [--batch-size N]
+    """
+
+    help = "Recomputes the review counters and ratings of the tickets."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=counters.BATCH_SIZE,
+            help="Number of ticket ids covered by each query.",
+        )
+
+    def handle(self, *args, **options):
+        fixed = counters.reconcile(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{fixed} ticket(s) fixed."))
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reviews", "0003_feed_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ticket",
+            name="image_ready",
+            field=models.BooleanField(
+                default=True,
+                help_text="False while the image is waiting to be processed.",
+            ),
+        ),
+    ]
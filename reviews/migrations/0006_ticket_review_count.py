@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:29
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def count_reviews(apps, schema_editor):
+    Ticket = apps.get_model("reviews", "Ticket")
+    Review = apps.get_model("reviews", "Review")
+    review_count = (
+        Review.objects.filter(ticket=OuterRef("pk"))
+        .order_by()
+        .values("ticket")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    Ticket.objects.filter(
+        pk__in=Review.objects.values("ticket")
+    ).update(review_count=Subquery(review_count))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reviews", "0005_ticket_image_variants"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ticket",
+            name="review_count",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Number of reviews written for this ticket."
+            ),
+        ),
+        migrations.RunPython(count_reviews, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="ticket",
+            name="has_review",
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE reviews_search USING fts5("
+        "author, title, text, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO reviews_search (rowid, author, title, text) "
+        "SELECT 2 * id, 'u' || user_id, title, description FROM reviews_ticket"
+    )
+    schema_editor.execute(
+        "INSERT INTO reviews_search (rowid, author, title, text) "
+        "SELECT 2 * id + 1, 'u' || user_id, headline, body FROM reviews_review"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE reviews_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reviews", "0006_ticket_review_count"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
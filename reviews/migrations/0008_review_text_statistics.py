@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reviews", "0007_search_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="review",
+            name="reading_time",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Estimated reading time of the body, in minutes."
+            ),
+        ),
+        migrations.AddField(
+            model_name="review",
+            name="word_count",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Number of words of the body, computed on save."
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(
+                fields=["-word_count", "-id"], name="review_word_count_idx"
+            ),
+        ),
+    ]
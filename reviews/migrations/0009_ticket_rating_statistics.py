@@ -0,0 +1,93 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:43
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+
+
+def compute_rating_statistics(apps, schema_editor):
+    Ticket = apps.get_model("reviews", "Ticket")
+    Review = apps.get_model("reviews", "Review")
+    reviews = Review.objects.order_by()
+    rating_total = (
+        reviews.filter(ticket=OuterRef("pk"))
+        .values("ticket")
+        .annotate(total=Sum("rating"))
+        .values("total")
+    )
+    Ticket.objects.filter(pk__in=reviews.values("ticket")).update(
+        rating_total=Subquery(rating_total)
+    )
+    for rating in range(0, 6):
+        rated = reviews.filter(rating=rating)
+        rating_count = (
+            rated.filter(ticket=OuterRef("pk"))
+            .values("ticket")
+            .annotate(count=Count("id"))
+            .values("count")
+        )
+        Ticket.objects.filter(pk__in=rated.values("ticket")).update(
+            **{f"rating_{rating}": Subquery(rating_count)}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reviews", "0008_review_text_statistics"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ticket",
+            name="rating_0",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Number of reviews rated 0."
+            ),
+        ),
+        migrations.AddField(
+            model_name="ticket",
+            name="rating_1",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Number of reviews rated 1."
+            ),
+        ),
+        migrations.AddField(
+            model_name="ticket",
+            name="rating_2",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Number of reviews rated 2."
+            ),
+        ),
+        migrations.AddField(
+            model_name="ticket",
+            name="rating_3",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Number of reviews rated 3."
+            ),
+        ),
+        migrations.AddField(
+            model_name="ticket",
+            name="rating_4",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Number of reviews rated 4."
+            ),
+        ),
+        migrations.AddField(
+            model_name="ticket",
+            name="rating_5",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Number of reviews rated 5."
+            ),
+        ),
+        migrations.AddField(
+            model_name="ticket",
+            name="rating_total",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Sum of the ratings of the reviews of this ticket.",
+            ),
+        ),
+        migrations.RunPython(
+            compute_rating_statistics, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reviews", "0009_ticket_rating_statistics"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ticket",
+            name="book_key",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="Normalized words of the title, computed on save.",
+                max_length=255,
+            ),
+        ),
+        migrations.CreateModel(
+            name="BookTrigram",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("trigram", models.CharField(max_length=3)),
+                (
+                    "ticket",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="trigrams",
+                        to="reviews.ticket",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("trigram", "ticket"), name="unique_book_trigram"
+                    )
+                ],
+            },
+        ),
+    ]
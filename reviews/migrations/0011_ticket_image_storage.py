@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:11
+
+import reviews.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reviews", "0010_book_index"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="ticket",
+            name="image",
+            field=models.ImageField(
+                blank=True,
+                db_index=True,
+                help_text="Each ticket can have an image, but he can be blank.",
+                null=True,
+                storage=reviews.storage.get_ticket_image_storage,
+                upload_to="",
+            ),
+        ),
+    ]
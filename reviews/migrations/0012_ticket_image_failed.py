@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reviews", "0011_ticket_image_storage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ticket",
+            name="image_failed",
+            field=models.BooleanField(
+                default=False, help_text="True if the image could not be processed."
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:01
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reviews", "0012_ticket_image_failed"),
+    ]
+
+    # The columns are unchanged: only the Python default differs, so the
+    # tables are not rebuilt.
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name="review",
+                    name="time_created",
+                    field=models.DateTimeField(
+                        default=django.utils.timezone.now, editable=False
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="ticket",
+                    name="time_created",
+                    field=models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        help_text="ticket creation date is automatically filled in.",
+                    ),
+                ),
+            ],
+        ),
+    ]
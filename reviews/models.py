@@ -1,8 +1,15 @@
+import io
+
+from django.core.files.base import ContentFile
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from PIL import Image
 
+from . import text
+from .storage import get_ticket_image_storage
+
 
 class Ticket(models.Model):
     title = models.CharField(
@@ -22,27 +29,148 @@ class Ticket(models.Model):
     image = models.ImageField(
         null=True,
         blank=True,
+        db_index=True,
+        storage=get_ticket_image_storage,
         help_text="Each ticket can have an image, but he can be blank.",
     )
     time_created = models.DateTimeField(
-        auto_now_add=True,
+        default=timezone.now,
+        editable=False,
         help_text="ticket creation date is automatically filled in.",
     )
-    has_review = models.BooleanField(
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Resized copies of the image, by MIME type.",
+    )
+    image_ready = models.BooleanField(
+        default=True,
+        help_text="False while the image is waiting to be processed.",
+    )
+    image_failed = models.BooleanField(
         default=False,
-        help_text="True, if at least one review exists for this ticket",
+        help_text="True if the image could not be processed.",
+    )
+    book_key = models.CharField(
+        max_length=255,
+        blank=True,
+        editable=False,
+        help_text="Normalized words of the title, computed on save.",
+    )
+    review_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of reviews written for this ticket.",
+    )
+    rating_total = models.PositiveIntegerField(
+        default=0,
+        help_text="Sum of the ratings of the reviews of this ticket.",
+    )
+    rating_0 = models.PositiveIntegerField(
+        default=0, help_text="Number of reviews rated 0."
+    )
+    rating_1 = models.PositiveIntegerField(
+        default=0, help_text="Number of reviews rated 1."
+    )
+    rating_2 = models.PositiveIntegerField(
+        default=0, help_text="Number of reviews rated 2."
+    )
+    rating_3 = models.PositiveIntegerField(
+        default=0, help_text="Number of reviews rated 3."
+    )
+    rating_4 = models.PositiveIntegerField(
+        default=0, help_text="Number of reviews rated 4."
+    )
+    rating_5 = models.PositiveIntegerField(
+        default=0, help_text="Number of reviews rated 5."
     )
 
     IMAGE_MAX_SIZE = (300, 300)
+    RATINGS = range(0, 6)
+    IMAGE_VARIANT_WIDTHS = (150, 300, 600)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-time_created', '-id'],
+                name='ticket_user_time_idx',
+            ),
+        ]
 
-    def resize_image(self):
-        image = Image.open(self.image)
-        image.thumbnail(self.IMAGE_MAX_SIZE)
-        image.save(self.image.path)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        ticket = super().from_db(db, field_names, values)
+        if 'image' in field_names:
+            ticket._loaded_image = ticket.image.name
+        if 'book_key' in field_names:
+            ticket._loaded_book_key = ticket.book_key
+        return ticket
 
-    def save(self, *args, **kwargs):
-        self.resize_image()
-        super().save(*args, **kwargs)
+    @property
+    def has_review(self):
+        """True, if at least one review exists for this ticket."""
+        return self.review_count > 0
+
+    @property
+    def average_rating(self):
+        """The average rating of the reviews, None without review."""
+        if not self.review_count:
+            return None
+        return self.rating_total / self.review_count
+
+    @property
+    def rating_histogram(self):
+        """The ``(rating, count, percentage)`` tuples, best rating first."""
+        histogram = []
+        for rating in reversed(self.RATINGS):
+            count = getattr(self, f'rating_{rating}')
+            percentage = 100 * count / self.review_count if count else 0
+            histogram.append((rating, count, round(percentage)))
+        return histogram
+
+    def image_changed(self):
+        """True if a new image has been set since the ticket was loaded."""
+        if not self.image:
+            return False
+        return not self.image._committed or self.image.name != getattr(
+            self, '_loaded_image', None
+        )
+
+    def book_key_changed(self):
+        """True if the book key differs from the one the ticket was loaded with."""
+        return self.book_key != getattr(self, '_loaded_book_key', None)
+
+    def resize_image(self, image=None):
+        """
+        Stores a copy of the image fitting in ``IMAGE_MAX_SIZE``.
+
+        The stored image, possibly shared by other tickets, is left
+        untouched: the copy is saved through the storage, which writes it
+        atomically under the hash of its own content.
+
+        Returns:
+            str: The name of the copy, or of the image if it already fits.
+        """
+        if image is None:
+            image = Image.open(self.image)
+        max_width, max_height = self.IMAGE_MAX_SIZE
+        if image.width <= max_width and image.height <= max_height:
+            return self.image.name
+        resized = image.copy()
+        resized.thumbnail(self.IMAGE_MAX_SIZE)
+        buffer = io.BytesIO()
+        resized.save(buffer, image.format)
+        return self.image.storage.save(
+            self.image.name, ContentFile(buffer.getvalue())
+        )
+
+    def save(self, *args, update_fields=None, **kwargs):
+        if update_fields is None or 'title' in update_fields:
+            self.book_key = text.book_key(self.title)[:255]
+            if update_fields is not None:
+                update_fields = {*update_fields, 'book_key'}
+        super().save(*args, update_fields=update_fields, **kwargs)
+        self._loaded_image = self.image.name
+        self._loaded_book_key = self.book_key
 
     def __str__(self) -> str:
         return f"{self.title} - by {self.user}"
@@ -73,17 +201,153 @@ class Review(models.Model):
         blank=True,
         help_text="The body can be blank. Body max length is 8192.",
     )
-    time_created = models.DateTimeField(auto_now_add=True)
+    time_created = models.DateTimeField(default=timezone.now, editable=False)
+    word_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of words of the body, computed on save.",
+    )
+    reading_time = models.PositiveIntegerField(
+        default=0,
+        help_text="Estimated reading time of the body, in minutes.",
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-time_created', '-id'],
+                name='review_user_time_idx',
+            ),
+            models.Index(
+                fields=['-word_count', '-id'],
+                name='review_word_count_idx',
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        review = super().from_db(db, field_names, values)
+        if 'rating' in field_names and 'ticket_id' in field_names:
+            review._loaded_rating = (review.ticket_id, review.rating)
+        return review
+
+    def rating_changed(self):
+        """True if the rating or the ticket changed since the review was loaded."""
+        loaded = getattr(self, '_loaded_rating', None)
+        return loaded is not None and loaded != (self.ticket_id, self.rating)
 
-    def _get_word_count(self):
-        return len(self.body.split(' '))
+    def update_text_statistics(self):
+        """Computes the word count and the reading time of the body."""
+        self.word_count = text.word_count(self.body)
+        self.reading_time = text.reading_time(self.word_count)
 
-    def save(self, *args, **kwargs):
-        self.word_count = self._get_word_count()
-        super().save(*args, **kwargs)
+    def save(self, *args, update_fields=None, **kwargs):
+        if update_fields is None or 'body' in update_fields:
+            self.update_text_statistics()
+            if update_fields is not None:
+                update_fields = {*update_fields, 'word_count', 'reading_time'}
+        super().save(*args, update_fields=update_fields, **kwargs)
+        if update_fields is None or {'rating', 'ticket'} & set(update_fields):
+            self._loaded_rating = (self.ticket_id, self.rating)
 
     def __str__(self) -> str:
         return (
             f"{self.headline} - by {self.user} - "
             + f"related to ticket {self.ticket.title}"
         )
+
+
+class BookTrigram(models.Model):
+    """
+    Trigram of the book key of a ticket.
+
+    The trigrams form an inverted index of the book keys: the tickets
+    sharing the most trigrams with a title are found by an indexed lookup
+    instead of comparing the title with every ticket.
+
+    Attributes:
+        trigram (CharField): Three characters of the padded book key.
+        ticket (ForeignKey): The ticket whose book key contains the trigram.
+    """
+
+    trigram = models.CharField(max_length=3)
+    ticket = models.ForeignKey(
+        to=Ticket,
+        on_delete=models.CASCADE,
+        related_name='trigrams',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['trigram', 'ticket'],
+                name='unique_book_trigram',
+            ),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """
+    Reference to a post in the materialized flux of one user.
+
+    Entries are written when a post is created (fan-out on write) and when a
+    subscription is created, so reading the flux is a single indexed range
+    scan on the owner's timeline.
+
+    Attributes:
+        owner (ForeignKey): The user whose flux contains the post.
+        author (ForeignKey): The user who wrote the post.
+        ticket (ForeignKey): The referenced ticket, if the post is a ticket.
+        review (ForeignKey): The referenced review, if the post is a review.
+        content_type (str): 'TICKET' or 'REVIEW'.
+        post_id (int): The id of the referenced ticket or review.
+        time_created (datetime): The creation date of the referenced post.
+    """
+
+    owner = models.ForeignKey(
+        to=settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    author = models.ForeignKey(
+        to=settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    ticket = models.ForeignKey(
+        to=Ticket,
+        null=True,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    review = models.ForeignKey(
+        to=Review,
+        null=True,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    content_type = models.CharField(max_length=6)
+    post_id = models.BigIntegerField()
+    time_created = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['owner', 'content_type', 'post_id'],
+                name='unique_timeline_post',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['owner', '-time_created', '-content_type', '-post_id'],
+                name='timeline_owner_time_idx',
+            ),
+        ]
+
+    @property
+    def post(self):
+        """
+        Returns the referenced ticket or review annotated with its content type.
+        """
+        post = self.ticket if self.content_type == 'TICKET' else self.review
+        post.content_type = self.content_type
+        return post
@@ -0,0 +1,322 @@
+"""
+Full-text search over the tickets and reviews.
+
+The posts are indexed in the SQLite FTS5 table ``reviews_search``, created
+by a migration and kept up to date by the save and delete signals. Each
+row holds the title (ticket title or review headline) and the text (ticket
+description or review body) of a post. Its rowid encodes the post,
+``2 * id`` for a ticket and ``2 * id + 1`` for a review, so a post is
+replaced or removed without scanning the index.
+
+The author is indexed too, as a ``u<id>`` token, so the results are
+restricted to the posts visible to the user by the same query: for a user
+following few people, the author terms are part of the MATCH expression
+and FTS5 intersects their posting lists with those of the searched terms
+before anything is ranked. Beyond ``MAX_AUTHOR_TERMS`` authors, most of
+the index is visible anyway and the author of each match is checked
+instead.
+
+Results are ranked with BM25, a match in the title weighing more than a
+match in the text. Accents and case are ignored, and a term ending with
+``*`` matches every word starting with it.
+
+The index is read and written through the connection the database routers
+choose for the posts, so writing to it pins the request to the primary.
+
+On other database backends the index does not exist and the search falls
+back to unranked, case-insensitive containment filters.
+"""
+
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from django.db.models import CharField, Q, Value
+
+from authentication import graph
+from authentication.models import UserFollows
+
+from .flux import REVIEW, TICKET, visible_to
+from .models import Review, Ticket
+
+TABLE = 'reviews_search'
+
+TITLE_WEIGHT = 10.0
+TEXT_WEIGHT = 1.0
+MAX_AUTHOR_TERMS = 64
+
+TERM_PATTERN = re.compile(r'(\w+)(\*?)')
+
+
+def is_available():
+    """
+    Tells whether the full-text index exists on the database backend.
+
+    Returns:
+        bool: True on SQLite, where the FTS5 index is maintained.
+    """
+    return connections[DEFAULT_DB_ALIAS].vendor == 'sqlite'
+
+
+def get_connection(write=False):
+    """
+    Returns the connection to the database holding the index.
+
+    The database is chosen by the routers like for the posts themselves,
+    so a request writing to the index is switched to the primary, and a
+    search reads the same database as the posts it loads.
+
+    Args:
+        write (bool): True to update the index.
+
+    Returns:
+        BaseDatabaseWrapper: The connection.
+    """
+    if write:
+        return connections[router.db_for_write(Ticket)]
+    return connections[router.db_for_read(Ticket)]
+
+
+def row_id(content_type, pk):
+    """
+    Returns the rowid of a post in the index.
+
+    Args:
+        content_type (str): 'TICKET' or 'REVIEW'.
+        pk (int): The id of the post.
+
+    Returns:
+        int: The rowid.
+    """
+    return 2 * pk + (content_type == REVIEW)
+
+
+def author_token(user_id):
+    """
+    Returns the token under which the posts of a user are indexed.
+
+    Args:
+        user_id (int): The id of the author.
+
+    Returns:
+        str: The author token.
+    """
+    return f'u{user_id}'
+
+
+def index_post(post, content_type):
+    """
+    Adds a post to the index, or replaces its indexed text.
+
+    Args:
+        post (Ticket | Review): The saved post.
+        content_type (str): 'TICKET' or 'REVIEW'.
+    """
+    if not is_available():
+        return
+    if content_type == TICKET:
+        title, text = post.title, post.description
+    else:
+        title, text = post.headline, post.body
+    with get_connection(write=True).cursor() as cursor:
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {TABLE} (rowid, author, title, text) "
+            "VALUES (%s, %s, %s, %s)",
+            [
+                row_id(content_type, post.pk),
+                author_token(post.user_id),
+                title,
+                text,
+            ],
+        )
+
+
+def remove_post(content_type, pk):
+    """
+    Removes a post from the index.
+
+    Args:
+        content_type (str): 'TICKET' or 'REVIEW'.
+        pk (int): The id of the deleted post.
+    """
+    if not is_available():
+        return
+    with get_connection(write=True).cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {TABLE} WHERE rowid = %s",
+            [row_id(content_type, pk)],
+        )
+
+
+def rebuild():
+    """
+    Rebuilds the whole index from the tickets and reviews tables.
+
+    The rows are copied by two INSERT ... SELECT statements, then the index
+    is merged into a single segment.
+    """
+    if not is_available():
+        return
+    with get_connection(write=True).cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+        cursor.execute(
+            f"INSERT INTO {TABLE} (rowid, author, title, text) "
+            f"SELECT 2 * id, 'u' || user_id, title, description "
+            f"FROM {Ticket._meta.db_table}"
+        )
+        cursor.execute(
+            f"INSERT INTO {TABLE} (rowid, author, title, text) "
+            f"SELECT 2 * id + 1, 'u' || user_id, headline, body "
+            f"FROM {Review._meta.db_table}"
+        )
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+
+
+def parse_query(text):
+    """
+    Parses the text typed by a user into its search terms.
+
+    Only the word characters are kept, so the FTS5 query syntax can never
+    be injected.
+
+    Args:
+        text (str): The search text.
+
+    Returns:
+        list: The ``(term, is_prefix)`` pairs.
+    """
+    return [(term, bool(star)) for term, star in TERM_PATTERN.findall(text)]
+
+
+def match_expression(terms):
+    """
+    Builds the FTS5 expression matching the posts containing all the terms.
+
+    The terms are only searched in the title and text columns, never in
+    the author tokens.
+
+    Args:
+        terms (list): The ``(term, is_prefix)`` pairs of ``parse_query``.
+
+    Returns:
+        str: The MATCH expression.
+    """
+    phrases = ' '.join(
+        f'"{term}"*' if is_prefix else f'"{term}"' for term, is_prefix in terms
+    )
+    return f"{{title text}} : ({phrases})"
+
+
+def visible_authors(user):
+    """
+    Returns the tokens of the authors whose posts a user can find.
+
+    Args:
+        user (User): The user searching.
+
+    Returns:
+        list | None: The author tokens of the user and of the users they
+        follow, or None if there are more than ``MAX_AUTHOR_TERMS``.
+    """
+    followed_users = graph.followees(user.pk)
+    if len(followed_users) >= MAX_AUTHOR_TERMS:
+        return None
+    authors = [author_token(user.pk)]
+    authors += [author_token(user_id) for user_id in followed_users]
+    return authors
+
+
+def search(user, text, limit=20):
+    """
+    Returns the posts visible to a user which match a search text.
+
+    Args:
+        user (User): The user searching, who sees their own posts and the
+            posts of the users they follow.
+        text (str): The search text.
+        limit (int): The maximum number of posts to return.
+
+    Returns:
+        list: The tickets and reviews annotated with their content type,
+        best match first.
+    """
+    terms = parse_query(text)
+    if not terms:
+        return []
+    if not is_available():
+        return fallback_search(user, terms, limit)
+    authors = visible_authors(user)
+    expression = match_expression(terms)
+    if authors is not None:
+        expression = f"author : ({' OR '.join(authors)}) AND {expression}"
+        author_filter, params = '', []
+    else:
+        follows = UserFollows._meta
+        author_filter = (
+            f"AND author IN (SELECT 'u' || "
+            f"{follows.get_field('followed_user').column} "
+            f"FROM {follows.db_table} "
+            f"WHERE {follows.get_field('user').column} = %s "
+            f"UNION SELECT %s) "
+        )
+        params = [user.pk, author_token(user.pk)]
+    with get_connection().cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s "
+            f"{author_filter}"
+            f"ORDER BY bm25({TABLE}, 0, %s, %s) LIMIT %s",
+            [expression, *params, TITLE_WEIGHT, TEXT_WEIGHT, limit],
+        )
+        row_ids = [row[0] for row in cursor.fetchall()]
+    tickets = Ticket.objects.select_related('user').in_bulk(
+        [rowid // 2 for rowid in row_ids if not rowid % 2]
+    )
+    reviews = Review.objects.select_related('user', 'ticket__user').in_bulk(
+        [rowid // 2 for rowid in row_ids if rowid % 2]
+    )
+    posts = []
+    for rowid in row_ids:
+        if rowid % 2:
+            post, content_type = reviews.get(rowid // 2), REVIEW
+        else:
+            post, content_type = tickets.get(rowid // 2), TICKET
+        if post is not None:
+            post.content_type = content_type
+            posts.append(post)
+    return posts
+
+
+def fallback_search(user, terms, limit):
+    """
+    Searches the posts without the full-text index, most recent first.
+
+    Args:
+        user (User): The user searching.
+        terms (list): The ``(term, is_prefix)`` pairs of ``parse_query``.
+        limit (int): The maximum number of posts to return.
+
+    Returns:
+        list: The matching tickets and reviews annotated with their
+        content type.
+    """
+    ticket_filter, review_filter = visible_to(user), visible_to(user)
+    for term, _ in terms:
+        ticket_filter &= Q(title__icontains=term) | Q(
+            description__icontains=term
+        )
+        review_filter &= Q(headline__icontains=term) | Q(body__icontains=term)
+    tickets = (
+        Ticket.objects.filter(ticket_filter)
+        .select_related('user')
+        .annotate(content_type=Value(TICKET, CharField()))
+        .order_by('-time_created')[:limit]
+    )
+    reviews = (
+        Review.objects.filter(review_filter)
+        .select_related('user', 'ticket__user')
+        .annotate(content_type=Value(REVIEW, CharField()))
+        .order_by('-time_created')[:limit]
+    )
+    posts = sorted(
+        [*tickets, *reviews], key=lambda post: post.time_created, reverse=True
+    )
+    return posts[:limit]
@@ -0,0 +1,304 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from authentication.models import UserFollows
+
+from . import (
+    books,
+    counters,
+    events,
+    fragments,
+    images,
+    search,
+    storage,
+    timeline,
+)
+from .models import Review, Ticket
+
+
+@receiver(pre_save, sender=Ticket)
+def queue_image(sender, instance, update_fields=None, **kwargs):
+    """
+    Flags the image of a ticket as waiting to be processed, if it has changed.
+
+    Saves which only change the other fields leave the image untouched.
+
+    Args:
+        sender (class): The Ticket model class.
+        instance (Ticket): The ticket being saved.
+        update_fields (frozenset | None): The fields being saved, if restricted.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    if update_fields is not None and 'image' not in update_fields:
+        instance._image_queued = False
+    else:
+        instance._image_queued = instance.image_changed()
+    if instance._image_queued:
+        instance.image_ready = False
+        instance.image_failed = False
+        instance.image_variants = {}
+
+
+@receiver(post_save, sender=Ticket)
+def process_image(sender, instance, **kwargs):
+    """
+    Hands the new image of a saved ticket to the background workers.
+
+    Args:
+        sender (class): The Ticket model class.
+        instance (Ticket): The saved ticket.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    if instance._image_queued:
+        images.schedule(instance.pk)
+
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_save, sender=Review)
+def fan_out_post(sender, instance, created, **kwargs):
+    """
+    Copies a new ticket or review into the timelines of the author's followers.
+
+    Args:
+        sender (class): The Ticket or Review model class.
+        instance (Ticket | Review): The saved post.
+        created (bool): True if the post has just been created.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    if created and timeline.is_enabled():
+        content_type = timeline.TICKET if sender is Ticket else timeline.REVIEW
+        timeline.add_post(instance, content_type)
+
+
+@receiver(post_save, sender=UserFollows)
+def backfill_timeline(sender, instance, created, **kwargs):
+    """
+    Copies the posts of a newly followed user into the follower's timeline.
+
+    The followed user stops being fanned out if the subscription takes
+    their follower count, updated by the authentication app beforehand,
+    over the threshold.
+
+    Args:
+        sender (class): The UserFollows model class.
+        instance (UserFollows): The saved subscription.
+        created (bool): True if the subscription has just been created.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    if created and timeline.is_enabled():
+        timeline.update_mode(instance.followed_user_id)
+        timeline.backfill(instance.user_id, instance.followed_user_id)
+
+
+@receiver(post_delete, sender=UserFollows)
+def purge_timeline(sender, instance, **kwargs):
+    """
+    Removes the posts of an unfollowed user from the former follower's timeline.
+
+    The unfollowed user is fanned out again if their follower count,
+    updated by the authentication app beforehand, falls back under the
+    threshold.
+
+    Args:
+        sender (class): The UserFollows model class.
+        instance (UserFollows): The deleted subscription.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    if timeline.is_enabled():
+        timeline.purge(instance.user_id, instance.followed_user_id)
+        timeline.update_mode(instance.followed_user_id)
+
+
+@receiver(post_save, sender=Review)
+def count_review(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Updates the counters and rating statistics of the ticket of a saved review.
+
+    A new review is counted; an edited review whose rating changed is moved
+    from its former rating to the new one.
+
+    Args:
+        sender (class): The Review model class.
+        instance (Review): The saved review.
+        created (bool): True if the review has just been created.
+        update_fields (frozenset | None): The fields saved, if restricted.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    if created:
+        counters.add_review(instance)
+    elif (
+        update_fields is not None and not {'rating', 'ticket'} & update_fields
+    ):
+        return
+    elif instance.rating_changed():
+        counters.change_review(instance)
+
+
+@receiver(post_delete, sender=Review)
+def uncount_review(sender, instance, **kwargs):
+    """
+    Uncounts a deleted review from the statistics of its ticket.
+
+    Args:
+        sender (class): The Review model class.
+        instance (Review): The deleted review.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    counters.remove_review(instance)
+
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_delete, sender=Ticket)
+def invalidate_ticket_fragments(sender, instance, **kwargs):
+    """
+    Invalidates the cached snippets and pages of an edited or deleted ticket.
+
+    Args:
+        sender (class): The Ticket model class.
+        instance (Ticket): The saved or deleted ticket.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    fragments.invalidate('TICKET', instance.pk)
+    fragments.invalidate_pages(instance.pk, [instance.user_id])
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review_fragments(sender, instance, **kwargs):
+    """
+    Invalidates the cached snippets and pages of an edited or deleted review.
+
+    The snippets of its ticket, and of the ticket it was moved from, are
+    invalidated too, since they display the reviews of the ticket.
+
+    Args:
+        sender (class): The Review model class.
+        instance (Review): The saved or deleted review.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    fragments.invalidate('REVIEW', instance.pk)
+    ticket_ids = {instance.ticket_id}
+    # The loaded ticket is only replaced once the review is saved.
+    loaded = getattr(instance, '_loaded_rating', None)
+    if loaded is not None:
+        ticket_ids.add(loaded[0])
+    for ticket_id in ticket_ids:
+        fragments.invalidate('TICKET', ticket_id)
+        fragments.invalidate_pages(ticket_id, [instance.user_id])
+
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_save, sender=Review)
+def publish_post(sender, instance, created, **kwargs):
+    """
+    Pushes a new ticket or review to the clients connected to the flux events.
+
+    Args:
+        sender (class): The Ticket or Review model class.
+        instance (Ticket | Review): The saved post.
+        created (bool): True if the post has just been created.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    if created:
+        content_type = timeline.TICKET if sender is Ticket else timeline.REVIEW
+        events.publish_post(instance, content_type)
+
+
+@receiver(post_save, sender=UserFollows)
+def publish_follow(sender, instance, created, **kwargs):
+    """
+    Tells the event streams of a user that they follow a new user.
+
+    Args:
+        sender (class): The UserFollows model class.
+        instance (UserFollows): The saved subscription.
+        created (bool): True if the subscription has just been created.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    if created:
+        events.publish_subscription(instance, events.FOLLOW)
+
+
+@receiver(post_delete, sender=UserFollows)
+def publish_unfollow(sender, instance, **kwargs):
+    """
+    Tells the event streams of a user that they no longer follow a user.
+
+    Args:
+        sender (class): The UserFollows model class.
+        instance (UserFollows): The deleted subscription.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    events.publish_subscription(instance, events.UNFOLLOW)
+
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_save, sender=Review)
+def index_post(sender, instance, **kwargs):
+    """
+    Indexes the text of a saved ticket or review for the search.
+
+    Args:
+        sender (class): The Ticket or Review model class.
+        instance (Ticket | Review): The saved post.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    content_type = timeline.TICKET if sender is Ticket else timeline.REVIEW
+    search.index_post(instance, content_type)
+
+
+@receiver(post_delete, sender=Ticket)
+@receiver(post_delete, sender=Review)
+def unindex_post(sender, instance, **kwargs):
+    """
+    Removes a deleted ticket or review from the search index.
+
+    Args:
+        sender (class): The Ticket or Review model class.
+        instance (Ticket | Review): The deleted post.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    content_type = timeline.TICKET if sender is Ticket else timeline.REVIEW
+    search.remove_post(content_type, instance.pk)
+
+
+@receiver(post_save, sender=Ticket)
+def index_book(sender, instance, **kwargs):
+    """
+    Indexes the trigrams of the book key of a ticket, if it has changed.
+
+    Args:
+        sender (class): The Ticket model class.
+        instance (Ticket): The saved ticket.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    if instance.book_key_changed():
+        books.index_ticket(instance)
+
+
+@receiver(post_save, sender=Ticket)
+def collect_replaced_image(sender, instance, **kwargs):
+    """
+    Deletes the former image of a ticket if no other ticket references it.
+
+    Args:
+        sender (class): The Ticket model class.
+        instance (Ticket): The saved ticket.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    former_image = getattr(instance, '_loaded_image', None)
+    if former_image and former_image != instance.image.name:
+        storage.schedule_collection(former_image)
+
+
+@receiver(post_delete, sender=Ticket)
+def collect_deleted_image(sender, instance, **kwargs):
+    """
+    Deletes the image of a deleted ticket if no other ticket references it.
+
+    Args:
+        sender (class): The Ticket model class.
+        instance (Ticket): The deleted ticket.
+        **kwargs: Additional keyword arguments sent with the signal.
+    """
+    storage.schedule_collection(instance.image.name)
@@ -0,0 +1,278 @@
+"""
+Content-addressed storage of the ticket images.
+
+An uploaded image is stored under the SHA-256 hash of its content, in two
+levels of sharded directories: ``images/<hash[0:2]>/<hash[2:4]>/<hash>.<ext>``.
+No directory grows beyond a few hundred entries, and identical covers
+uploaded by different users are stored once and shared by their tickets.
+
+A file is referenced by every ticket whose ``image`` holds its name, so its
+reference count is an indexed query rather than a counter to keep in sync.
+When a ticket is deleted or its image replaced, the former file is removed
+once the transaction is committed, unless another ticket still references
+it. Files deduplicated recently are kept for ``TICKET_IMAGE_GC_GRACE``
+seconds, so an upload being committed never loses its file. The upload
+replaced by its resized copy is collected at once instead, unless it has
+been written or deduplicated since the worker read it.
+
+``collect_orphans`` sweeps the whole media directory for the files that no
+ticket references, including the resized variants and the images uploaded
+before this storage, and is run by the ``collect_orphan_media`` command.
+"""
+
+import hashlib
+import os
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+
+HASHED_NAME = re.compile(r'images/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})')
+EXTENSION = re.compile(r'\.[a-z0-9]{1,5}')
+EXTENSION_ALIASES = {'.jpeg': '.jpg', '.jpe': '.jpg', '.tif': '.tiff'}
+
+
+class TicketImageStorage(FileSystemStorage):
+    """
+    File system storage naming the files after the hash of their content.
+
+    Saving a content which is already stored returns the existing name
+    without writing anything. New files are written under a temporary
+    name, then atomically renamed, so concurrent uploads of the same
+    content never expose a partial file.
+    """
+
+    def hashed_name(self, name, content):
+        """
+        Returns the content-addressed name of a file.
+
+        Args:
+            name (str): The original name, whose extension is kept in its
+                canonical spelling.
+            content (File): The content of the file.
+
+        Returns:
+            str: The sharded name of the content.
+        """
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        extension = EXTENSION_ALIASES.get(extension, extension)
+        if not EXTENSION.fullmatch(extension):
+            extension = ''
+        return f'images/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        name = self.hashed_name(name, content)
+        return super().save(name, content, max_length=max_length)
+
+    def store(self, name, content):
+        """
+        Stores a file under a name already derived from its content.
+
+        Used for the files computed from an image, such as its variants:
+        the file is written once, even by concurrent workers.
+
+        Args:
+            name (str): The content-addressed name of the file.
+            content (File): The content of the file.
+
+        Returns:
+            str: The name of the stored file.
+        """
+        return super().save(name, content)
+
+    def get_available_name(self, name, max_length=None):
+        # Identical names hold identical contents: the name is never taken.
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            self.touch(name)
+            return name
+        temporary_name = super()._save(
+            f'{name}.{uuid.uuid4().hex}.tmp', content
+        )
+        os.replace(self.path(temporary_name), self.path(name))
+        return name
+
+    def touch(self, name):
+        """
+        Marks a stored file as just used, protecting it from the collection.
+
+        Args:
+            name (str): The name of the file.
+        """
+        os.utime(self.path(name))
+
+
+def get_ticket_image_storage():
+    """
+    Returns the storage of the ticket images.
+
+    Returns:
+        TicketImageStorage: The storage, located in ``MEDIA_ROOT``.
+    """
+    return ticket_image_storage
+
+
+ticket_image_storage = TicketImageStorage()
+
+
+def content_hash(name):
+    """
+    Returns the content hash of a content-addressed file name.
+
+    Args:
+        name (str): The name of a ticket image.
+
+    Returns:
+        str | None: The SHA-256 hex digest, or None for the images stored
+        under their original name.
+    """
+    match = HASHED_NAME.match(name or '')
+    return match.group(1) if match else None
+
+
+def is_referenced(name):
+    """
+    Tells whether a ticket references a stored image.
+
+    Args:
+        name (str): The name of the image.
+
+    Returns:
+        bool: True if at least one ticket has this image.
+    """
+    from .models import Ticket
+
+    return Ticket.objects.filter(image=name).exists()
+
+
+def is_recent(name, grace_period):
+    """
+    Tells whether a file has been written or deduplicated recently.
+
+    Args:
+        name (str): The name of the file.
+        grace_period (int): The age, in seconds, below which a file is recent.
+
+    Returns:
+        bool: True if the file is younger than the grace period.
+    """
+    try:
+        modified = os.path.getmtime(ticket_image_storage.path(name))
+    except FileNotFoundError:
+        return False
+    return time.time() - modified < grace_period
+
+
+def modified_time(name):
+    """
+    Returns the time a file was last written or deduplicated.
+
+    Args:
+        name (str): The name of the file.
+
+    Returns:
+        float | None: The modification timestamp, or None if the file does
+        not exist.
+    """
+    try:
+        return os.path.getmtime(ticket_image_storage.path(name))
+    except FileNotFoundError:
+        return None
+
+
+def collect(name, unchanged_since=None):
+    """
+    Deletes a ticket image which is no longer referenced.
+
+    Args:
+        name (str): The name of the image of a deleted or edited ticket.
+        unchanged_since (float | None): The modification time of the file
+            when the caller replaced it. If set, the file is deleted unless
+            it has been written or deduplicated since, instead of being
+            kept for ``TICKET_IMAGE_GC_GRACE`` seconds.
+
+    Returns:
+        bool: True if the file has been deleted.
+    """
+    if not name or is_referenced(name):
+        return False
+    if unchanged_since is None:
+        if is_recent(name, settings.TICKET_IMAGE_GC_GRACE):
+            return False
+    elif modified_time(name) != unchanged_since:
+        return False
+    ticket_image_storage.delete(name)
+    return True
+
+
+def schedule_collection(name, unchanged_since=None):
+    """
+    Collects a former ticket image once the transaction is committed.
+
+    Args:
+        name (str): The name of the image.
+        unchanged_since (float | None): See ``collect``.
+    """
+    if name:
+        transaction.on_commit(lambda: collect(name, unchanged_since))
+
+
+def referenced_names():
+    """
+    Returns the names of all the files referenced by the tickets.
+
+    Returns:
+        set: The names of the images and of their variants.
+    """
+    from .models import Ticket
+
+    names = set()
+    tickets = Ticket.objects.values_list('image', 'image_variants')
+    for image, variants in tickets.iterator(chunk_size=2000):
+        if image:
+            names.add(image)
+        for files in variants.values():
+            names.update(file_name for file_name, _ in files)
+    return names
+
+
+def collect_orphans(min_age, dry_run=False):
+    """
+    Deletes the media files which no ticket references.
+
+    The referenced names are read before the media directory is walked, and
+    only the files older than ``min_age`` are deleted, so the files of the
+    tickets created during the sweep are never touched.
+
+    Args:
+        min_age (int): The age, in seconds, below which a file is kept.
+        dry_run (bool): If True, only list the orphans.
+
+    Returns:
+        list: The names of the orphaned files.
+    """
+    referenced = referenced_names()
+    root = ticket_image_storage.location
+    orphans = []
+    for directory, _, file_names in os.walk(root):
+        for file_name in file_names:
+            path = os.path.join(directory, file_name)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            if name in referenced or is_recent(name, min_age):
+                continue
+            orphans.append(name)
+            if not dry_run:
+                ticket_image_storage.delete(name)
+    return orphans
@@ -0,0 +1,154 @@
+"""
+Offline computation of the follow suggestions.
+
+A user is suggested the users followed by the users they follow (friends
+of friends) and the users who reviewed the same tickets as them. The
+score of a candidate weighs the number of followed users who follow them,
+``MUTUAL_WEIGHT`` each, and the number of tickets both reviewed,
+``SHARED_REVIEW_WEIGHT`` each. The tickets reviewed by more than
+``settings.FOLLOW_SUGGESTIONS_MAX_REVIEWERS`` users say little about a
+taste and would make the count quadratic, so they are left out.
+
+The graph is read once, with one query per relation, into sorted id
+arrays: the followed users and the reviewed tickets of each user, and the
+reviewers of each ticket. The candidates of a user are counted by
+``Counter.update`` over these arrays, a loop run in C, so no query is
+issued per user. The best ``settings.FOLLOW_SUGGESTIONS_COUNT`` candidates
+of each user replace their former suggestions, ``BATCH_SIZE`` users per
+transaction, and the subscription page reads them from the table.
+"""
+
+import heapq
+from array import array
+from collections import Counter
+from itertools import groupby, islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+
+from authentication.models import FollowSuggestion, User, UserFollows
+
+from .models import Review
+
+BATCH_SIZE = 1000
+MUTUAL_WEIGHT = 1.0
+SHARED_REVIEW_WEIGHT = 0.5
+
+EMPTY = array('q')
+
+
+class Graph:
+    """
+    Follow and review graph of all the users.
+
+    Attributes:
+        active (set): The ids of the active users, the only ones suggested.
+        followees (dict): The sorted ids of the users followed by each user.
+        reviewed (dict): The sorted ids of the tickets reviewed by each user.
+        reviewers (dict): The sorted ids of the reviewers of each ticket.
+    """
+
+    def __init__(self):
+        self.active = set(
+            User.objects.filter(is_active=True).values_list('id', flat=True)
+        )
+        self.followees = adjacency(
+            UserFollows.objects, 'user_id', 'followed_user_id'
+        )
+        self.reviewed = adjacency(Review.objects, 'user_id', 'ticket_id')
+        self.reviewers = adjacency(Review.objects, 'ticket_id', 'user_id')
+
+    def suggest(self, user_id, limit):
+        """
+        Ranks the users who could interest a user.
+
+        Args:
+            user_id (int): The id of the user.
+            limit (int): The maximum number of suggestions.
+
+        Returns:
+            list: The unsaved FollowSuggestion instances, best first.
+        """
+        followees = self.followees.get(user_id, EMPTY)
+        mutual = Counter()
+        for followee_id in followees:
+            mutual.update(self.followees.get(followee_id, EMPTY))
+        shared = Counter()
+        for ticket_id in self.reviewed.get(user_id, EMPTY):
+            reviewers = self.reviewers[ticket_id]
+            if len(reviewers) <= settings.FOLLOW_SUGGESTIONS_MAX_REVIEWERS:
+                shared.update(reviewers)
+        candidates = (mutual.keys() | shared.keys()) & self.active
+        candidates -= {user_id, *followees}
+        scores = {
+            candidate: MUTUAL_WEIGHT * mutual[candidate]
+            + SHARED_REVIEW_WEIGHT * shared[candidate]
+            for candidate in candidates
+        }
+        best = heapq.nsmallest(
+            limit,
+            scores,
+            key=lambda candidate: (-scores[candidate], candidate),
+        )
+        return [
+            FollowSuggestion(
+                user_id=user_id,
+                suggested_user_id=candidate,
+                score=scores[candidate],
+                mutual_count=mutual[candidate],
+                shared_review_count=shared[candidate],
+            )
+            for candidate in best
+        ]
+
+
+def adjacency(queryset, key, value):
+    """
+    Reads a relation between ids into sorted id arrays.
+
+    Args:
+        queryset (QuerySet): The rows of the relation.
+        key (str): The column whose ids key the arrays.
+        value (str): The column whose ids fill the arrays.
+
+    Returns:
+        dict: The sorted, distinct ``value`` ids, by ``key`` id.
+    """
+    pairs = queryset.order_by(key, value).values_list(key, value).distinct()
+    lists = {}
+    rows = pairs.iterator(chunk_size=BATCH_SIZE * 10)
+    for key_id, group in groupby(rows, key=itemgetter(0)):
+        lists[key_id] = array('q', map(itemgetter(1), group))
+    return lists
+
+
+def rebuild(user_ids=None, batch_size=BATCH_SIZE):
+    """
+    Recomputes the follow suggestions of the active users.
+
+    Args:
+        user_ids (iterable | None): The ids of the users to update, all
+            the active users if None.
+        batch_size (int): The number of users updated per transaction.
+
+    Yields:
+        tuple: The number of users and of suggestions of each batch.
+    """
+    graph = Graph()
+    if user_ids is None:
+        FollowSuggestion.objects.filter(user__is_active=False).delete()
+        user_ids = graph.active
+    user_ids = iter(sorted(user_ids))
+    while batch := list(islice(user_ids, batch_size)):
+        suggestions = []
+        for user_id in batch:
+            suggestions += graph.suggest(
+                user_id, settings.FOLLOW_SUGGESTIONS_COUNT
+            )
+        with transaction.atomic():
+            FollowSuggestion.objects.filter(user__in=batch).delete()
+            FollowSuggestion.objects.bulk_create(
+                suggestions, batch_size=batch_size
+            )
+        yield len(batch), len(suggestions)
@@ -1,9 +1,31 @@
 from django import template
+from reviews.storage import ticket_image_storage
 
 register = template.Library()
 
+PICTURE_SIZES = "(max-width: 600px) 90vw, 300px"
+
 
 @register.filter(name='stars')
 def stars(rating, max=5):
     """Turns a note into a chain of stars."""
     return " ".join("★" if i <= rating else "✩" for i in range(1, max + 1))
+
+
+@register.inclusion_tag('reviews/ticket_picture.html')
+def ticket_picture(ticket, sizes=PICTURE_SIZES):
+    """Renders the image of a ticket with the srcset of its variants."""
+    srcsets = {
+        mime_type: ", ".join(
+            f"{ticket_image_storage.url(name)} {width}w"
+            for name, width in files
+        )
+        for mime_type, files in ticket.image_variants.items()
+    }
+    fallback = srcsets.pop('image/jpeg', '')
+    return {
+        'src': ticket.image.url,
+        'srcset': fallback,
+        'sources': srcsets.items(),
+        'sizes': sizes,
+    }
@@ -0,0 +1,1215 @@
+import io
+import json
+import os
+import tempfile
+import time
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Q
+from django.http import HttpRequest, HttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from authentication import graph
+from authentication.models import User, UserFollows
+from config import routers
+
+from . import books, flux, fragments, images, search, storage
+from .models import Review, Ticket, TimelineEntry
+
+
+class FluxQueryCountTests(TestCase):
+    """
+    The number of queries of the flux and posts pages does not depend on the
+    number of followed users and of posts.
+    """
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.reader = User.objects.create(username='reader')
+        self.client.force_login(self.reader)
+        self.authors = 0
+        self.posts = 0
+
+    def follow_authors(self, count):
+        """
+        Makes the reader follow new authors, each with a ticket and a review.
+
+        Args:
+            count (int): The number of authors to create.
+        """
+        for index in range(self.authors, self.authors + count):
+            author = User.objects.create(username=f'author{index}')
+            UserFollows.objects.create(user=self.reader, followed_user=author)
+            ticket = Ticket.objects.create(title=f'Book {index}', user=author)
+            Review.objects.create(
+                ticket=ticket,
+                user=author,
+                rating=index % 6,
+                headline=f'Review {index}',
+                body='Body',
+            )
+        self.authors += count
+
+    def write_posts(self, count):
+        """
+        Makes the reader write new tickets with an image, processed every
+        other one, and review the tickets of other users.
+
+        Args:
+            count (int): The number of tickets and of reviews to create.
+        """
+        for index in range(self.posts, self.posts + count):
+            buffer = io.BytesIO()
+            Image.new('RGB', (8, 8), (index, 0, 0)).save(buffer, 'PNG')
+            ticket = Ticket(title=f'Cover {index}', user=self.reader)
+            ticket.image.save('cover.png', ContentFile(buffer.getvalue()))
+            if index % 2:
+                images.process(ticket.pk)
+            writer = User.objects.create(username=f'writer{index}')
+            ticket = Ticket.objects.create(title=f'Essay {index}', user=writer)
+            Review.objects.create(
+                ticket=ticket,
+                user=self.reader,
+                rating=index % 6,
+                headline=f'Answer {index}',
+            )
+        self.posts += count
+
+    def count_queries(self, name):
+        """
+        Reads a page twice, with cold then warm caches.
+
+        Args:
+            name (str): The name of the URL of the page.
+
+        Returns:
+            tuple: The number of queries of each read.
+        """
+        counts = []
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(queries))
+        return tuple(counts)
+
+    def assert_flat_query_count(self, name, add_posts):
+        add_posts(2)
+        cold, warm = self.count_queries(name)
+        add_posts(30)
+        with self.assertNumQueries(cold):
+            self.client.get(reverse(name))
+        with self.assertNumQueries(warm):
+            self.client.get(reverse(name))
+
+    def test_flat_query_count(self):
+        self.assert_flat_query_count('home', self.follow_authors)
+
+    @override_settings(FLUX_TIMELINE=True)
+    def test_flat_query_count_from_timelines(self):
+        self.assert_flat_query_count('home', self.follow_authors)
+
+    def test_flat_posts_query_count(self):
+        self.assert_flat_query_count('posts', self.write_posts)
+        response = self.client.get(reverse('posts'))
+        self.assertContains(response, 'srcset=')
+        self.assertContains(response, 'Writer31 a demandé une critique')
+
+
+@override_settings(FLUX_TIMELINE=True, FLUX_FANOUT_MAX_FOLLOWERS=2)
+class TimelineTests(TestCase):
+    """
+    The materialized timelines hold the posts of the followed authors who are
+    fanned out, and the flux read from them matches the flux read from the
+    posts, whatever the authors' modes.
+    """
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.reader = User.objects.create(username='reader')
+        self.author = User.objects.create(username='author')
+        self.others = [
+            User.objects.create(username=f'other{index}') for index in range(2)
+        ]
+
+    def write(self, title):
+        """
+        Makes the author write a ticket and review it.
+
+        Args:
+            title (str): The title of the ticket.
+
+        Returns:
+            set: The ``(content_type, id)`` of the two posts.
+        """
+        ticket = Ticket.objects.create(title=title, user=self.author)
+        review = Review.objects.create(
+            ticket=ticket, user=self.author, rating=3, headline=title
+        )
+        return {('TICKET', ticket.pk), ('REVIEW', review.pk)}
+
+    def timeline_posts(self, owner):
+        """
+        Returns the ``(content_type, id)`` of the posts in a timeline.
+        """
+        entries = TimelineEntry.objects.filter(owner=owner)
+        return set(entries.values_list('content_type', 'post_id'))
+
+    def assert_flux(self, posts):
+        """
+        Checks the flux of the reader, read from the timelines.
+
+        Args:
+            posts (set): The ``(content_type, id)`` of the expected posts.
+        """
+        timeline_page, _ = flux.get_flux_page(self.reader, limit=100)
+        with override_settings(FLUX_TIMELINE=False):
+            posts_page, _ = flux.get_flux_page(self.reader, limit=100)
+        self.assertEqual(
+            [flux.sort_key(post) for post in timeline_page],
+            [flux.sort_key(post) for post in posts_page],
+        )
+        self.assertEqual(
+            {(post.content_type, post.pk) for post in timeline_page}, posts
+        )
+
+    def test_fan_out(self):
+        UserFollows.objects.create(user=self.reader, followed_user=self.author)
+        posts = self.write('Book')
+        self.assertEqual(self.timeline_posts(self.reader), posts)
+        self.assertEqual(self.timeline_posts(self.author), posts)
+        self.assert_flux(posts)
+
+    def test_backfill_on_follow(self):
+        posts = self.write('Book')
+        self.assertEqual(self.timeline_posts(self.reader), set())
+        UserFollows.objects.create(user=self.reader, followed_user=self.author)
+        self.assertEqual(self.timeline_posts(self.reader), posts)
+        self.assert_flux(posts)
+
+    def test_purge_on_unfollow(self):
+        UserFollows.objects.create(user=self.reader, followed_user=self.author)
+        self.write('Book')
+        UserFollows.objects.get(user=self.reader).delete()
+        self.assertEqual(self.timeline_posts(self.reader), set())
+        self.assert_flux(set())
+
+    def test_threshold_crossing(self):
+        UserFollows.objects.create(user=self.reader, followed_user=self.author)
+        UserFollows.objects.create(
+            user=self.others[0], followed_user=self.author
+        )
+        posts = self.write('Before')
+        UserFollows.objects.create(
+            user=self.others[1], followed_user=self.author
+        )
+        self.author.refresh_from_db()
+        self.assertFalse(self.author.fanned_out)
+        self.assertEqual(self.timeline_posts(self.reader), set())
+        self.assertEqual(self.timeline_posts(self.author), posts)
+        posts |= self.write('While pulled')
+        self.assertEqual(self.timeline_posts(self.reader), set())
+        self.assert_flux(posts)
+        UserFollows.objects.get(user=self.others[1]).delete()
+        self.author.refresh_from_db()
+        self.assertTrue(self.author.fanned_out)
+        self.assertEqual(self.timeline_posts(self.reader), posts)
+        self.assertEqual(self.timeline_posts(self.others[0]), posts)
+        self.assertEqual(self.timeline_posts(self.others[1]), set())
+        self.assert_flux(posts)
+
+    def test_rebuild_timelines(self):
+        UserFollows.objects.create(user=self.reader, followed_user=self.author)
+        UserFollows.objects.create(
+            user=self.others[0], followed_user=self.author
+        )
+        posts = self.write('Book')
+        TimelineEntry.objects.all().delete()
+        with override_settings(FLUX_FANOUT_MAX_FOLLOWERS=1):
+            call_command('rebuild_timelines', stdout=io.StringIO())
+            self.author.refresh_from_db()
+            self.assertFalse(self.author.fanned_out)
+            self.assertEqual(self.timeline_posts(self.reader), set())
+            self.assertEqual(self.timeline_posts(self.author), posts)
+            self.assert_flux(posts)
+        call_command('rebuild_timelines', stdout=io.StringIO())
+        self.author.refresh_from_db()
+        self.assertTrue(self.author.fanned_out)
+        self.assertEqual(self.timeline_posts(self.reader), posts)
+        self.assert_flux(posts)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite query plans')
+class FluxQueryPlanTests(TestCase):
+    """
+    The flux streams are read from the composite indexes, without scanning
+    a table or sorting the posts.
+    """
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.reader = User.objects.create(username='reader')
+        for index in range(3):
+            author = User.objects.create(username=f'author{index}')
+            UserFollows.objects.create(user=self.reader, followed_user=author)
+            ticket = Ticket.objects.create(title=f'Book {index}', user=author)
+            Review.objects.create(
+                ticket=ticket, user=author, rating=3, headline='Review'
+            )
+
+    def query_plans(self, stream):
+        """
+        Returns the SQLite query plans reading the first rows of a stream.
+
+        Args:
+            stream (QuerySet | AuthorRanges): The stream to explain.
+
+        Returns:
+            list: The details of the steps of each plan.
+        """
+        stream = stream[:20]
+        if isinstance(stream, flux.AuthorRanges):
+            ids = [row.id for row in stream.model.objects.all()]
+            queries = [
+                stream.sql_with_params(),
+                stream.queryset.filter(id__in=ids).query.sql_with_params(),
+            ]
+        else:
+            queries = [stream.query.sql_with_params()]
+        plans = []
+        with connection.cursor() as cursor:
+            for sql, params in queries:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plans.append([row[-1] for row in cursor.fetchall()])
+        return plans
+
+    def assert_index_ordered(self, streams):
+        for stream, index in zip(
+            streams, ('ticket_user_time_idx', 'review_user_time_idx')
+        ):
+            plans = self.query_plans(stream)
+            with self.subTest(index=index, plans=plans):
+                self.assertTrue(any(index in step for step in plans[0]))
+                for plan in plans:
+                    self.assertFalse(
+                        any(step.startswith('SCAN') for step in plan)
+                    )
+                    self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_flux_streams(self):
+        self.assert_index_ordered(flux.get_flux_streams(self.reader))
+
+    def test_flux_streams_after_cursor(self):
+        posts, cursor = flux.get_flux_page(self.reader, limit=2)
+        position = flux.decode_cursor(cursor)
+        self.assert_index_ordered(flux.get_flux_streams(self.reader, position))
+
+    def test_posts_streams(self):
+        self.assert_index_ordered(flux.get_streams(Q(user=self.reader)))
+
+
+class TicketCounterTests(TestCase):
+    """
+    The review counters and rating histograms of the tickets follow the
+    reviews, and the reconciliation repairs them.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        self.tickets = [
+            Ticket.objects.create(title=f'Book {index}', user=self.user)
+            for index in range(2)
+        ]
+
+    def review(self, ticket, rating):
+        """
+        Makes the user review a ticket.
+
+        Args:
+            ticket (Ticket): The reviewed ticket.
+            rating (int): The rating of the review.
+
+        Returns:
+            Review: The created review.
+        """
+        return Review.objects.create(
+            ticket=ticket, user=self.user, rating=rating, headline='Review'
+        )
+
+    def assert_counters(self):
+        """
+        Checks the counters of every ticket against its reviews.
+        """
+        for ticket in Ticket.objects.all():
+            ratings = list(
+                Review.objects.filter(ticket=ticket).values_list(
+                    'rating', flat=True
+                )
+            )
+            with self.subTest(ticket=ticket.title, ratings=ratings):
+                self.assertEqual(ticket.review_count, len(ratings))
+                self.assertEqual(ticket.rating_total, sum(ratings))
+                self.assertEqual(
+                    [getattr(ticket, f'rating_{r}') for r in Ticket.RATINGS],
+                    [ratings.count(r) for r in Ticket.RATINGS],
+                )
+
+    def test_create(self):
+        self.review(self.tickets[0], 4)
+        self.review(self.tickets[0], 2)
+        self.assert_counters()
+        ticket = Ticket.objects.get(pk=self.tickets[0].pk)
+        self.assertEqual(ticket.average_rating, 3)
+        self.assertEqual(ticket.rating_histogram[1], (4, 1, 50))
+
+    def test_rating_change(self):
+        review = self.review(self.tickets[0], 4)
+        review.rating = 1
+        review.save()
+        self.assert_counters()
+        review = Review.objects.get(pk=review.pk)
+        review.rating = 5
+        review.save(update_fields=['rating'])
+        self.assert_counters()
+        review.headline = 'Edited'
+        review.save(update_fields=['headline'])
+        self.assert_counters()
+
+    def test_ticket_change(self):
+        review = self.review(self.tickets[0], 3)
+        review = Review.objects.get(pk=review.pk)
+        review.ticket = self.tickets[1]
+        review.rating = 2
+        review.save()
+        self.assert_counters()
+        self.assertFalse(Ticket.objects.get(pk=self.tickets[0].pk).has_review)
+
+    def test_delete(self):
+        kept = self.review(self.tickets[0], 5)
+        self.review(self.tickets[0], 0).delete()
+        self.assert_counters()
+        kept.delete()
+        self.assert_counters()
+
+    def test_reconcile(self):
+        self.review(self.tickets[0], 4)
+        self.review(self.tickets[1], 1)
+        Ticket.objects.filter(pk=self.tickets[0].pk).update(
+            review_count=7, rating_4=0, rating_2=3
+        )
+        Ticket.objects.filter(pk=self.tickets[1].pk).update(rating_total=9)
+        output = io.StringIO()
+        call_command(
+            'reconcile_ticket_counters', '--batch-size', '1', stdout=output
+        )
+        self.assertEqual(output.getvalue().strip(), '2 ticket(s) fixed.')
+        self.assert_counters()
+        output = io.StringIO()
+        call_command('reconcile_ticket_counters', stdout=output)
+        self.assertEqual(output.getvalue().strip(), '0 ticket(s) fixed.')
+
+
+class FragmentCacheTests(TestCase):
+    """
+    The cached snippets of a post are rendered again once the post, or the
+    ticket it reviews, is edited.
+    """
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.reader = User.objects.create(username='reader')
+        self.client.force_login(self.reader)
+        self.ticket = Ticket.objects.create(
+            title='Old title', user=self.reader
+        )
+        self.review = Review.objects.create(
+            ticket=self.ticket,
+            user=self.reader,
+            rating=3,
+            headline='Old headline',
+        )
+
+    def version(self, content_type, pk):
+        """
+        Returns the current version token of a post.
+        """
+        return fragments.version_cache().get(
+            fragments.version_key(content_type, pk)
+        )
+
+    def test_edited_posts(self):
+        for name in ('home', 'posts'):
+            self.assertContains(self.client.get(reverse(name)), 'Old title')
+        versions = (
+            self.version('TICKET', self.ticket.pk),
+            self.version('REVIEW', self.review.pk),
+        )
+        # Bypassing the signals, the snippets are read from the cache.
+        Ticket.objects.filter(pk=self.ticket.pk).update(title='Unsaved')
+        self.assertNotContains(self.client.get(reverse('home')), 'Unsaved')
+
+        self.ticket.title = 'New title'
+        self.ticket.save()
+        self.review.headline = 'New headline'
+        self.review.save()
+        self.assertNotEqual(
+            self.version('TICKET', self.ticket.pk), versions[0]
+        )
+        self.assertNotEqual(
+            self.version('REVIEW', self.review.pk), versions[1]
+        )
+        for name in ('home', 'posts'):
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name))
+                self.assertNotContains(response, 'Old title')
+                self.assertNotContains(response, 'Old headline')
+                self.assertContains(response, 'New title', count=2)
+                self.assertContains(response, 'New headline')
+
+    def test_new_review_of_displayed_ticket(self):
+        ticket = Ticket.objects.create(title='Other', user=self.reader)
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, '1 critique', count=2)
+        Review.objects.create(
+            ticket=ticket, user=self.reader, rating=5, headline='Second'
+        )
+        # The cached snippet of the ticket now shows its review, and so does
+        # the ticket included in the new review.
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, '1 critique', count=4)
+
+
+class ConditionalGetTests(TestCase):
+    """
+    The flux and posts pages answer 304 Not Modified, without reading the
+    posts, until something they display changes.
+    """
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.reader = User.objects.create(username='reader')
+        self.author = User.objects.create(username='author')
+        UserFollows.objects.create(user=self.reader, followed_user=self.author)
+        self.ticket = Ticket.objects.create(title='Book', user=self.author)
+        self.client.force_login(self.reader)
+
+    def etag(self, name='home'):
+        """
+        Reads a page and returns its entity tag.
+        """
+        response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def assert_not_modified(self, etag, name='home'):
+        with mock.patch.object(flux, 'get_flux_page') as get_flux_page:
+            with mock.patch.object(flux, 'get_page') as get_page:
+                response = self.client.get(
+                    reverse(name), headers={'if-none-match': etag}
+                )
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(get_flux_page.called or get_page.called)
+
+    def test_not_modified(self):
+        for name in ('home', 'posts'):
+            with self.subTest(name=name):
+                self.assert_not_modified(self.etag(name), name)
+
+    def test_new_post(self):
+        etag = self.etag()
+        Ticket.objects.create(title='Other book', user=self.author)
+        self.assertNotEqual(self.etag(), etag)
+
+    def test_changed_posts(self):
+        etags = {self.etag()}
+        review = Review.objects.create(
+            ticket=self.ticket, user=self.reader, rating=2, headline='Review'
+        )
+        etags.add(self.etag())
+        # A review of the ticket written by a user whose posts are not read.
+        Review.objects.create(
+            ticket=self.ticket,
+            user=User.objects.create(username='stranger'),
+            rating=5,
+            headline='Other review',
+        )
+        etags.add(self.etag())
+        self.ticket.title = 'Renamed'
+        self.ticket.save()
+        etags.add(self.etag())
+        review.delete()
+        etags.add(self.etag())
+        UserFollows.objects.get(user=self.reader).delete()
+        etags.add(self.etag())
+        self.assertEqual(len(etags), 6)
+        self.assert_not_modified(self.etag())
+
+    def test_pending_messages(self):
+        etag = self.etag()
+        storage = CookieStorage(HttpRequest())
+        storage.add(messages.SUCCESS, 'Saved.')
+        cookies = HttpResponse()
+        storage.update(cookies)
+        self.client.cookies.update(cookies.cookies)
+        response = self.client.get(
+            reverse('home'), headers={'if-none-match': etag}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+    async def test_live_events(self):
+        etag = await sync_to_async(self.etag)()
+        await self.async_client.aforce_login(self.reader)
+        response = await self.async_client.get(
+            reverse('home'), headers={'if-none-match': etag}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class SearchTests(TestCase):
+    """
+    The search finds the posts of the user and of the users they follow
+    which contain all the searched terms, best match first.
+    """
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.reader = User.objects.create(username='reader')
+        self.author = User.objects.create(username='author')
+        self.stranger = User.objects.create(username='stranger')
+        UserFollows.objects.create(user=self.reader, followed_user=self.author)
+        self.in_title = Ticket.objects.create(
+            title='Le Petit Prince', user=self.author
+        )
+        self.in_text = Ticket.objects.create(
+            title='Conte',
+            description='Un petit prince voyage',
+            user=self.author,
+        )
+        self.review = Review.objects.create(
+            ticket=self.in_title,
+            user=self.reader,
+            rating=5,
+            headline='Relu cet été',
+            body='Toujours aussi poétique.',
+        )
+        self.hidden = Ticket.objects.create(
+            title='Prince of Persia', user=self.stranger
+        )
+        self.client.force_login(self.reader)
+
+    def search(self, query):
+        """
+        Searches through the search view.
+
+        Args:
+            query (str): The search text.
+
+        Returns:
+            list: The ``(content_type, id)`` of the results, in order.
+        """
+        response = self.client.get(reverse('search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [
+            (post.content_type, post.pk) for post in response.context['posts']
+        ]
+
+    def assert_visible_results(self, ordered=True):
+        """
+        Checks that only the posts of the followed users are found.
+
+        Args:
+            ordered (bool): If True, the title match must come first.
+        """
+        results = self.search('prince')
+        expected = [('TICKET', self.in_title.pk), ('TICKET', self.in_text.pk)]
+        if ordered:
+            self.assertEqual(results, expected)
+        else:
+            self.assertCountEqual(results, expected)
+        self.assertEqual(self.search('persia'), [])
+        UserFollows.objects.create(
+            user=self.reader, followed_user=self.stranger
+        )
+        self.assertEqual(self.search('persia'), [('TICKET', self.hidden.pk)])
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite FTS5 index')
+    def test_search(self):
+        self.assertEqual(self.search('petit prince'), self.search('prince'))
+        self.assertEqual(
+            self.search('prince voyage'), [('TICKET', self.in_text.pk)]
+        )
+        self.assertEqual(
+            self.search('ete poetiq*'), [('REVIEW', self.review.pk)]
+        )
+        self.assert_visible_results()
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite FTS5 index')
+    def test_many_followed_users(self):
+        with mock.patch.object(search, 'MAX_AUTHOR_TERMS', 1):
+            self.assertIsNone(search.visible_authors(self.reader))
+            self.assert_visible_results()
+
+    def test_fallback_search(self):
+        with mock.patch.object(search, 'is_available', return_value=False):
+            self.assert_visible_results(ordered=False)
+            self.assertEqual(
+                self.search('voyage'), [('TICKET', self.in_text.pk)]
+            )
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite FTS5 index')
+    def test_index_updates(self):
+        self.in_title.title = 'Vol de nuit'
+        self.in_title.save()
+        self.assertEqual(self.search('prince'), [('TICKET', self.in_text.pk)])
+        self.assertEqual(self.search('vol'), [('TICKET', self.in_title.pk)])
+        self.in_text.delete()
+        self.assertEqual(self.search('prince'), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite FTS5 index')
+    def test_query_syntax(self):
+        for query in ('"', 'prince OR', 'author : u3', 'NEAR(', '*'):
+            with self.subTest(query=query):
+                self.search(query)
+        self.assertEqual(self.search('u3'), [])
+
+
+class BookSuggestionTests(TestCase):
+    """
+    The tickets about the same book are suggested before a new ticket is
+    created, and a review is only published on a suggested ticket.
+    """
+
+    def setUp(self):
+        self.reader = User.objects.create(username='reader')
+        self.client.force_login(self.reader)
+        self.book = Ticket.objects.create(
+            title='Le Seigneur des Anneaux', user=User.objects.create()
+        )
+        self.other = Ticket.objects.create(
+            title='Dune', user=User.objects.create(username='other')
+        )
+        self.review = {
+            'title': 'Seigneur des anneaux (le)',
+            'description': '',
+            'headline': 'Épique',
+            'rating': 5,
+            'body': '',
+        }
+
+    def test_create_ticket(self):
+        data = {'title': 'le seigneur des anneaux', 'description': ''}
+        response = self.client.post(reverse('create_ticket'), data)
+        self.assertEqual(response.context['similar_tickets'], [self.book])
+        self.assertEqual(Ticket.objects.count(), 2)
+        response = self.client.post(
+            reverse('create_ticket'), {**data, 'new_book': '1'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Ticket.objects.count(), 3)
+
+    def test_use_suggested_ticket(self):
+        response = self.client.post(reverse('create_review'), self.review)
+        self.assertEqual(response.context['similar_tickets'], [self.book])
+        self.assertFalse(Review.objects.exists())
+        response = self.client.post(
+            reverse('create_review'),
+            {**self.review, 'use_ticket': str(self.book.pk)},
+        )
+        self.assertEqual(response.status_code, 302)
+        review = Review.objects.get()
+        self.assertEqual(review.ticket, self.book)
+        self.assertEqual(Ticket.objects.count(), 2)
+
+    def test_use_other_ticket(self):
+        for use_ticket in (self.other.pk, 0, 'x'):
+            with self.subTest(use_ticket=use_ticket):
+                response = self.client.post(
+                    reverse('create_review'),
+                    {**self.review, 'use_ticket': use_ticket},
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    response.context['similar_tickets'], [self.book]
+                )
+                self.assertFalse(Review.objects.exists())
+
+    def test_new_book(self):
+        response = self.client.post(
+            reverse('create_review'), {**self.review, 'new_book': '1'}
+        )
+        self.assertEqual(response.status_code, 302)
+        review = Review.objects.select_related('ticket').get()
+        self.assertEqual(review.ticket.title, self.review['title'])
+        self.assertEqual(review.ticket.user, self.reader)
+
+    def test_candidates_ranked_before_truncation(self):
+        # Each of these tickets shares a few trigrams of the title, the
+        # similar ticket shares them all.
+        for index in range(5):
+            Ticket.objects.create(title=f'Zorro {index}', user=self.reader)
+            Ticket.objects.create(title=f'Glub {index}', user=self.reader)
+        book = Ticket.objects.create(title='Zorglub', user=self.reader)
+        with mock.patch.object(books, 'MAX_CANDIDATES', 2):
+            self.assertEqual(books.find_similar('ZORGLUB'), [book])
+
+
+class ImageProcessingTests(TestCase):
+    """
+    The image of a ticket is resized into a new file, and a ticket whose
+    image cannot be processed leaves the queue as failed.
+    """
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        buffer = io.BytesIO()
+        Image.new('RGB', (400, 400)).save(buffer, 'PNG')
+        self.upload = buffer.getvalue()
+        self.ticket = Ticket(title='Book', user=User.objects.create())
+        self.ticket.image.save('cover.png', ContentFile(self.upload))
+
+    def test_processed_image(self):
+        upload = self.ticket.image.name
+        self.assertTrue(images.process(self.ticket.pk))
+        self.ticket.refresh_from_db()
+        self.assertTrue(self.ticket.image_ready)
+        self.assertFalse(self.ticket.image_failed)
+        self.assertNotEqual(self.ticket.image.name, upload)
+        self.assertTrue(self.ticket.image.name.endswith('.png'))
+        with Image.open(self.ticket.image) as image:
+            self.assertEqual(image.size, Ticket.IMAGE_MAX_SIZE)
+        with self.ticket.image.storage.open(upload) as file:
+            self.assertEqual(file.read(), self.upload)
+
+    def test_collected_upload(self):
+        upload = self.ticket.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(images.process(self.ticket.pk))
+        self.assertFalse(self.ticket.image.storage.exists(upload))
+
+    def test_uploaded_again(self):
+        upload = self.ticket.image.name
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertTrue(images.process(self.ticket.pk))
+        self.ticket.image.storage.save('cover.png', ContentFile(self.upload))
+        path = self.ticket.image.storage.path(upload)
+        os.utime(path, (time.time() + 60, time.time() + 60))
+        for callback in callbacks:
+            callback()
+        self.assertTrue(self.ticket.image.storage.exists(upload))
+
+    def test_decompression_bomb(self):
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 100):
+            with self.assertLogs('reviews.images', 'ERROR'):
+                self.assertTrue(images.process(self.ticket.pk))
+        self.ticket.refresh_from_db()
+        self.assertFalse(self.ticket.image_ready)
+        self.assertTrue(self.ticket.image_failed)
+        self.assertEqual(self.ticket.image_variants, {})
+        self.assertFalse(images.pending().exists())
+
+
+class StorageTests(TestCase):
+    """
+    Identical images are stored once, and a file is deleted with the last
+    ticket referencing it or by the sweep of the orphans.
+    """
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.enterContext(override_settings(TICKET_IMAGE_GC_GRACE=0))
+        self.enterContext(
+            mock.patch.object(images, 'get_executor', return_value=None)
+        )
+        self.user = User.objects.create()
+
+    def create_ticket(self, color):
+        """
+        Creates a ticket with an image of a single color.
+
+        Args:
+            color (str): The color of the image.
+
+        Returns:
+            Ticket: The ticket.
+        """
+        ticket = Ticket(title='Book', user=self.user)
+        ticket.image.save('cover.png', ContentFile(self.image_data(color)))
+        return ticket
+
+    def image_data(self, color):
+        """
+        Returns the content of a PNG image of a single color.
+
+        Args:
+            color (str): The color of the image.
+
+        Returns:
+            bytes: The PNG file.
+        """
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 40), color).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def stored_files(self):
+        """
+        Returns the names of the files stored in the media directory.
+
+        Returns:
+            list: The names of the files, relative to the media directory.
+        """
+        root = storage.ticket_image_storage.location
+        return [
+            os.path.relpath(os.path.join(directory, name), root)
+            for directory, _, names in os.walk(root)
+            for name in names
+        ]
+
+    def test_deduplicated_upload(self):
+        first = self.create_ticket('red')
+        second = self.create_ticket('red')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(self.stored_files(), [first.image.name])
+
+    def test_deleted_tickets(self):
+        first = self.create_ticket('red')
+        second = self.create_ticket('red')
+        name = first.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(storage.ticket_image_storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(storage.ticket_image_storage.exists(name))
+
+    def test_edited_ticket(self):
+        ticket = self.create_ticket('red')
+        shared = self.create_ticket('blue')
+        former = ticket.image.name
+        ticket = Ticket.objects.get(pk=ticket.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.image.save(
+                'cover.png', ContentFile(self.image_data('green'))
+            )
+        self.assertFalse(storage.ticket_image_storage.exists(former))
+        ticket = Ticket.objects.get(pk=ticket.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.image.save(
+                'cover.png', ContentFile(self.image_data('blue'))
+            )
+        self.assertEqual(ticket.image.name, shared.image.name)
+        self.assertTrue(storage.ticket_image_storage.exists(shared.image.name))
+
+    def test_orphan_sweep(self):
+        ticket = self.create_ticket('red')
+        with self.captureOnCommitCallbacks(execute=True):
+            images.process(ticket.pk)
+        ticket.refresh_from_db()
+        orphan = storage.ticket_image_storage.save(
+            'orphan.png', ContentFile(self.image_data('green'))
+        )
+        kept = sorted(set(self.stored_files()) - {orphan})
+        self.assertIn(ticket.image.name, kept)
+        self.assertTrue(any(name.startswith('variants/') for name in kept))
+        for options, remaining in (
+            (['--dry-run'], sorted(kept + [orphan])),
+            ([], kept),
+        ):
+            with self.subTest(options=options):
+                stdout = io.StringIO()
+                call_command(
+                    'collect_orphan_media',
+                    '--min-age',
+                    '0',
+                    *options,
+                    stdout=stdout,
+                )
+                self.assertIn(orphan, stdout.getvalue())
+                self.assertEqual(sorted(self.stored_files()), remaining)
+
+
+class CursorTests(TestCase):
+    """
+    The cursors are URL-safe and the malformed ones are rejected.
+    """
+
+    def setUp(self):
+        self.reader = User.objects.create(username='reader')
+        self.client.force_login(self.reader)
+        for index in range(3):
+            Ticket.objects.create(title=f'Book {index}', user=self.reader)
+
+    def test_url_safe_round_trip(self):
+        posts, cursor = flux.get_flux_page(self.reader, limit=1)
+        self.assertRegex(cursor, r'^[A-Za-z0-9_-]+$')
+        self.assertEqual(flux.decode_cursor(cursor), flux.sort_key(posts[0]))
+        response = self.client.get(reverse('home'), {'after': cursor})
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_cursor(self):
+        ticket = Ticket.objects.first()
+        ticket.content_type = 'BOOK'
+        cursors = ['abc', 'a+b', flux.encode_cursor(ticket)]
+        for name in ('home', 'posts', 'api_flux'):
+            for cursor in cursors:
+                with self.subTest(name=name, cursor=cursor):
+                    response = self.client.get(
+                        reverse(name), {'after': cursor}
+                    )
+                    self.assertEqual(response.status_code, 400)
+
+    def test_invalid_limit(self):
+        for limit in ('abc', '0', '-1'):
+            with self.subTest(limit=limit):
+                response = self.client.get(
+                    reverse('api_flux'), {'limit': limit}
+                )
+                self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('api_flux'), {'limit': '2'})
+        self.assertEqual(len(list(response.streaming_content)), 2)
+
+
+class FluxEventsTests(TestCase):
+    """
+    The flux is notified of new posts by server-sent events under ASGI
+    only, and polls the flux API otherwise.
+    """
+
+    def setUp(self):
+        self.reader = User.objects.create(username='reader')
+
+    def test_polling_under_wsgi(self):
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('flux_events'))
+        self.assertEqual(response.status_code, 204)
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, reverse('api_flux'))
+        self.assertNotContains(response, 'EventSource(')
+
+    async def test_event_stream_under_asgi(self):
+        await self.async_client.aforce_login(self.reader)
+        response = await self.async_client.get(reverse('flux_events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        self.assertEqual(await anext(events), b'retry: 5000\n\n')
+        await events.aclose()
+        response = await self.async_client.get(reverse('home'))
+        self.assertContains(response, 'EventSource(')
+
+
+class FluxFeedTests(TestCase):
+    """
+    The flux API streams the posts as they are read, under WSGI and ASGI.
+    """
+
+    def setUp(self):
+        self.reader = User.objects.create(username='reader')
+        for index in range(5):
+            Ticket.objects.create(title=f'Book {index}', user=self.reader)
+
+    def test_stream_under_wsgi(self):
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('api_flux'))
+        self.assertFalse(response.is_async)
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 5)
+
+    async def test_stream_under_asgi(self):
+        await self.async_client.aforce_login(self.reader)
+        with mock.patch('reviews.api.CHUNK_SIZE', 2):
+            response = await self.async_client.get(reverse('api_flux'))
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(
+            [len(chunk.splitlines()) for chunk in chunks], [2, 2, 1]
+        )
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    The GET requests of the read-only views read the replica, while the
+    requests which write, and the session for a while afterwards, read the
+    primary.
+    """
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        # The routing state of the last request outlives it.
+        token = routers._routing.set(None)
+        self.addCleanup(routers._routing.reset, token)
+        self.reader = User.objects.create(username='reader')
+        writer = User.objects.create(username='writer')
+        UserFollows.objects.create(user=self.reader, followed_user=writer)
+        Ticket.objects.create(title='Dune', user=writer)
+        # The follow graph is always loaded from the primary.
+        graph.followees(self.reader.pk)
+        self.client.force_login(self.reader)
+
+    def tearDown(self):
+        # Deleted one by one to remove them from the search index too.
+        for ticket in Ticket.objects.all():
+            ticket.delete()
+
+    def read_tables(self, method, name, **data):
+        """
+        Requests a page and lists the databases queried on each table.
+
+        Args:
+            method (str): 'get' or 'post'.
+            name (str): The name of the URL.
+            **data: The parameters of the request.
+
+        Returns:
+            set: The ``(alias, table)`` pairs of the queried tables of the
+            reviews and of the follows.
+        """
+        tables = [
+            Ticket._meta.db_table,
+            TimelineEntry._meta.db_table,
+            UserFollows._meta.db_table,
+            search.TABLE,
+        ]
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(connections['replica']) as replica:
+                response = getattr(self.client, method)(reverse(name), data)
+        self.assertIn(response.status_code, (200, 302))
+        return {
+            (alias, table)
+            for alias, queries in (('default', primary), ('replica', replica))
+            for query in queries
+            for table in tables
+            if f'"{table}"' in query['sql'] or f' {table} ' in query['sql']
+        }
+
+    def assert_reads(self, alias):
+        """
+        Asserts that the read-only views only read one database.
+
+        Args:
+            alias (str): The alias of the database which must be read.
+        """
+        for name, data in (
+            ('home', {}),
+            ('posts', {}),
+            ('subscriptions', {}),
+            ('search', {'q': 'dune'}),
+        ):
+            with self.subTest(name=name, alias=alias):
+                aliases = {
+                    read_alias
+                    for read_alias, _ in self.read_tables('get', name, **data)
+                }
+                self.assertEqual(aliases, {alias})
+
+    def test_read_only_views(self):
+        self.assert_reads('replica')
+
+    def test_write_pins_session(self):
+        created = self.read_tables(
+            'post', 'create_ticket', title='Dune', new_book='1'
+        )
+        self.assertEqual({alias for alias, _ in created}, {'default'})
+        self.assertIn(('default', search.TABLE), created)
+        self.assert_reads('default')
+        with mock.patch.object(
+            routers.time,
+            'time',
+            return_value=time.time() + settings.DATABASE_REPLICA_STICKINESS,
+        ):
+            self.assert_reads('replica')
+
+
+class ImportDataTests(TestCase):
+    """
+    The import keeps the creation dates of the posts and reports the rows
+    actually inserted.
+    """
+
+    def setUp(self):
+        rows = [
+            {'type': 'user', 'id': 1, 'username': 'author', 'password': ''},
+            {
+                'type': 'ticket',
+                'id': 1,
+                'user': 1,
+                'title': 'Book',
+                'time_created': '2020-01-02T03:04:05+00:00',
+            },
+        ]
+        file = tempfile.NamedTemporaryFile('w', suffix='.jsonl')
+        self.addCleanup(file.close)
+        file.write(''.join(json.dumps(row) + '\n' for row in rows))
+        file.flush()
+        self.path = file.name
+
+    def import_data(self):
+        output = io.StringIO()
+        call_command(
+            'import_data',
+            self.path,
+            '--ignore-conflicts',
+            '--no-rebuild',
+            stdout=output,
+        )
+        return output.getvalue().splitlines()[-1]
+
+    def test_import(self):
+        self.assertEqual(
+            self.import_data(),
+            'Imported 1 user(s), 1 ticket(s), 0 review(s), 0 follow(s).',
+        )
+        ticket = Ticket.objects.get()
+        self.assertEqual(
+            ticket.time_created.isoformat(), '2020-01-02T03:04:05+00:00'
+        )
+
+    def test_resumed_import(self):
+        self.import_data()
+        self.assertEqual(
+            self.import_data(),
+            'Imported 0 user(s), 0 ticket(s), 0 review(s), 0 follow(s).',
+        )
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite pragmas')
+class SQLitePragmaTests(TestCase):
+    """
+    The configured pragmas are run on each new SQLite connection.
+    """
+
+    @override_settings(SQLITE_PRAGMAS={'cache_size': -1234})
+    def test_pragmas(self):
+        new_connection = connections.create_connection('default')
+        self.addCleanup(new_connection.close)
+        with new_connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -1234)
@@ -0,0 +1,126 @@
+"""
+Text statistics of the posts and normalization of the book titles.
+
+Words are sequences of letters and digits, possibly joined by an
+apostrophe or a hyphen ("aujourd'hui", "chef-d'œuvre"), whatever the
+whitespace or punctuation around them. The statistics are computed once,
+when a review is saved, and stored in indexed columns, so listing or
+sorting reviews by length never reads their text.
+
+The book key of a ticket title is its case-folded, accent-stripped words,
+deduplicated and sorted, so "Hugo - Les Misérables" and "les miserables,
+hugo" share the same key. Near-identical keys are compared by their
+trigrams, padded the same way as PostgreSQL's pg_trgm.
+"""
+
+import math
+import re
+import unicodedata
+
+WORD_PATTERN = re.compile(r"[^\W_]+(?:['’-][^\W_]+)*")
+WORDS_PER_MINUTE = 200
+
+
+def words(text):
+    """
+    Splits a text into its words.
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        list: The words, in order.
+    """
+    return WORD_PATTERN.findall(text)
+
+
+def word_count(text):
+    """
+    Counts the words of a text.
+
+    Args:
+        text (str): The text to count.
+
+    Returns:
+        int: The number of words.
+    """
+    return sum(1 for _ in WORD_PATTERN.finditer(text))
+
+
+def reading_time(count):
+    """
+    Estimates the time needed to read a number of words.
+
+    Args:
+        count (int): The number of words.
+
+    Returns:
+        int: The reading time in minutes, rounded up; 0 for an empty text.
+    """
+    return math.ceil(count / WORDS_PER_MINUTE)
+
+
+def strip_accents(text):
+    """
+    Removes the diacritics of a text.
+
+    Args:
+        text (str): The text to strip.
+
+    Returns:
+        str: The text without its combining characters.
+    """
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(
+        char for char in decomposed if not unicodedata.combining(char)
+    )
+
+
+def book_key(title):
+    """
+    Computes the normalized key of a book title.
+
+    Args:
+        title (str): The title of a ticket.
+
+    Returns:
+        str: The sorted, distinct, case-folded and accent-stripped words.
+    """
+    return ' '.join(sorted(set(words(strip_accents(title.casefold())))))
+
+
+def trigrams(key):
+    """
+    Returns the trigrams of a book key.
+
+    Each word is padded with two spaces before and one after, so short
+    words and word boundaries produce trigrams too.
+
+    Args:
+        key (str): A book key.
+
+    Returns:
+        set: The trigrams.
+    """
+    return {
+        padded[i : i + 3]
+        for padded in (f'  {word} ' for word in key.split())
+        for i in range(len(padded) - 2)
+    }
+
+
+def similarity(grams, other_grams):
+    """
+    Computes the similarity of two sets of trigrams.
+
+    Args:
+        grams (set): The trigrams of a book key.
+        other_grams (set): The trigrams of another book key.
+
+    Returns:
+        float: Their Jaccard index, between 0 and 1.
+    """
+    if not grams or not other_grams:
+        return 0.0
+    shared = len(grams & other_grams)
+    return shared / (len(grams) + len(other_grams) - shared)
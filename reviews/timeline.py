@@ -0,0 +1,246 @@
+"""
+Fan-out-on-write maintenance of the materialized flux timelines.
+
+When ``settings.FLUX_TIMELINE`` is enabled, each post is copied as a
+``TimelineEntry`` into the timeline of its author and of each of their
+followers. Authors followed by more than
+``settings.FLUX_FANOUT_MAX_FOLLOWERS`` users are not fanned out: their
+posts are read on request by ``flux.get_flux_page``.
+
+The mode of each author is stored in ``User.fanned_out`` and switched by
+``update_mode`` when their follower count crosses the threshold, in the
+same transaction as the timelines: an author who becomes pulled has their
+posts removed from the timelines of their followers, and an author who is
+fanned out again has all their posts, including the ones written while
+pulled, copied into them. The switch is a conditional update, so among
+concurrent subscriptions only one performs it.
+"""
+
+from itertools import chain, islice
+
+from django.conf import settings
+from django.db import transaction
+
+from authentication.models import User, UserFollows
+
+from .models import Review, Ticket, TimelineEntry
+
+TICKET = 'TICKET'
+REVIEW = 'REVIEW'
+
+BATCH_SIZE = 1000
+
+
+def is_enabled():
+    """
+    Returns True if the flux is read from the materialized timelines.
+    """
+    return settings.FLUX_TIMELINE
+
+
+def fans_out(author_id):
+    """
+    Tells whether the posts of an author are copied into their followers' timelines.
+
+    Args:
+        author_id (int): The id of the author.
+
+    Returns:
+        bool: False if the author has too many followers to be fanned out.
+    """
+    fanned_out = (
+        User.objects.filter(pk=author_id)
+        .values_list('fanned_out', flat=True)
+        .first()
+    )
+    return fanned_out is not False
+
+
+@transaction.atomic
+def update_mode(author_id):
+    """
+    Switches the mode of an author whose follower count crossed the threshold.
+
+    Must be called once the follower count has been updated.
+
+    Args:
+        author_id (int): The id of the author.
+
+    Returns:
+        bool | None: The new mode of the author, or None if it is unchanged.
+    """
+    maximum = settings.FLUX_FANOUT_MAX_FOLLOWERS
+    authors = User.objects.filter(pk=author_id)
+    if authors.filter(fanned_out=True, follower_count__gt=maximum).update(
+        fanned_out=False
+    ):
+        TimelineEntry.objects.filter(author_id=author_id).exclude(
+            owner_id=author_id
+        ).delete()
+        return False
+    if authors.filter(fanned_out=False, follower_count__lte=maximum).update(
+        fanned_out=True
+    ):
+        fan_out_posts(author_id)
+        return True
+    return None
+
+
+def update_modes():
+    """
+    Sets the mode of all the authors from their follower count.
+
+    The timelines are left untouched: they must be rebuilt afterwards.
+
+    Returns:
+        int: The number of authors whose mode changed.
+    """
+    maximum = settings.FLUX_FANOUT_MAX_FOLLOWERS
+    pulled = User.objects.filter(fanned_out=True, follower_count__gt=maximum)
+    fanned_out = User.objects.filter(
+        fanned_out=False, follower_count__lte=maximum
+    )
+    return pulled.update(fanned_out=False) + fanned_out.update(fanned_out=True)
+
+
+def insert(entries, batch_size=BATCH_SIZE):
+    """
+    Inserts timeline entries in batches, ignoring the ones already present.
+
+    Args:
+        entries (iterable): The TimelineEntry instances to insert.
+        batch_size (int): The number of entries inserted per query.
+    """
+    entries = iter(entries)
+    while batch := list(islice(entries, batch_size)):
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def entry(owner_id, author_id, content_type, post_id, time_created):
+    """
+    Builds the timeline entry referencing a post.
+
+    Args:
+        owner_id (int): The id of the user whose timeline receives the post.
+        author_id (int): The id of the author of the post.
+        content_type (str): 'TICKET' or 'REVIEW'.
+        post_id (int): The id of the ticket or review.
+        time_created (datetime): The creation date of the post.
+
+    Returns:
+        TimelineEntry: The unsaved entry.
+    """
+    return TimelineEntry(
+        owner_id=owner_id,
+        author_id=author_id,
+        ticket_id=post_id if content_type == TICKET else None,
+        review_id=post_id if content_type == REVIEW else None,
+        content_type=content_type,
+        post_id=post_id,
+        time_created=time_created,
+    )
+
+
+def posts_of(owner_id, authors):
+    """
+    Yields the entries of all the posts written by some authors.
+
+    Args:
+        owner_id (int): The id of the user whose timeline receives the posts.
+        authors (QuerySet | list): The ids of the authors.
+
+    Yields:
+        TimelineEntry: One unsaved entry per ticket and per review.
+    """
+    fields = ('id', 'user_id', 'time_created')
+    tickets = Ticket.objects.filter(user__in=authors).values_list(*fields)
+    reviews = Review.objects.filter(user__in=authors).values_list(*fields)
+    for content_type, posts in ((TICKET, tickets), (REVIEW, reviews)):
+        for post_id, author_id, time_created in posts.iterator():
+            yield entry(
+                owner_id, author_id, content_type, post_id, time_created
+            )
+
+
+def fan_out_posts(author_id):
+    """
+    Copies all the posts of an author into the timelines of their followers.
+
+    Args:
+        author_id (int): The id of the author.
+    """
+    posts = list(posts_of(author_id, [author_id]))
+    followers = UserFollows.objects.filter(followed_user_id=author_id)
+    insert(
+        entry(
+            owner_id,
+            author_id,
+            post.content_type,
+            post.post_id,
+            post.time_created,
+        )
+        for owner_id in followers.values_list('user_id', flat=True).iterator()
+        for post in posts
+    )
+
+
+def add_post(post, content_type):
+    """
+    Copies a new post into the timelines of its author and of their followers.
+
+    Args:
+        post (Ticket | Review): The created post.
+        content_type (str): 'TICKET' or 'REVIEW'.
+    """
+    owner_ids = [post.user_id]
+    if fans_out(post.user_id):
+        followers = UserFollows.objects.filter(followed_user_id=post.user_id)
+        owner_ids = chain(
+            owner_ids, followers.values_list('user_id', flat=True).iterator()
+        )
+    insert(
+        entry(owner_id, post.user_id, content_type, post.id, post.time_created)
+        for owner_id in owner_ids
+    )
+
+
+def backfill(owner_id, author_id):
+    """
+    Copies the existing posts of a newly followed author into a timeline.
+
+    Args:
+        owner_id (int): The id of the follower.
+        author_id (int): The id of the followed user.
+    """
+    if fans_out(author_id):
+        insert(posts_of(owner_id, [author_id]))
+
+
+def purge(owner_id, author_id):
+    """
+    Removes the posts of an unfollowed author from a timeline.
+
+    Args:
+        owner_id (int): The id of the former follower.
+        author_id (int): The id of the unfollowed user.
+    """
+    TimelineEntry.objects.filter(
+        owner_id=owner_id, author_id=author_id
+    ).delete()
+
+
+@transaction.atomic
+def rebuild(owner_id, batch_size=BATCH_SIZE):
+    """
+    Rebuilds the whole timeline of a user from the posts and subscriptions.
+
+    Args:
+        owner_id (int): The id of the user whose timeline is rebuilt.
+        batch_size (int): The number of entries inserted per query.
+    """
+    TimelineEntry.objects.filter(owner_id=owner_id).delete()
+    authors = User.objects.filter(
+        followed_by__user_id=owner_id, fanned_out=True
+    ).values('id')
+    insert(posts_of(owner_id, [owner_id]), batch_size)
+    insert(posts_of(owner_id, authors), batch_size)
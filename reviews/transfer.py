@@ -0,0 +1,354 @@
+"""
+Bulk export and import of the users, tickets, reviews and subscriptions.
+
+The rows are streamed as JSON Lines, one object per row tagged with its
+dataset in ``type``, or as one CSV file per dataset. They keep their ids,
+so the references between them need no lookup, and the datasets are
+written in dependency order: users, tickets, reviews, then subscriptions.
+The images are exported by name only: the media files are copied apart.
+
+An import reads ``BATCH_SIZE`` rows at a time and inserts them with a
+single ``bulk_create`` in a transaction of their own, so its memory use
+does not depend on the size of the input, and an interrupted import is
+resumed by running it again while ignoring the conflicting rows. Bulk
+inserts bypass ``save()`` and the signals: the text statistics are
+computed while reading, the images are left in the processing queue, and
+the rest of the derived data (counters, book and search indexes,
+timelines) is recomputed afterwards, once for all the rows.
+"""
+
+import csv
+import datetime
+import json
+from itertools import groupby, islice
+from pathlib import Path
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from authentication import graph
+from authentication.models import User, UserFollows
+
+from . import books, counters, fragments, search, timeline
+from .models import Review, Ticket
+
+BATCH_SIZE = 5000
+
+DATASETS = {
+    'user': (
+        User,
+        (
+            'id',
+            'username',
+            'password',
+            'email',
+            'first_name',
+            'last_name',
+            'is_active',
+            'is_staff',
+            'is_superuser',
+            'date_joined',
+            'last_login',
+        ),
+    ),
+    'ticket': (
+        Ticket,
+        ('id', 'user', 'title', 'description', 'image', 'time_created'),
+    ),
+    'review': (
+        Review,
+        (
+            'id',
+            'ticket',
+            'user',
+            'rating',
+            'headline',
+            'body',
+            'time_created',
+        ),
+    ),
+    'follow': (UserFollows, ('id', 'user', 'followed_user')),
+}
+
+
+def encode(value):
+    """
+    Converts a column value to its JSON and CSV representation.
+
+    Args:
+        value (object): The value read from the database.
+
+    Returns:
+        object: The value, with the dates in ISO 8601 format.
+    """
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def export_rows(name, batch_size=BATCH_SIZE):
+    """
+    Yields the rows of a dataset, by increasing id.
+
+    The rows are read by keyset pagination, one query per ``batch_size``
+    rows, so no cursor stays open on the table during the export.
+
+    Args:
+        name (str): The name of the dataset, a key of ``DATASETS``.
+        batch_size (int): The number of rows read per query.
+
+    Yields:
+        dict: The encoded columns of a row, by field name.
+    """
+    model, fields = DATASETS[name]
+    columns = [model._meta.get_field(field).attname for field in fields]
+    last_id = 0
+    while True:
+        rows = list(
+            model.objects.filter(pk__gt=last_id)
+            .order_by('pk')
+            .values_list(*columns)[:batch_size]
+        )
+        for row in rows:
+            yield dict(zip(fields, map(encode, row)))
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1][0]
+
+
+def write_jsonl(file, names, batch_size=BATCH_SIZE):
+    """
+    Writes datasets to a JSON Lines file.
+
+    Args:
+        file (TextIO): The file to write to.
+        names (iterable): The names of the datasets to export.
+        batch_size (int): The number of rows read per query.
+
+    Returns:
+        dict: The number of exported rows, by dataset.
+    """
+    counts = {}
+    for name in names:
+        counts[name] = 0
+        for row in export_rows(name, batch_size):
+            file.write(json.dumps({'type': name, **row}, ensure_ascii=False))
+            file.write('\n')
+            counts[name] += 1
+    return counts
+
+
+def write_csv(directory, names, batch_size=BATCH_SIZE):
+    """
+    Writes datasets to CSV files, one ``<dataset>.csv`` file per dataset.
+
+    Args:
+        directory (Path): The directory to write the files to.
+        names (iterable): The names of the datasets to export.
+        batch_size (int): The number of rows read per query.
+
+    Returns:
+        dict: The number of exported rows, by dataset.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    counts = {}
+    for name in names:
+        counts[name] = 0
+        with open(directory / f'{name}.csv', 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=DATASETS[name][1])
+            writer.writeheader()
+            for row in export_rows(name, batch_size):
+                writer.writerow(row)
+                counts[name] += 1
+    return counts
+
+
+def read_jsonl(file):
+    """
+    Yields the rows of a JSON Lines file.
+
+    Args:
+        file (TextIO): The file to read.
+
+    Yields:
+        tuple: The name of the dataset of each row and its columns.
+    """
+    for line in file:
+        if line.strip():
+            row = json.loads(line)
+            yield row.pop('type'), row
+
+
+def read_csv(directory, names=DATASETS):
+    """
+    Yields the rows of the CSV files of a directory, in dependency order.
+
+    The missing files are skipped, and so are the missing columns, whose
+    fields take their default value.
+
+    Args:
+        directory (Path): The directory containing the ``<dataset>.csv``
+            files.
+        names (iterable): The names of the datasets to read.
+
+    Yields:
+        tuple: The name of the dataset of each row and its columns.
+    """
+    for name in names:
+        path = Path(directory) / f'{name}.csv'
+        if not path.exists():
+            continue
+        with open(path, newline='') as file:
+            for row in csv.DictReader(file):
+                yield name, row
+
+
+def build(name, row):
+    """
+    Builds the unsaved instance of an imported row.
+
+    Args:
+        name (str): The name of the dataset of the row.
+        row (dict): The columns of the row, by field name.
+
+    Returns:
+        Model: The instance, with the fields computed on save filled in.
+    """
+    model, fields = DATASETS[name]
+    values = {}
+    for field_name in fields:
+        if field_name not in row:
+            continue
+        field = model._meta.get_field(field_name)
+        value = row[field_name]
+        if value is None or value == '' and not field.empty_strings_allowed:
+            values[field.attname] = None
+        else:
+            values[field.attname] = field.to_python(value)
+    instance = model(**values)
+    if isinstance(instance, User):
+        instance.username = instance.username.lower()
+    elif isinstance(instance, Ticket):
+        instance.image_ready = not instance.image
+    elif isinstance(instance, Review):
+        instance.update_text_statistics()
+    if isinstance(instance, (Ticket, Review)):
+        instance.time_created = instance.time_created or timezone.now()
+    return instance
+
+
+def import_chunks(rows, batch_size=BATCH_SIZE, ignore_conflicts=False):
+    """
+    Inserts rows by chunks, each chunk in its own transaction.
+
+    The imported creation dates of the posts are inserted as they are. When
+    the conflicting rows are ignored, the rows of each table are counted
+    after each chunk, to tell how many were actually inserted.
+
+    Args:
+        rows (iterable): The ``(dataset, columns)`` pairs of ``read_jsonl``
+            or ``read_csv``, in dependency order.
+        batch_size (int): The maximum number of rows per chunk.
+        ignore_conflicts (bool): If True, the rows whose id or unique
+            columns are already taken are skipped instead of failing.
+
+    Yields:
+        tuple: The name of the dataset of each inserted chunk, its
+        instances and the number of rows inserted.
+    """
+    for name, group in groupby(rows, key=lambda row: row[0]):
+        model = DATASETS[name][0]
+        count = model.objects.count() if ignore_conflicts else 0
+        while chunk := [
+            build(name, row) for _, row in islice(group, batch_size)
+        ]:
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    chunk,
+                    batch_size=batch_size,
+                    ignore_conflicts=ignore_conflicts,
+                )
+                if ignore_conflicts:
+                    before, count = count, model.objects.count()
+                    inserted = count - before
+                else:
+                    inserted = len(chunk)
+            yield name, chunk, inserted
+    reset_sequences()
+    graph.invalidate_all()
+    fragments.invalidate_all()
+
+
+def reset_sequences():
+    """
+    Moves the id sequences past the imported ids, on the backends having them.
+    """
+    models = [model for model, _ in DATASETS.values()]
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def reconcile_followers(batch_size=BATCH_SIZE):
+    """
+    Recomputes the follower count of all the users.
+
+    Args:
+        batch_size (int): The number of user ids covered by each query.
+
+    Returns:
+        int: The number of users whose count has been fixed.
+    """
+    followers = (
+        UserFollows.objects.filter(followed_user=OuterRef('pk'))
+        .order_by()
+        .values('followed_user')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    follower_count = Coalesce(Subquery(followers), Value(0))
+    last_id = User.objects.order_by('-id').values_list('id', flat=True)
+    last_id = last_id.first() or 0
+    fixed = 0
+    for start in range(0, last_id + 1, batch_size):
+        users = User.objects.filter(pk__gte=start, pk__lt=start + batch_size)
+        fixed += users.exclude(follower_count=follower_count).update(
+            follower_count=follower_count
+        )
+    return fixed
+
+
+def rebuild_derived(batch_size=BATCH_SIZE):
+    """
+    Recomputes the data derived from the imported rows.
+
+    The follower and review counters, the book and search indexes and, if
+    enabled, the timelines are rebuilt from the tables, one step at a time.
+
+    Args:
+        batch_size (int): The number of ids covered by each counter query.
+
+    Yields:
+        str: The report of each completed step.
+    """
+    fixed = reconcile_followers(batch_size)
+    yield f"{fixed} follower count(s) fixed."
+    fixed = counters.reconcile()
+    yield f"{fixed} ticket counter(s) fixed."
+    indexed = books.rebuild()
+    yield f"{indexed} ticket(s) indexed by book."
+    if search.is_available():
+        with transaction.atomic():
+            search.rebuild()
+        yield "Search index rebuilt."
+    if timeline.is_enabled():
+        timeline.update_modes()
+        user_ids = User.objects.values_list('id', flat=True)
+        for user_id in user_ids.iterator():
+            timeline.rebuild(user_id)
+        yield "Timelines rebuilt."
@@ -1,11 +1,12 @@
 from django.urls import path
 from django.contrib.auth.decorators import login_required
 
-from reviews import views
+from reviews import api, events, views
 
 urlpatterns = [
     path('', login_required(views.FluxView.as_view()), name='home'),
     path('posts/', login_required(views.PostView.as_view()), name='posts'),
+    path('search/', login_required(views.SearchView.as_view()), name='search'),
     path(
         'create-ticket/',
         login_required(views.CreateTicket.as_view()),
@@ -41,4 +42,14 @@ urlpatterns = [
         login_required(views.DeleteReview.as_view()),
         name='delete_review',
     ),
+    path(
+        'api/flux/',
+        login_required(api.FluxFeedView.as_view()),
+        name='api_flux',
+    ),
+    path(
+        'events/flux/',
+        events.FluxEventsView.as_view(),
+        name='flux_events',
+    ),
 ]
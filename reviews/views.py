@@ -1,13 +1,70 @@
-from django.db.models import Value, CharField, Q
+from functools import partial
+
+from django.contrib import messages
+from django.db.models import Q
 from django.conf import settings
-from itertools import chain
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.views.generic import View
 from django.shortcuts import render, redirect
-from itertools import chain
 
+from authentication import graph
+
+from . import books, events, flux, fragments, search
 from .models import Ticket, Review
 from .forms import TicketForm, ReviewForm
-from authentication.models import UserFollows
+
+
+def render_posts(request, template_name, get_page, users, user_ids, **context):
+    """
+    Renders a page of posts, unless the client already holds the same page.
+
+    The entity tag of the page is computed before the page is read, from
+    cheap aggregates of the posts of its authors and from the cache tokens
+    of the authors (see ``fragments.page_etag``). If it matches the
+    If-None-Match header of the request, the response is a 304 Not
+    Modified without body, and the posts are neither read nor rendered.
+    A page displaying pending messages is always rendered.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        template_name (str): The path to the template rendering the posts.
+        get_page (callable): Returns the posts of the page and the cursor
+            of the next page, given the cursor of the previous page.
+        users (Q): The filter selecting the authors of the posts.
+        user_ids (list): The ids of the authors of the posts.
+        **context: Additional variables of the template context.
+
+    Returns:
+        HttpResponse: The rendered page, or a 304 Not Modified response.
+
+    Raises:
+        InvalidCursor: If the cursor is malformed.
+    """
+    cursor = request.GET.get('after')
+    flux.decode_cursor(cursor)
+    etag = None
+    if not len(messages.get_messages(request)):
+        etag = fragments.page_etag(
+            request.user,
+            user_ids,
+            flux.get_statistics(users),
+            cursor,
+            context,
+        )
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        posts, next_cursor = get_page(cursor=cursor)
+        fragments.annotate_versions(posts)
+        context.update(
+            posts=posts,
+            next_cursor=next_cursor,
+            fragment_timeout=settings.FRAGMENT_CACHE_TIMEOUT,
+        )
+        response = render(request, template_name, context=context)
+    if etag is not None:
+        response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 class FluxView(View):
@@ -15,48 +72,47 @@ class FluxView(View):
     View class for handling the flux page.
 
     This class retrieves and displays a list of posts (tickets and reviews) based on the user's subscriptions.
-    The posts are sorted by the time of creation, with the most recent ones appearing first.
+    The posts are sorted by the time of creation, with the most recent ones appearing first,
+    and are paginated with a cursor pointing after the last post of the previous page.
 
     Attributes:
         template_name (str): The path to the template used for rendering the flux page.
+        paginate_by (int): The number of posts displayed per page.
     """
 
     template_name = "reviews/home.html"
+    paginate_by = 20
 
     def get(self, request):
         """
         Handles GET requests to the flux view.
 
-        Retrieves the user's subscribers, tickets, and reviews.
-        Combines the tickets and reviews into a single list and sorts them by time of creation.
-        Renders the flux template with the list of posts.
+        Merges the tickets and reviews written by the user and their subscriptions after the cursor
+        into a single page sorted by time of creation.
+        Renders the flux template with the page of posts, whose snippets are cached by version.
+        The first page is notified of the new posts by server-sent events under ASGI,
+        by polling the flux API otherwise.
 
         Args:
             request (HttpRequest): The HTTP request object.
 
         Returns:
-            HttpResponse: The response containing the rendered flux template with the list of posts.
-        """
-        subscribers = [
-            user.followed_user
-            for user in UserFollows.objects.filter(user=request.user)
-        ]
-
-        tickets = Ticket.objects.filter(
-            Q(user=request.user) | Q(user__in=subscribers)
+            HttpResponse: The response containing the rendered flux template with the list of posts,
+                          or a 304 Not Modified response if the page has not changed.
+
+        Raises:
+            InvalidCursor: If the cursor is malformed, answered with a 400 Bad Request.
+        """
+        user = request.user
+        return render_posts(
+            request,
+            self.template_name,
+            partial(flux.get_flux_page, user, limit=self.paginate_by),
+            flux.visible_to(user),
+            [user.pk, *graph.followees(user.pk)],
+            live_events=events.is_asgi(request),
+            poll_interval=settings.FLUX_POLL_INTERVAL,
         )
-        tickets = tickets.annotate(content_type=Value('TICKET', CharField()))
-
-        reviews = Review.objects.filter(
-            Q(user=request.user) | Q(user__in=subscribers)
-        )
-        reviews = reviews.annotate(content_type=Value('REVIEW', CharField()))
-
-        posts = chain(tickets, reviews)
-        posts = sorted(posts, key=lambda post: post.time_created, reverse=True)
-
-        context = {'posts': posts}
-        return render(request, self.template_name, context=context)
 
 
 class PostView(View):
@@ -64,40 +120,72 @@ class PostView(View):
     View class for handling the user's posts.
 
     This class retrieves and displays a list of posts (tickets and reviews) created by the user.
-    The posts are sorted by the time of creation, with the most recent ones appearing first.
+    The posts are sorted by the time of creation, with the most recent ones appearing first,
+    and are paginated with a cursor pointing after the last post of the previous page.
 
     Attributes:
         template_name (str): The path to the template used for rendering the posts page.
+        paginate_by (int): The number of posts displayed per page.
     """
 
     template_name = "reviews/posts_ticket.html"
+    paginate_by = 20
 
     def get(self, request):
         """
         Handles GET requests to the post view.
 
-        Retrieves the user's tickets and reviews.
-        Combines the tickets and reviews into a single list and sorts them by time of creation.
-        Renders the posts template with the list of posts.
+        Merges the user's tickets and reviews written after the cursor into a single page sorted by time of creation.
+        Renders the posts template with the page of posts, whose snippets are cached by version.
 
         Args:
             request (HttpRequest): The HTTP request object.
 
         Returns:
-            HttpResponse: The response containing the rendered posts template with the list of posts.
+            HttpResponse: The response containing the rendered posts template with the list of posts,
+                          or a 304 Not Modified response if the page has not changed.
+
+        Raises:
+            InvalidCursor: If the cursor is malformed, answered with a 400 Bad Request.
+        """
+        users = Q(user=request.user)
+        return render_posts(
+            request,
+            self.template_name,
+            partial(flux.get_page, users, limit=self.paginate_by),
+            users,
+            [request.user.pk],
+        )
+
+
+class SearchView(View):
+    """
+    View class for searching the posts.
+
+    This class displays the tickets and reviews visible to the user (their own posts and those of
+    their subscriptions) which contain all the searched terms, best match first.
+
+    Attributes:
+        template_name (str): The path to the template used for rendering the search results.
+        paginate_by (int): The maximum number of results displayed.
+    """
+
+    template_name = "reviews/search.html"
+    paginate_by = 20
+
+    def get(self, request):
         """
-        tickets = Ticket.objects.filter(user=request.user)
-        tickets = tickets.annotate(content_type=Value('TICKET', CharField()))
+        Handles GET requests to the search view.
 
-        reviews = Review.objects.filter(user=request.user)
-        reviews = reviews.annotate(content_type=Value('REVIEW', CharField()))
+        Args:
+            request (HttpRequest): The HTTP request object.
 
-        posts = sorted(
-            chain(tickets, reviews),
-            key=lambda post: post.time_created,
-            reverse=True,
-        )
-        context = {'posts': posts}
+        Returns:
+            HttpResponse: The response containing the rendered search template with the results.
+        """
+        query = request.GET.get('q', '').strip()
+        posts = search.search(request.user, query, limit=self.paginate_by)
+        context = {'query': query, 'posts': posts}
         return render(request, self.template_name, context=context)
 
 
@@ -138,7 +226,9 @@ class CreateTicket(View):
         Handles POST requests to the ticket creation view.
 
         Validates the ticket creation form data.
-        If the form is valid, saves the ticket with the user as the creator.
+        If the form is valid and no existing ticket seems to be about the same book, saves the ticket
+        with the user as the creator. Otherwise, the similar tickets are suggested first, until the
+        user confirms that the book is a new one.
         If the form is invalid, renders the ticket creation template with the form and validation errors.
 
         Args:
@@ -147,15 +237,26 @@ class CreateTicket(View):
         Returns:
             HttpResponse:
                 - If the form is valid, redirects the user to the login redirect URL.
-                - If the form is invalid, returns the response containing the rendered ticket creation template with the form.
+                - If the form is invalid or similar tickets exist, returns the response containing
+                  the rendered ticket creation template with the form and the similar tickets.
         """
         form = self.form_class(request.POST, request.FILES)
+        similar_tickets = []
         if form.is_valid():
-            ticket = form.save(commit=False)
-            ticket.user_id = request.user.id
-            ticket.save()
-            return redirect(settings.LOGIN_REDIRECT_URL)
-        context = {'form': form, 'mode': 'CREATION'}
+            if not request.POST.get('new_book'):
+                similar_tickets = books.find_similar(
+                    form.cleaned_data['title']
+                )
+            if not similar_tickets:
+                ticket = form.save(commit=False)
+                ticket.user_id = request.user.id
+                ticket.save()
+                return redirect(settings.LOGIN_REDIRECT_URL)
+        context = {
+            'form': form,
+            'mode': 'CREATION',
+            'similar_tickets': similar_tickets,
+        }
         return render(request, self.template_name, context=context)
 
 
@@ -201,7 +302,7 @@ class UpdateTicket(View):
 
         Retrieves the ticket to be updated.
         Validates the ticket update form data.
-        If the form is valid, saves the updated ticket and performs additional actions.
+        If the form is valid, saves the updated ticket.
         If the form is invalid, renders the ticket update template with the form and validation errors.
 
         Args:
@@ -217,7 +318,6 @@ class UpdateTicket(View):
         form = self.form_class(request.POST, request.FILES, instance=ticket)
         if form.is_valid():
             form.save()
-            ticket.resize_image()
             return redirect(settings.LOGIN_REDIRECT_URL)
         context = {'form': form, 'mode': 'EDITING'}
         return render(request, self.template_name, context=context)
@@ -323,7 +423,9 @@ class CreateReview(View):
 
         Validates the ticket form and the review form data.
         If both forms are valid, creates a new ticket and a new review associated with it.
-        Updates the ticket's review status.
+        If existing tickets seem to be about the same book, they are suggested first: the user
+        either publishes the review on one of them or confirms that the book is a new one.
+        A review can only be published on a ticket suggested for the submitted title.
         Redirects the user to the login redirect URL.
 
         Args:
@@ -333,26 +435,43 @@ class CreateReview(View):
         Returns:
             HttpResponse:
                 - If both forms are valid, redirects the user to the login redirect URL.
-                - If either form is invalid, returns the response containing the rendered review creation template with the forms.
+                - If either form is invalid or similar tickets exist, returns the response containing
+                  the rendered review creation template with the forms and the similar tickets.
         """
         ticket_form = self.ticket_form(request.POST, request.FILES)
         review_form = self.review_form(request.POST, request.FILES)
+        similar_tickets = []
         if ticket_form.is_valid() and review_form.is_valid():
-            ticket = ticket_form.save(commit=False)
-            ticket.user = request.user
-            ticket.save()
-            review = review_form.save(commit=False)
-            review.ticket = ticket
-            review.user = request.user
-            review.save()
-            review.ticket.has_review = True
-            review.ticket.save()
-            return redirect(settings.LOGIN_REDIRECT_URL)
+            if not request.POST.get('new_book'):
+                similar_tickets = books.find_similar(
+                    ticket_form.cleaned_data['title']
+                )
+            # Only one of the tickets suggested for the title can be used.
+            use_ticket = request.POST.get('use_ticket', '')
+            ticket = next(
+                (
+                    similar
+                    for similar in similar_tickets
+                    if str(similar.pk) == use_ticket
+                ),
+                None,
+            )
+            if ticket is not None or not similar_tickets:
+                if ticket is None:
+                    ticket = ticket_form.save(commit=False)
+                    ticket.user = request.user
+                    ticket.save()
+                review = review_form.save(commit=False)
+                review.ticket = ticket
+                review.user = request.user
+                review.save()
+                return redirect(settings.LOGIN_REDIRECT_URL)
         context = {
             'ticket_form': ticket_form,
             'review_form': review_form,
             'existing_ticket': False,
             'mode': 'CREATION',
+            'similar_tickets': similar_tickets,
         }
         return render(request, self.template_name, context=context)
 
@@ -403,7 +522,6 @@ class CreateReviewExistingTicket(View):
 
         Validates the review form data.
         If the form is valid, creates a new review associated with the specified ticket.
-        Updates the review status of the ticket.
         Redirects the user to the login redirect URL.
 
         Args:
@@ -421,9 +539,7 @@ class CreateReviewExistingTicket(View):
             review = form.save(commit=False)
             review.ticket = ticket
             review.user = request.user
-            review.ticket.has_review = True
             review.save()
-            review.ticket.save()
             return redirect(settings.LOGIN_REDIRECT_URL)
         context = {
             'review_form': form,